@@ -1,12 +1,46 @@
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi_jwt_auth3.jwtauth import FastAPIJWTAuth
 from jwcrypto import jwk
+from pydantic import ValidationError
+from starlette.datastructures import Headers
+from starlette.types import Scope
 
+from melly.libaccount.domain.tokens import token_revocations
+from melly.libaccount.models import User, UserView
 from melly.libshared.models import TokenPayload
 from melly.libshared.settings import api_settings
 
+
+class RevocableJWTAuth(FastAPIJWTAuth):
+    """
+    Also rejects access tokens of logins that were logged out. Tokens of logins never revoked are let through by the
+    bloom filter in `token_revocations` without a database lookup.
+    """
+
+    def verify(self, creds: HTTPAuthorizationCredentials | None) -> TokenPayload:
+        try:
+            claims = super().__call__(creds)
+        except ValidationError:
+            # Signed by us but not an access token, refresh tokens carry no profile
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        if claims.typ == "refresh":
+            raise HTTPException(status_code=401, detail="Invalid token")
+        return claims
+
+    async def __call__(
+        self, creds: HTTPAuthorizationCredentials | None = Depends(HTTPBearer(auto_error=False))
+    ) -> TokenPayload:
+        claims = self.verify(creds)
+        if claims.fid is not None and await token_revocations.is_revoked(claims.fid):
+            raise HTTPException(status_code=401, detail="Invalid token")
+        return claims
+
+
 jwk_key = jwk.JWK.from_pem(api_settings.auth_public_key.encode("utf-8"))
 public_key_id = jwk_key.get("kid")
-jwt_auth = FastAPIJWTAuth(
+jwt_auth = RevocableJWTAuth(
     algorithm=api_settings.auth_algorithm,
     base_url=api_settings.base_url,
     audience=api_settings.base_url,
@@ -19,3 +53,40 @@ jwt_auth = FastAPIJWTAuth(
     leeway=0,
     project_to=TokenPayload,
 )
+
+
+async def current_user(claims: TokenPayload = Depends(jwt_auth)) -> User:
+    """
+    The user a valid access token was issued to, looked up by the token subject through the unique `identifier` index.
+    """
+    user = await User.find_by_identifier(identifier=claims.sub)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user
+
+
+async def current_user_view(claims: TokenPayload = Depends(jwt_auth)) -> UserView:
+    """
+    Read only `current_user` for views that don't modify the user, skips building a Beanie document.
+    """
+    user = await User.find_view({"identifier": claims.sub, "deleted_at": None})
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user
+
+
+def rate_limit_key(scope: Scope) -> str:
+    """
+    Rate limits authenticated requests per user and everything else per client IP. Tokens are verified so a forged
+    `sub` can't be used to spread requests over many buckets.
+    """
+    scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            claims = jwt_auth.verify(HTTPAuthorizationCredentials(scheme=scheme, credentials=token))
+            return f"sub:{claims.sub}"
+        except HTTPException:
+            pass
+
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
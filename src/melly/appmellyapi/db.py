@@ -2,13 +2,36 @@ import asyncio
 
 from motor.motor_asyncio import AsyncIOMotorClient
 
-from melly.libaccount.models import SocialAuthSession, User
+from melly.libaccount.models import RefreshTokenFamily, SocialAuthSession, User
 from melly.libarticle.models import Article
-from melly.libcollection.models import BookmarkItem, Collection
+from melly.libcollection.models import (
+    BookmarkItem,
+    BookmarkItemNote,
+    Collection,
+    CollectionComment,
+    CollectionItem,
+    LinkMetadataCache,
+    TrendingCounter,
+)
 from melly.libshared.settings import api_settings
+from melly.libsocial.models import UserFollow, UserTimeline
 
 client_options = {"appname": "appmellyapi"}
 api_mongo_client = AsyncIOMotorClient(api_settings.mongo_url, **client_options)
 api_mongo_client.get_io_loop = asyncio.get_running_loop
 
-api_models = [User, SocialAuthSession, Article, BookmarkItem, Collection]
+api_models = [
+    User,
+    SocialAuthSession,
+    RefreshTokenFamily,
+    Article,
+    BookmarkItem,
+    BookmarkItemNote,
+    Collection,
+    CollectionComment,
+    CollectionItem,
+    LinkMetadataCache,
+    TrendingCounter,
+    UserFollow,
+    UserTimeline,
+]
@@ -4,11 +4,13 @@ from typing import Annotated, List
 from fastapi import APIRouter, Depends, Query, Path
 from typing_extensions import Doc
 
-from melly.appmellyapi.auth import jwt_auth
-from melly.libaccount.domain.account import Account
+from melly.appmellyapi.auth import current_user, current_user_view
+from melly.libaccount.models import User, UserView
 from melly.libarticle.domain.article import Article
-from melly.libarticle.models import ArticleOut, ArticleIn
-from melly.libshared.models import TokenPayload
+from melly.libarticle.models import ArticleBatchItemOut, ArticleOut, ArticleIn, ArticleSummaryOut
+from melly.libshared.fields import parse_fields, sparse_response
+from melly.libshared.models import BatchGetIn
+from melly.libshared.responses import model_response
 
 article_router = APIRouter()
 
@@ -21,21 +23,25 @@ class Descriptions(str, Enum):
     Skip = "The number of articles to skip."
     Limit = "The number of articles to return."
     Slug = "The slug of the article."
+    Fields = (
+        "Comma separated fields of the article summary to return, or `summary` for all of them. Leave empty for full "
+        "articles."
+    )
 
 
 @article_router.get(
     "/articles",
     summary="Get my articles",
     tags=["Article"],
-    response_model=List[ArticleOut],
+    response_model=List[ArticleOut] | List[ArticleSummaryOut],
 )
 async def my_articles(
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        UserView,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user_view),
     skip: Annotated[
         int,
         Doc(Descriptions.Skip.value),
@@ -44,11 +50,18 @@ async def my_articles(
         int,
         Doc(Descriptions.Limit.value),
     ] = Query(10, description=Descriptions.Limit.value),
+    fields: Annotated[
+        str | None,
+        Doc(Descriptions.Fields.value),
+    ] = Query(None, description=Descriptions.Fields.value),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Article.get_my_articles(user=user, skip=skip, limit=limit)
+    field_names = parse_fields(fields=fields, model=ArticleSummaryOut)
+    if field_names is None:
+        articles = await Article.get_my_articles(user=user, skip=skip, limit=limit)
+        return model_response(articles)
+
+    articles = await Article.get_my_article_summaries(user=user, fields=field_names, skip=skip, limit=limit)
+    return sparse_response(articles)
 
 
 @article_router.get(
@@ -63,7 +76,26 @@ async def article_by_slug(
         Doc(Descriptions.Slug.value),
     ] = Path(..., description=Descriptions.Slug.value),
 ):
-    return await Article.get_article_by_slug(slug=slug)
+    article = await Article.view_article(slug=slug)
+    return model_response(article)
+
+
+@article_router.post(
+    "/articles:batchGet",
+    summary="Get articles by slugs",
+    tags=["Article"],
+    response_model=List[ArticleBatchItemOut],
+)
+async def batch_get_articles(
+    payload: Annotated[
+        BatchGetIn,
+        Doc("""
+            The slugs of the articles, results come back in the same order with `found` set to false for missing ones.
+        """),
+    ],
+):
+    items = await Article.batch_get(slugs=payload.slugs)
+    return model_response(items)
 
 
 @article_router.post(
@@ -80,17 +112,15 @@ async def create_article(
             The article payload.
         """),
     ],
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        User,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Article.create_article(payload=payload, user=user)
+    article = await Article.create_article(payload=payload, user=user)
+    return model_response(article, status_code=201)
 
 
 @article_router.put(
@@ -110,14 +140,33 @@ async def update_article_by_slug(
         str,
         Doc(Descriptions.Slug.value),
     ] = Path(..., description=Descriptions.Slug.value),
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        User,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Article.update_article(slug=slug, payload=payload, user=user)
+    article = await Article.update_article(slug=slug, payload=payload, user=user)
+    return model_response(article)
+
+
+@article_router.delete(
+    "/articles/{slug}",
+    summary="Delete article by slug",
+    tags=["Article"],
+    status_code=204,
+)
+async def delete_article_by_slug(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    await Article.delete_article(slug=slug, user=user)
@@ -1,14 +1,31 @@
+from datetime import datetime
 from enum import Enum
-from typing import Annotated, List
+from typing import Annotated, List, Literal
 
 from fastapi import APIRouter, Depends, Query, Path
+from pydantic import HttpUrl
 from typing_extensions import Doc
 
-from melly.appmellyapi.auth import jwt_auth
-from melly.libaccount.domain.account import Account
+from melly.appmellyapi.auth import current_user, current_user_view
+from melly.libaccount.models import User, UserView
 from melly.libcollection.domain.bookmark import Bookmark
-from melly.libcollection.models import BookmarkItemIn, BookmarkItemOut, BookmarkNoteIn
-from melly.libshared.models import TokenPayload
+from melly.libcollection.domain.trending import Trending
+from melly.libcollection.models import (
+    BookmarkBatchItemOut,
+    BookmarkItemIn,
+    BookmarkItemOut,
+    BookmarkItemSummaryOut,
+    BookmarkNoteIn,
+    BookmarkNoteOut,
+    BookmarkNotePageOut,
+    TrendingOut,
+    TrendingWindow,
+    UrlSaveCountOut,
+)
+from melly.libshared.constants import MAX_NOTES_PAGE_SIZE, MAX_TRENDING_PAGE_SIZE, Sort
+from melly.libshared.fields import parse_fields, sparse_response
+from melly.libshared.models import BatchGetIn
+from melly.libshared.responses import model_response
 
 bookmark_router = APIRouter()
 
@@ -21,6 +38,26 @@ class Descriptions(str, Enum):
     Skip = "The number of bookmarks to skip."
     Limit = "The number of bookmarks to return."
     Slug = "The slug of the bookmark."
+    OnDuplicate = (
+        "What to do when the page is already bookmarked, `error` responds with a 409 while `return` responds with the "
+        "existing bookmark and a 200."
+    )
+    Url = "The URL of the page."
+    Fields = (
+        "Comma separated fields of the bookmark summary to return, or `summary` for all of them. Leave empty for full "
+        "bookmarks."
+    )
+    Sort = "The sort order of the bookmarks."
+    SortBy = "The date to sort the bookmarks by."
+    Tag = "Only return bookmarks with this tag."
+    Domain = "Only return bookmarks of pages on this domain, `www.` is ignored."
+    After = "Only return bookmarks whose `sort_by` date is on or after this date."
+    Before = "Only return bookmarks whose `sort_by` date is before this date."
+    NoteSlug = "The slug of the note."
+    NoteCursor = "The `next_cursor` of the previous page of notes, leave empty for the first page."
+    NoteLimit = "The number of notes to return."
+    TrendingWindow = "How far back to count saves and tags."
+    TrendingLimit = "The number of pages and of tags to return."
 
 
 @bookmark_router.post(
@@ -32,24 +69,30 @@ class Descriptions(str, Enum):
 )
 async def create_bookmark(
     payload: BookmarkItemIn,
-    claims: Annotated[
-        TokenPayload,
+    on_duplicate: Annotated[
+        Literal["error", "return"],
+        Doc(Descriptions.OnDuplicate.value),
+    ] = Query("error", description=Descriptions.OnDuplicate.value),
+    user: Annotated[
+        User,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Bookmark.create_bookmark(payload=payload, user=user)
+    if on_duplicate == "error":
+        bookmark = await Bookmark.create_bookmark(payload=payload, user=user)
+        return model_response(bookmark, status_code=201)
+
+    bookmark, created = await Bookmark.save_bookmark(payload=payload, user=user)
+    return model_response(bookmark, status_code=201 if created else 200)
 
 
 @bookmark_router.get(
     "/bookmarks",
     summary="My bookmarks",
     tags=["Bookmark"],
-    response_model=List[BookmarkItemOut],
+    response_model=List[BookmarkItemOut] | List[BookmarkItemSummaryOut],
 )
 async def my_bookmarks(
     skip: Annotated[
@@ -60,17 +103,84 @@ async def my_bookmarks(
         int,
         Doc(Descriptions.Limit.value),
     ] = Query(10, description=Descriptions.Limit.value),
-    claims: Annotated[
-        TokenPayload,
+    fields: Annotated[
+        str | None,
+        Doc(Descriptions.Fields.value),
+    ] = Query(None, description=Descriptions.Fields.value),
+    sort: Annotated[
+        Sort,
+        Doc(Descriptions.Sort.value),
+    ] = Query(Sort.Descending, description=Descriptions.Sort.value),
+    sort_by: Annotated[
+        Literal["created_at", "updated_at"],
+        Doc(Descriptions.SortBy.value),
+    ] = Query("created_at", description=Descriptions.SortBy.value),
+    tag: Annotated[
+        str | None,
+        Doc(Descriptions.Tag.value),
+    ] = Query(None, description=Descriptions.Tag.value),
+    domain: Annotated[
+        str | None,
+        Doc(Descriptions.Domain.value),
+    ] = Query(None, description=Descriptions.Domain.value),
+    after: Annotated[
+        datetime | None,
+        Doc(Descriptions.After.value),
+    ] = Query(None, description=Descriptions.After.value),
+    before: Annotated[
+        datetime | None,
+        Doc(Descriptions.Before.value),
+    ] = Query(None, description=Descriptions.Before.value),
+    user: Annotated[
+        UserView,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user_view),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Bookmark.my_bookmarks(user=user, skip=skip, limit=limit)
+    field_names = parse_fields(fields=fields, model=BookmarkItemSummaryOut)
+    filters = dict(sort=sort, sort_by=sort_by, tag=tag, domain=domain, after=after, before=before)
+    if field_names is None:
+        bookmarks = await Bookmark.my_bookmarks(user=user, skip=skip, limit=limit, **filters)
+        return model_response(bookmarks)
+
+    bookmarks = await Bookmark.my_bookmark_summaries(user=user, fields=field_names, skip=skip, limit=limit, **filters)
+    return sparse_response(bookmarks)
+
+
+@bookmark_router.get(
+    "/bookmarks/count",
+    summary="Count how many users saved a URL",
+    tags=["Bookmark"],
+    response_model=UrlSaveCountOut,
+)
+async def count_saves(
+    url: Annotated[
+        HttpUrl,
+        Doc(Descriptions.Url.value),
+    ] = Query(..., description=Descriptions.Url.value),
+):
+    return await Bookmark.count_saves(url=str(url))
+
+
+@bookmark_router.get(
+    "/bookmarks/trending",
+    summary="Get the most saved pages and most used tags",
+    tags=["Bookmark"],
+    response_model=TrendingOut,
+)
+async def trending(
+    window: Annotated[
+        TrendingWindow,
+        Doc(Descriptions.TrendingWindow.value),
+    ] = Query("24h", description=Descriptions.TrendingWindow.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.TrendingLimit.value),
+    ] = Query(10, ge=1, le=MAX_TRENDING_PAGE_SIZE, description=Descriptions.TrendingLimit.value),
+):
+    result = await Trending.get_trending(window=window, limit=limit)
+    return model_response(result)
 
 
 @bookmark_router.get(
@@ -85,7 +195,26 @@ async def bookmark_by_slug(
         Doc(Descriptions.Slug.value),
     ] = Path(..., description=Descriptions.Slug.value),
 ):
-    return await Bookmark.get_bookmark_by_slug(slug=slug)
+    bookmark = await Bookmark.get_bookmark_by_slug(slug=slug)
+    return model_response(bookmark)
+
+
+@bookmark_router.post(
+    "/bookmarks:batchGet",
+    summary="Get bookmarks by slugs",
+    tags=["Bookmark"],
+    response_model=List[BookmarkBatchItemOut],
+)
+async def batch_get_bookmarks(
+    payload: Annotated[
+        BatchGetIn,
+        Doc("""
+            The slugs of the bookmarks, results come back in the same order with `found` set to false for missing ones.
+        """),
+    ],
+):
+    items = await Bookmark.batch_get(slugs=payload.slugs)
+    return model_response(items)
 
 
 @bookmark_router.put(
@@ -105,17 +234,15 @@ async def update_bookmark_by_slug(
         str,
         Doc(Descriptions.Slug.value),
     ] = Path(..., description=Descriptions.Slug.value),
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        User,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Bookmark.update_bookmark(slug=slug, payload=payload, user=user)
+    bookmark = await Bookmark.update_bookmark(slug=slug, payload=payload, user=user)
+    return model_response(bookmark)
 
 
 @bookmark_router.post(
@@ -136,14 +263,114 @@ async def add_note(
         str,
         Doc(Descriptions.Slug.value),
     ] = Path(..., description=Descriptions.Slug.value),
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        User,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Bookmark.create_note(payload=payload, slug=slug, user=user)
+    bookmark = await Bookmark.create_note(payload=payload, slug=slug, user=user)
+    return model_response(bookmark, status_code=201)
+
+
+@bookmark_router.get(
+    "/bookmarks/{slug}/notes",
+    summary="Notes of a bookmark",
+    tags=["Bookmark"],
+    response_model=BookmarkNotePageOut,
+)
+async def bookmark_notes(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    cursor: Annotated[
+        str | None,
+        Doc(Descriptions.NoteCursor.value),
+    ] = Query(None, description=Descriptions.NoteCursor.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.NoteLimit.value),
+    ] = Query(10, ge=1, le=MAX_NOTES_PAGE_SIZE, description=Descriptions.NoteLimit.value),
+):
+    notes = await Bookmark.get_notes(slug=slug, cursor=cursor, limit=limit)
+    return model_response(notes)
+
+
+@bookmark_router.put(
+    "/bookmarks/{slug}/notes/{note_slug}",
+    summary="Update note of bookmark",
+    tags=["Bookmark"],
+    response_model=BookmarkNoteOut,
+)
+async def update_note(
+    payload: Annotated[
+        BookmarkNoteIn,
+        Doc("""
+            The bookmark note payload.
+        """),
+    ],
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    note_slug: Annotated[
+        str,
+        Doc(Descriptions.NoteSlug.value),
+    ] = Path(..., description=Descriptions.NoteSlug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    note = await Bookmark.update_note(slug=slug, note_slug=note_slug, payload=payload, user=user)
+    return model_response(note)
+
+
+@bookmark_router.delete(
+    "/bookmarks/{slug}/notes/{note_slug}",
+    summary="Delete note of bookmark",
+    tags=["Bookmark"],
+    status_code=204,
+)
+async def delete_note(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    note_slug: Annotated[
+        str,
+        Doc(Descriptions.NoteSlug.value),
+    ] = Path(..., description=Descriptions.NoteSlug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    await Bookmark.delete_note(slug=slug, note_slug=note_slug, user=user)
+
+
+@bookmark_router.delete(
+    "/bookmarks/{slug}",
+    summary="Delete bookmark by slug",
+    tags=["Bookmark"],
+    status_code=204,
+)
+async def delete_bookmark_by_slug(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    await Bookmark.delete_bookmark(slug=slug, user=user)
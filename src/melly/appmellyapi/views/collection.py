@@ -4,12 +4,23 @@ from typing import Annotated, List
 from fastapi import APIRouter, Depends, Query, Path
 from typing_extensions import Doc
 
-from melly.appmellyapi.auth import jwt_auth
-from melly.libaccount.domain.account import Account
+from melly.appmellyapi.auth import current_user, current_user_view
+from melly.libaccount.models import User, UserView
 from melly.libcollection.domain.bookmark import Bookmark
 from melly.libcollection.domain.collection import Collection
-from melly.libcollection.models import CollectionOut, CollectionIn, CollectionTitleIn, SlugIn
-from melly.libshared.models import TokenPayload
+from melly.libcollection.models import (
+    CollectionOut,
+    CollectionIn,
+    CollectionItemMoveIn,
+    CollectionItemPageOut,
+    CollectionItemsIn,
+    CollectionTitleIn,
+    CollectionSummaryOut,
+    SlugIn,
+)
+from melly.libshared.constants import MAX_COLLECTION_ITEMS_PAGE_SIZE
+from melly.libshared.fields import parse_fields, sparse_response
+from melly.libshared.responses import model_response
 
 collection_router = APIRouter()
 
@@ -22,6 +33,13 @@ class Descriptions(str, Enum):
     Skip = "The number of collections to skip."
     Limit = "The number of collections to return."
     Slug = "The slug of the collection."
+    Fields = (
+        "Comma separated fields of the collection summary to return, or `summary` for all of them. Leave empty for "
+        "full collections."
+    )
+    BookmarkSlug = "The slug of the bookmark in the collection."
+    ItemCursor = "The `next_cursor` of the previous page of items, leave empty for the first page."
+    ItemLimit = "The number of items to return."
 
 
 @collection_router.post(
@@ -33,24 +51,22 @@ class Descriptions(str, Enum):
 )
 async def create_collection(
     payload: CollectionIn,
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        User,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Collection.create_collection(payload=payload, user=user)
+    collection = await Collection.create_collection(payload=payload, user=user)
+    return model_response(collection, status_code=201)
 
 
 @collection_router.get(
     "/me/collections",
     summary="My collections",
     tags=["Collection"],
-    response_model=List[CollectionOut],
+    response_model=List[CollectionOut] | List[CollectionSummaryOut],
 )
 async def my_collections(
     skip: Annotated[
@@ -61,17 +77,24 @@ async def my_collections(
         int,
         Doc(Descriptions.Limit.value),
     ] = Query(10, description=Descriptions.Limit.value),
-    claims: Annotated[
-        TokenPayload,
+    fields: Annotated[
+        str | None,
+        Doc(Descriptions.Fields.value),
+    ] = Query(None, description=Descriptions.Fields.value),
+    user: Annotated[
+        UserView,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user_view),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Collection.get_my_collections(user=user, skip=skip, limit=limit)
+    field_names = parse_fields(fields=fields, model=CollectionSummaryOut)
+    if field_names is None:
+        collections = await Collection.get_my_collections(user=user, skip=skip, limit=limit)
+        return model_response(collections)
+
+    collections = await Collection.get_my_collection_summaries(user=user, fields=field_names, skip=skip, limit=limit)
+    return sparse_response(collections)
 
 
 @collection_router.get(
@@ -85,17 +108,15 @@ async def get_collection_by_slug(
         str,
         Doc(Descriptions.Slug.value),
     ] = Path(..., description=Descriptions.Slug.value),
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        UserView,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user_view),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Collection.get_collection_by_slug(slug=slug, user=user)
+    collection = await Collection.get_collection_by_slug(slug=slug, user=user)
+    return model_response(collection)
 
 
 @collection_router.put(
@@ -110,17 +131,15 @@ async def update_collection_by_slug(
         str,
         Doc(Descriptions.Slug.value),
     ] = Path(..., description=Descriptions.Slug.value),
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        User,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user),
 ):
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Collection.update_collection(slug=slug, payload=payload, user=user)
+    collection = await Collection.update_collection(slug=slug, payload=payload, user=user)
+    return model_response(collection)
 
 
 @collection_router.post(
@@ -136,16 +155,239 @@ async def add_bookmark_to_collection(
         str,
         Doc(Descriptions.Slug.value),
     ] = Path(..., description=Descriptions.Slug.value),
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        User,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user),
 ):
     await Bookmark.get_bookmark_by_slug(slug=payload.slug)
 
-    user = await Account.get_user_by_email(
-        email=claims.email, raise_for_error=True, status_code=401, error_message="Invalid token"
-    )
-    return await Collection.add_bookmark_to_collection(slug=slug, bookmark_slug=payload.slug, user=user)
+    collection = await Collection.add_bookmark_to_collection(slug=slug, bookmark_slug=payload.slug, user=user)
+    return model_response(collection, status_code=201)
+
+
+@collection_router.get(
+    "/me/collections/{slug}/items",
+    summary="Items of my collection",
+    tags=["Collection"],
+    response_model=CollectionItemPageOut,
+)
+async def my_collection_items(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    cursor: Annotated[
+        str | None,
+        Doc(Descriptions.ItemCursor.value),
+    ] = Query(None, description=Descriptions.ItemCursor.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.ItemLimit.value),
+    ] = Query(50, ge=1, le=MAX_COLLECTION_ITEMS_PAGE_SIZE, description=Descriptions.ItemLimit.value),
+    user: Annotated[
+        UserView,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user_view),
+):
+    items = await Collection.get_items(slug=slug, cursor=cursor, limit=limit, user=user)
+    return model_response(items)
+
+
+@collection_router.put(
+    "/me/collections/{slug}/items",
+    summary="Reorder the items of a collection",
+    tags=["Collection"],
+    response_model=CollectionOut,
+)
+async def reorder_collection_items(
+    payload: Annotated[
+        CollectionItemsIn,
+        Doc("""
+            Every bookmark slug of the collection in the new order.
+        """),
+    ],
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    collection = await Collection.reorder_items(slug=slug, items=payload.items, user=user)
+    return model_response(collection)
+
+
+@collection_router.put(
+    "/me/collections/{slug}/items/{bookmark_slug}/position",
+    summary="Move an item of a collection",
+    tags=["Collection"],
+    response_model=CollectionOut,
+)
+async def move_collection_item(
+    payload: Annotated[
+        CollectionItemMoveIn,
+        Doc("""
+            The bookmark the item goes right after, leave empty to move it to the top.
+        """),
+    ],
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    bookmark_slug: Annotated[
+        str,
+        Doc(Descriptions.BookmarkSlug.value),
+    ] = Path(..., description=Descriptions.BookmarkSlug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    collection = await Collection.move_item(slug=slug, bookmark_slug=bookmark_slug, after=payload.after, user=user)
+    return model_response(collection)
+
+
+@collection_router.delete(
+    "/me/collections/{slug}/items/{bookmark_slug}",
+    summary="Remove bookmark from collection",
+    tags=["Collection"],
+    response_model=CollectionOut,
+)
+async def remove_bookmark_from_collection(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    bookmark_slug: Annotated[
+        str,
+        Doc(Descriptions.BookmarkSlug.value),
+    ] = Path(..., description=Descriptions.BookmarkSlug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    collection = await Collection.remove_bookmark_from_collection(slug=slug, bookmark_slug=bookmark_slug, user=user)
+    return model_response(collection)
+
+
+@collection_router.delete(
+    "/me/collections/{slug}",
+    summary="Delete collection by slug",
+    tags=["Collection"],
+    status_code=204,
+)
+async def delete_collection_by_slug(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    await Collection.delete_collection(slug=slug, user=user)
+
+
+@collection_router.post(
+    "/me/collections/{slug}/publish",
+    summary="Publish collection",
+    tags=["Collection"],
+    response_model=CollectionOut,
+)
+async def publish_collection(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    collection = await Collection.publish_collection(slug=slug, user=user)
+    return model_response(collection)
+
+
+@collection_router.delete(
+    "/me/collections/{slug}/publish",
+    summary="Unpublish collection",
+    tags=["Collection"],
+    response_model=CollectionOut,
+)
+async def unpublish_collection(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    collection = await Collection.unpublish_collection(slug=slug, user=user)
+    return model_response(collection)
+
+
+@collection_router.get(
+    "/collections/published",
+    summary="Recently published collections",
+    tags=["Collection"],
+    response_model=List[CollectionOut],
+)
+async def recently_published_collections(
+    skip: Annotated[
+        int,
+        Doc(Descriptions.Skip.value),
+    ] = Query(0, description=Descriptions.Skip.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.Limit.value),
+    ] = Query(10, description=Descriptions.Limit.value),
+):
+    collections = await Collection.get_recently_published(skip=skip, limit=limit)
+    return model_response(collections)
+
+
+@collection_router.get(
+    "/collections/{slug}/items",
+    summary="Items of a published collection",
+    tags=["Collection"],
+    response_model=CollectionItemPageOut,
+)
+async def published_collection_items(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    cursor: Annotated[
+        str | None,
+        Doc(Descriptions.ItemCursor.value),
+    ] = Query(None, description=Descriptions.ItemCursor.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.ItemLimit.value),
+    ] = Query(50, ge=1, le=MAX_COLLECTION_ITEMS_PAGE_SIZE, description=Descriptions.ItemLimit.value),
+):
+    items = await Collection.get_items(slug=slug, cursor=cursor, limit=limit)
+    return model_response(items)
@@ -0,0 +1,151 @@
+from enum import Enum
+from typing import Annotated, List
+
+from fastapi import APIRouter, Depends, Query, Path
+from typing_extensions import Doc
+
+from melly.appmellyapi.auth import current_user
+from melly.libaccount.models import User
+from melly.libcollection.domain.comment import Comment
+from melly.libcollection.models import (
+    CollectionCommentIn,
+    CollectionCommentOut,
+    CollectionCommentPageOut,
+    CollectionCommentThreadOut,
+    CollectionCommentContentIn,
+)
+
+comment_router = APIRouter()
+
+
+class Descriptions(str, Enum):
+    """
+    Parameter descriptions for the comment_router endpoints.
+    """
+
+    Cursor = "The cursor returned by the previous page, omit for the first page."
+    Limit = "The number of top level comments to return."
+    Slug = "The slug of the collection."
+    CommentSlug = "The slug of the comment."
+
+
+@comment_router.post(
+    "/collections/{slug}/comments",
+    summary="Comment on a collection",
+    tags=["Comment"],
+    response_model=CollectionCommentOut,
+    status_code=201,
+)
+async def create_comment(
+    payload: Annotated[
+        CollectionCommentIn,
+        Doc("""
+            The comment payload.
+        """),
+    ],
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    return await Comment.create_comment(collection_slug=slug, payload=payload, user=user)
+
+
+@comment_router.get(
+    "/collections/{slug}/comments",
+    summary="Top level comments of a collection",
+    tags=["Comment"],
+    response_model=CollectionCommentPageOut,
+)
+async def collection_comments(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    cursor: Annotated[
+        str | None,
+        Doc(Descriptions.Cursor.value),
+    ] = Query(None, description=Descriptions.Cursor.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.Limit.value),
+    ] = Query(10, description=Descriptions.Limit.value),
+):
+    return await Comment.get_comments(collection_slug=slug, cursor=cursor, limit=limit)
+
+
+@comment_router.get(
+    "/collections/{slug}/comments/thread",
+    summary="Full comment thread of a collection",
+    tags=["Comment"],
+    response_model=List[CollectionCommentThreadOut],
+)
+async def collection_comment_thread(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+):
+    return await Comment.get_thread(collection_slug=slug)
+
+
+@comment_router.put(
+    "/collections/{slug}/comments/{comment_slug}",
+    summary="Update comment",
+    tags=["Comment"],
+    response_model=CollectionCommentOut,
+)
+async def update_comment(
+    payload: Annotated[
+        CollectionCommentContentIn,
+        Doc("""
+            The comment payload.
+        """),
+    ],
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    comment_slug: Annotated[
+        str,
+        Doc(Descriptions.CommentSlug.value),
+    ] = Path(..., description=Descriptions.CommentSlug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    return await Comment.update_comment(collection_slug=slug, slug=comment_slug, payload=payload, user=user)
+
+
+@comment_router.delete(
+    "/collections/{slug}/comments/{comment_slug}",
+    summary="Delete comment",
+    tags=["Comment"],
+    status_code=204,
+)
+async def delete_comment(
+    slug: Annotated[
+        str,
+        Doc(Descriptions.Slug.value),
+    ] = Path(..., description=Descriptions.Slug.value),
+    comment_slug: Annotated[
+        str,
+        Doc(Descriptions.CommentSlug.value),
+    ] = Path(..., description=Descriptions.CommentSlug.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    await Comment.delete_comment(collection_slug=slug, slug=comment_slug, user=user)
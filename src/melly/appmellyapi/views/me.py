@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Annotated
+from typing import Annotated, List
 
 from fastapi import APIRouter, Depends, Query
 from fastapi.responses import RedirectResponse
@@ -7,10 +7,14 @@ from typing_extensions import Doc
 
 from fastapi import Request
 
-from melly.appmellyapi.auth import jwt_auth
+from melly.appmellyapi.auth import current_user, current_user_view, jwt_auth
 from melly.libaccount.domain.account import Account
-from melly.libaccount.models import AccessTokenResponse, RefreshToken, MyProfile, UsernameIn
+from melly.libaccount.models import AccessTokenResponse, RefreshToken, MyProfile, User, UserView, UsernameIn
+from melly.libshared.constants import MAX_TIMELINE_PAGE_SIZE
 from melly.libshared.models import UrlResponse, TokenPayload
+from melly.libshared.responses import model_response
+from melly.libsocial.domain.home import HomeTimeline
+from melly.libsocial.models import TimelineItemOut
 
 me_router = APIRouter()
 
@@ -24,6 +28,8 @@ class Descriptions(str, Enum):
     OauthCallbackState = "The state from the OAuth session returned by the OAuth provider."
     OauthCallbackCode = "The authorization code from the OAuth provider."
     AccessTokenCode = "The authorization code from the API given to the FE to exchange for an access token."
+    TimelineSkip = "The number of timeline posts to skip."
+    TimelineLimit = "The number of timeline posts to return."
 
 
 @me_router.get(
@@ -63,9 +69,9 @@ async def google_auth_callback(
 ):
     session = await Account.get_auth_session(nonce=state)
     email, name, picture = await Account.authorize_google(code=code, session=session)
-    await Account.maybe_create_user(email=email, name=name, picture=picture, session=session)
+    user = await Account.maybe_create_user(email=email, name=name, picture=picture, session=session)
 
-    fe_redir_url = await Account.get_fe_redirect_url(session=session)
+    fe_redir_url = await Account.get_fe_redirect_url(session=session, user=user)
 
     return RedirectResponse(url=fe_redir_url, status_code=302)
 
@@ -95,6 +101,46 @@ async def exchange_refresh_token(payload: RefreshToken):
     return await Account.exchange_refresh_token(payload=payload)
 
 
+@me_router.post(
+    "/me/logout",
+    summary="Log out",
+    tags=["me", "auth"],
+    status_code=204,
+)
+async def logout(
+    user: Annotated[
+        UserView,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user_view),
+    claims: Annotated[
+        TokenPayload,
+        Doc("""
+            The projection model for the JWT token.
+        """),
+    ] = Depends(jwt_auth),
+):
+    await Account.logout(user=user, family_id=claims.fid)
+
+
+@me_router.post(
+    "/me/logout/everywhere",
+    summary="Log out of every device",
+    tags=["me", "auth"],
+    status_code=204,
+)
+async def logout_everywhere(
+    user: Annotated[
+        UserView,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user_view),
+):
+    await Account.logout_everywhere(user=user)
+
+
 @me_router.get(
     "/me",
     summary="Get my profile",
@@ -102,15 +148,14 @@ async def exchange_refresh_token(payload: RefreshToken):
     response_model=MyProfile,
 )
 async def my_profile(
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        UserView,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user_view),
 ):
-    user = await Account.get_user_by_email(email=claims.email)
-    return MyProfile(**user.model_dump())
+    return model_response(MyProfile(**user.to_dict()))
 
 
 @me_router.put(
@@ -121,12 +166,55 @@ async def my_profile(
 )
 async def update_username(
     payload: UsernameIn,
-    claims: Annotated[
-        TokenPayload,
+    user: Annotated[
+        User,
         Doc("""
-            The projection model for the JWT token.
+            The user the JWT token was issued to.
         """),
-    ] = Depends(jwt_auth),
+    ] = Depends(current_user),
+):
+    profile = await Account.update_username(payload=payload, user=user)
+    return model_response(profile)
+
+
+@me_router.delete(
+    "/me",
+    summary="Delete my account",
+    tags=["me"],
+    status_code=204,
+)
+async def delete_my_account(
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    await Account.delete_account(user=user)
+
+
+@me_router.get(
+    "/me/timeline",
+    summary="Get my home timeline",
+    tags=["me"],
+    response_model=List[TimelineItemOut],
+)
+async def my_timeline(
+    skip: Annotated[
+        int,
+        Doc(Descriptions.TimelineSkip.value),
+    ] = Query(0, ge=0, description=Descriptions.TimelineSkip.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.TimelineLimit.value),
+    ] = Query(20, ge=1, le=MAX_TIMELINE_PAGE_SIZE, description=Descriptions.TimelineLimit.value),
+    user: Annotated[
+        UserView,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user_view),
 ):
-    user = await Account.get_user_by_email(email=claims.email)
-    return await Account.update_username(payload=payload, user=user)
+    items = await HomeTimeline.get_timeline(user=user, skip=skip, limit=limit)
+    return model_response(items)
@@ -0,0 +1,49 @@
+from enum import Enum
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query
+from typing_extensions import Doc
+
+from melly.appmellyapi.auth import current_user_view
+from melly.libaccount.models import UserView
+from melly.libshared.constants import MAX_SYNC_PAGE_SIZE
+from melly.libsync.domain.sync import Sync
+from melly.libsync.models import SyncOut
+from melly.libshared.responses import model_response
+
+sync_router = APIRouter()
+
+
+class Descriptions(str, Enum):
+    """
+    Parameter descriptions for the sync_router endpoints.
+    """
+
+    Since = "The token returned by the previous sync, omit to sync everything."
+    Limit = "The number of changed documents to return."
+
+
+@sync_router.get(
+    "/sync",
+    summary="Changes since the last sync",
+    tags=["Sync"],
+    response_model=SyncOut,
+)
+async def sync(
+    since: Annotated[
+        str | None,
+        Doc(Descriptions.Since.value),
+    ] = Query(None, description=Descriptions.Since.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.Limit.value),
+    ] = Query(100, ge=1, le=MAX_SYNC_PAGE_SIZE, description=Descriptions.Limit.value),
+    user: Annotated[
+        UserView,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user_view),
+):
+    changes = await Sync.get_changes(user=user, since=since, limit=limit)
+    return model_response(changes)
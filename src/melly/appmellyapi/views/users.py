@@ -0,0 +1,157 @@
+from enum import Enum
+from typing import Annotated, List
+
+from fastapi import APIRouter, Depends, Query, Path
+from typing_extensions import Doc
+
+from melly.appmellyapi.auth import current_user
+from melly.libaccount.domain.account import Account
+from melly.libaccount.models import PublicProfile, User
+from melly.libcollection.domain.collection import Collection
+from melly.libcollection.models import CollectionOut
+from melly.libshared.responses import model_response
+from melly.libsocial.domain.follow import Follow
+from melly.libsocial.models import FollowOut
+
+user_router = APIRouter()
+
+
+class Descriptions(str, Enum):
+    """
+    Parameter descriptions for the user_router endpoints.
+    """
+
+    Skip = "The number of collections to skip."
+    Limit = "The number of collections to return."
+    Username = "The username of the user."
+    FollowSkip = "The number of users to skip."
+    FollowLimit = "The number of users to return."
+
+
+@user_router.get(
+    "/users/{username}",
+    summary="Get public profile",
+    tags=["User"],
+    response_model=PublicProfile,
+)
+async def public_profile(
+    username: Annotated[
+        str,
+        Doc(Descriptions.Username.value),
+    ] = Path(..., description=Descriptions.Username.value),
+):
+    return await Account.get_public_profile(username=username)
+
+
+@user_router.get(
+    "/users/{username}/collections",
+    summary="Get published collections of a user",
+    tags=["User"],
+    response_model=List[CollectionOut],
+)
+async def published_collections(
+    username: Annotated[
+        str,
+        Doc(Descriptions.Username.value),
+    ] = Path(..., description=Descriptions.Username.value),
+    skip: Annotated[
+        int,
+        Doc(Descriptions.Skip.value),
+    ] = Query(0, description=Descriptions.Skip.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.Limit.value),
+    ] = Query(10, description=Descriptions.Limit.value),
+):
+    collections = await Collection.get_published_collections(username=username, skip=skip, limit=limit)
+    return model_response(collections)
+
+
+@user_router.post(
+    "/users/{username}/follow",
+    summary="Follow a user",
+    tags=["User"],
+    status_code=204,
+)
+async def follow_user(
+    username: Annotated[
+        str,
+        Doc(Descriptions.Username.value),
+    ] = Path(..., description=Descriptions.Username.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    await Follow.follow(username=username, user=user)
+
+
+@user_router.delete(
+    "/users/{username}/follow",
+    summary="Unfollow a user",
+    tags=["User"],
+    status_code=204,
+)
+async def unfollow_user(
+    username: Annotated[
+        str,
+        Doc(Descriptions.Username.value),
+    ] = Path(..., description=Descriptions.Username.value),
+    user: Annotated[
+        User,
+        Doc("""
+            The user the JWT token was issued to.
+        """),
+    ] = Depends(current_user),
+):
+    await Follow.unfollow(username=username, user=user)
+
+
+@user_router.get(
+    "/users/{username}/followers",
+    summary="Get followers of a user",
+    tags=["User"],
+    response_model=List[FollowOut],
+)
+async def followers(
+    username: Annotated[
+        str,
+        Doc(Descriptions.Username.value),
+    ] = Path(..., description=Descriptions.Username.value),
+    skip: Annotated[
+        int,
+        Doc(Descriptions.FollowSkip.value),
+    ] = Query(0, description=Descriptions.FollowSkip.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.FollowLimit.value),
+    ] = Query(10, description=Descriptions.FollowLimit.value),
+):
+    follows = await Follow.get_followers(username=username, skip=skip, limit=limit)
+    return model_response(follows)
+
+
+@user_router.get(
+    "/users/{username}/following",
+    summary="Get users a user follows",
+    tags=["User"],
+    response_model=List[FollowOut],
+)
+async def following(
+    username: Annotated[
+        str,
+        Doc(Descriptions.Username.value),
+    ] = Path(..., description=Descriptions.Username.value),
+    skip: Annotated[
+        int,
+        Doc(Descriptions.FollowSkip.value),
+    ] = Query(0, description=Descriptions.FollowSkip.value),
+    limit: Annotated[
+        int,
+        Doc(Descriptions.FollowLimit.value),
+    ] = Query(10, description=Descriptions.FollowLimit.value),
+):
+    follows = await Follow.get_following(username=username, skip=skip, limit=limit)
+    return model_response(follows)
@@ -5,25 +5,92 @@ from beanie import init_beanie
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
-from melly.appmellyapi.auth import jwt_auth
+from melly.appmellyapi.auth import jwt_auth, rate_limit_key
 from melly.appmellyapi.db import api_mongo_client, api_models
 from melly.appmellyapi.views.articles import article_router
 from melly.appmellyapi.views.bookmark import bookmark_router
 from melly.appmellyapi.views.collection import collection_router
+from melly.appmellyapi.views.comment import comment_router
 from melly.appmellyapi.views.me import me_router
+from melly.appmellyapi.views.sync import sync_router
+from melly.appmellyapi.views.users import user_router
+from melly.libaccount.domain.tokens import RefreshTokens
+from melly.libaccount.models import RefreshTokenFamily, User
+from melly.libarticle.domain.article import article_views
+from melly.libarticle.models import Article
+from melly.libcollection.domain.collection import Collection, published_feed
+from melly.libcollection.domain.metadata import metadata_fetcher
+from melly.libcollection.models import BookmarkItem, Collection as CollectionModel
+from melly.libshared.compression import CompressionMiddleware, CompressionCache
+from melly.libshared.invalidation import ChangeStreamSubscriber, InvalidationBus
 from melly.libshared.logger import logger
+from melly.libshared.purger import Purger
+from melly.libshared.ratelimit import (
+    RateLimitMiddleware,
+    RateLimitRule,
+    InMemoryRateLimitBackend,
+    MongoRateLimitBackend,
+)
 from melly.libshared.settings import api_settings
 
 pyproject = toml.load("pyproject.toml")
 version = pyproject.get("project").get("version")
 
+rate_limit_backend = InMemoryRateLimitBackend()
+if api_settings.rate_limit_backend == "mongo":
+    rate_limit_backend = MongoRateLimitBackend(collection=api_mongo_client[api_settings.db_name]["rate-limits"])
+
+compression_cache = CompressionCache(max_bytes=api_settings.compression_cache_size_in_bytes)
+
+# Local caches that other workers' writes can make stale
+invalidation_bus = InvalidationBus()
+invalidation_bus.subscribe(collections=["collections", "users"], callback=Collection.on_change)
+invalidation_bus.subscribe(collections=["refresh-token-families"], callback=RefreshTokens.on_change)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Initializing Beanie...")
     await init_beanie(database=api_mongo_client[api_settings.db_name], document_models=api_models)
+    published_feed.invalidate()
+    await RefreshTokens.load_revocations()
+    await rate_limit_backend.init()
+
+    logger.info("Starting purger...")
+    purger = Purger(
+        models=[x for x in api_models if "deleted_at" in x.model_fields],
+        retention_in_seconds=api_settings.purge_retention_in_seconds,
+        interval_in_seconds=api_settings.purge_interval_in_seconds,
+        batch_size=api_settings.purge_batch_size,
+    )
+    purger.start()
+
+    change_stream = ChangeStreamSubscriber(
+        database=api_mongo_client[api_settings.db_name],
+        collections=[
+            x.get_collection_name() for x in [User, RefreshTokenFamily, Article, BookmarkItem, CollectionModel]
+        ],
+        bus=invalidation_bus,
+        name=api_settings.change_stream_name,
+        persist_interval_in_seconds=api_settings.change_stream_persist_interval_in_seconds,
+    )
+    if api_settings.change_stream_enabled:
+        logger.info("Watching change streams...")
+        change_stream.start()
+
+    if api_settings.link_metadata_enabled:
+        logger.info("Starting link metadata fetcher...")
+        metadata_fetcher.start()
+
+    article_views.start()
+
     yield
 
+    await article_views.stop()
+    await metadata_fetcher.stop()
+    await change_stream.stop()
+    await purger.stop()
+
 
 description = """
 ![Melly](https://cdn.sleek.email/images/86e8909f-0ea8-4c90-bcd3-d8277a993ba0-melly.jpg)
@@ -43,6 +110,21 @@ app = FastAPI(
     debug=api_settings.debug,
     lifespan=lifespan,
 )
+if api_settings.compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=api_settings.compression_minimum_size,
+        offload_size=api_settings.compression_offload_size,
+        cache=compression_cache,
+    )
+# Added before CORS so rejected requests still carry CORS headers
+if api_settings.rate_limit_enabled:
+    app.add_middleware(
+        RateLimitMiddleware,
+        rules=[RateLimitRule.parse(route=k, limit=v) for k, v in api_settings.rate_limits.items()],
+        backend=rate_limit_backend,
+        key_func=rate_limit_key,
+    )
 app.add_middleware(
     CORSMiddleware,
     allow_origins=api_settings.cors_origins,
@@ -57,3 +139,6 @@ app.include_router(router=me_router, prefix="/v1")
 app.include_router(router=article_router, prefix="/v1")
 app.include_router(router=bookmark_router, prefix="/v1")
 app.include_router(router=collection_router, prefix="/v1")
+app.include_router(router=user_router, prefix="/v1")
+app.include_router(router=comment_router, prefix="/v1")
+app.include_router(router=sync_router, prefix="/v1")
@@ -1,9 +1,11 @@
+from datetime import datetime, timedelta
 from secrets import token_hex
 from typing import Literal, Tuple
 
 import httpx
+import pytz
 import ujson
-from bson import ObjectId
+from beanie import UpdateResponse
 from fastapi import Request, HTTPException
 from fastapi_jwt_auth3.errors import JWTDecodeError
 from fastapi_jwt_auth3.jwtauth import generate_jwt_token, verify_token
@@ -12,8 +14,25 @@ from pydantic import IPvAnyAddress, ValidationError
 from slugify import slugify
 
 from melly.appmellyapi.auth import jwt_auth
-from melly.libaccount.models import SocialAuthSession, User, AccessTokenResponse, RefreshToken, UsernameIn, MyProfile
+from melly.libaccount.domain.tokens import RefreshTokens
+from melly.libaccount.models import (
+    SocialAuthSession,
+    User,
+    AccessTokenResponse,
+    RefreshToken,
+    RefreshTokenFamily,
+    UsernameIn,
+    MyProfile,
+    UserStats,
+    UserView,
+    PublicProfile,
+)
+from melly.libarticle.models import Article as ArticleModel
+from melly.libcollection.domain.collection import published_feed
+from melly.libcollection.models import BookmarkItem, BookmarkItemNote, Collection as CollectionModel, CollectionItem
 from melly.libshared.models import UrlResponse
+from melly.libsocial.domain.follow import Follow
+from melly.libsocial.models import UserFollow
 from melly.libshared.settings import api_settings
 
 
@@ -49,9 +68,18 @@ class Account:
 
         return UrlResponse(url=url)
 
+    @classmethod
+    def session_created_after(cls) -> datetime:
+        return datetime.now(tz=pytz.UTC) - timedelta(seconds=api_settings.social_auth_expiry_in_seconds)
+
     @classmethod
     async def get_auth_session(cls, nonce: str) -> SocialAuthSession:
-        query = {"nonce": nonce, "deleted_at": None}
+        query = {
+            "nonce": nonce,
+            "exchange_code": None,
+            "deleted_at": None,
+            "created_at": {"$gte": cls.session_created_after()},
+        }
         session = await SocialAuthSession.find_one(query)
         if not session:
             raise HTTPException(status_code=409, detail="Invalid session")
@@ -90,31 +118,18 @@ class Account:
             name = resp_body.get("name")
             picture = resp_body.get("picture")
 
+            # Stored by `get_fe_redirect_url` along with the exchange code
             session.auth_provider_access_token = access_token
             session.auth_provider_user_id = resp_body.get("id")
             session.profile = resp_body
-            await session.save()
 
             return email, name, picture
 
-    @classmethod
-    async def create_user(cls, email: str, name: str, picture: str, session: SocialAuthSession) -> User:
-        user = User(
-            email=email,
-            name=name,
-            picture=picture,
-            auth_provider=session.auth_provider,
-            auth_provider_user_id=[session.auth_provider_user_id],
-            username=slugify(f"{name}-{session.auth_provider_user_id}-{token_hex(5)}"),
-        )
-        await user.save()
-        return user
-
     @classmethod
     async def get_user_by_email(
         cls, email: str, raise_for_error: bool = False, status_code: int = 404, error_message: str = "User not found"
     ) -> User | None:
-        query = {"email": email}
+        query = {"email": email, "deleted_at": None}
         user = await User.find_one(query)
         if raise_for_error and not user:
             raise HTTPException(status_code=status_code, detail=error_message)
@@ -122,26 +137,44 @@ class Account:
 
     @classmethod
     async def maybe_create_user(cls, email: str, name: str, picture: str, session: SocialAuthSession) -> User:
-        query = {"email": email}
-        user = await User.find_one(query)
-        if user and user.is_deleted:
+        """
+        Finds or creates the user of `email` in one atomic upsert on the unique email index, remembering the provider
+        account they logged in with.
+        """
+        new_user = User(
+            email=email,
+            name=name,
+            picture=picture,
+            auth_provider=session.auth_provider,
+            username=slugify(f"{name}-{session.auth_provider_user_id}-{token_hex(5)}"),
+            stats=UserStats(),
+        )
+        on_insert = new_user.model_dump(exclude={"id", "revision_id", "email", "auth_provider_user_id"})
+        on_insert["picture"] = str(new_user.picture) if new_user.picture else None
+        update = {"$setOnInsert": on_insert, "$addToSet": {"auth_provider_user_id": session.auth_provider_user_id}}
+        user = await User.find_one({"email": email}).update(
+            update, upsert=True, response_type=UpdateResponse.NEW_DOCUMENT
+        )
+
+        if user.is_deleted:
             # Deleted user tried to come back, let's welcome them back
+            await cls.restore_account_content(user=user)
             await user.reactivate()
 
-        if not user:
-            user = await cls.create_user(email=email, name=name, picture=picture, session=session)
-
         return user
 
     @classmethod
-    async def get_fe_redirect_url(cls, session: SocialAuthSession) -> str:
-        exchange_code = await session.create_exchange_code()
+    async def get_fe_redirect_url(cls, session: SocialAuthSession, user: User) -> str:
+        exchange_code = await session.complete(user=user)
+        if exchange_code is None:
+            raise HTTPException(status_code=409, detail="Invalid session")
+
         extra = ujson.dumps(session.extra)
         redirect_url = f"{api_settings.fe_base_url}/me/auth/google/callback?code={exchange_code}&extra={extra}"
         return redirect_url
 
     @classmethod
-    def generate_access_token(cls, user: User) -> str:
+    def generate_access_token(cls, user: User, family_id: str | None = None) -> str:
         preset_claims = JWTPresetClaims.factory(
             issuer=jwt_auth.issuer,
             expiry=api_settings.auth_token_expiry,
@@ -149,34 +182,54 @@ class Account:
             subject=user.identifier,
         )
         claims = {"email": user.email, "name": user.name, "picture": str(user.picture)}
+        if family_id is not None:
+            claims["fid"] = family_id
+
+        return generate_jwt_token(
+            header=jwt_auth.header, preset_claims=preset_claims, secret_key=api_settings.auth_private_key, claims=claims
+        )
+
+    @classmethod
+    def generate_refresh_token(cls, user: User, family: RefreshTokenFamily) -> str:
+        preset_claims = JWTPresetClaims.factory(
+            issuer=jwt_auth.issuer,
+            expiry=api_settings.refresh_token_expiry,
+            audience=jwt_auth.audience,
+            subject=user.identifier,
+        )
+        claims = {"jti": family.current_jti, "fid": family.id, "typ": "refresh"}
 
         return generate_jwt_token(
             header=jwt_auth.header, preset_claims=preset_claims, secret_key=api_settings.auth_private_key, claims=claims
         )
 
     @classmethod
-    def generate_access_and_refresh_token(cls, user: User) -> Tuple[str, str]:
-        access_token = cls.generate_access_token(user=user)
-        refresh_token = jwt_auth.generate_refresh_token(access_token=access_token)
+    def generate_access_and_refresh_token(cls, user: User, family: RefreshTokenFamily) -> Tuple[str, str]:
+        access_token = cls.generate_access_token(user=user, family_id=family.id)
+        refresh_token = cls.generate_refresh_token(user=user, family=family)
 
         return access_token, refresh_token
 
     @classmethod
     async def exchange_code(cls, code: str) -> AccessTokenResponse:
-        query = {"exchange_code": code, "deleted_at": None}
-        session = await SocialAuthSession.find_one(query)
+        session = await SocialAuthSession.consume(exchange_code=code, created_after=cls.session_created_after())
         if not session:
             raise HTTPException(status_code=409, detail="Invalid session")
 
-        query = {"auth_provider_user_id": session.auth_provider_user_id, "deleted_at": None}
-        user = await User.find_one(query)
+        user = await User.find_one({"_id": session.user_id, "deleted_at": None})
+        if not user:
+            raise HTTPException(status_code=409, detail="Invalid session")
 
-        access_token, refresh_token = cls.generate_access_and_refresh_token(user=user)
+        family = await RefreshTokens.start_family(user_identifier=user.identifier)
+        access_token, refresh_token = cls.generate_access_and_refresh_token(user=user, family=family)
 
         return AccessTokenResponse(access_token=access_token, refresh_token=refresh_token)
 
     @classmethod
     async def exchange_refresh_token(cls, payload: RefreshToken) -> AccessTokenResponse:
+        """
+        Issues a new access token and rotates the refresh token, the one exchanged can't be used again.
+        """
         try:
             verified = verify_token(
                 token=payload.refresh_token,
@@ -189,19 +242,29 @@ class Account:
         except JWTDecodeError:
             raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-        try:
-            user_id = ObjectId(verified.get("sub"))
-        except TypeError:
-            raise HTTPException(status_code=401, detail="Invalid user")
+        # Refresh tokens issued before rotation carry no family, their users have to log in again
+        family_id, jti = verified.get("fid"), verified.get("jti")
+        if verified.get("typ") != "refresh" or not family_id or not jti:
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-        query = {"_id": user_id, "deleted_at": None}
-        user = await User.find_one(query)
+        user = await User.find_by_identifier(identifier=verified.get("sub"))
         if not user:
             raise HTTPException(status_code=401, detail="Invalid user")
 
-        access_token = cls.generate_access_token(user=user)
+        family = await RefreshTokens.rotate(family_id=family_id, jti=jti, user_identifier=user.identifier)
+        access_token, refresh_token = cls.generate_access_and_refresh_token(user=user, family=family)
+
+        return AccessTokenResponse(access_token=access_token, refresh_token=refresh_token)
+
+    @classmethod
+    async def logout(cls, user: User | UserView, family_id: str | None) -> None:
+        if family_id is None:
+            raise HTTPException(status_code=400, detail="Token isn't tied to a login, log out everywhere instead")
+        await RefreshTokens.revoke(family_id=family_id, user_identifier=user.identifier)
 
-        return AccessTokenResponse(access_token=access_token, refresh_token=payload.refresh_token)
+    @classmethod
+    async def logout_everywhere(cls, user: User | UserView) -> None:
+        await RefreshTokens.revoke_all(user_identifier=user.identifier)
 
     @classmethod
     async def update_username(cls, payload: UsernameIn, user: User) -> MyProfile:
@@ -210,6 +273,77 @@ class Account:
         if existing_user:
             raise HTTPException(status_code=409, detail="Username already exists")
 
-        user.username = payload.username
-        await user.save()
+        # Only the changed field, saving the whole user would overwrite stats incremented since it was loaded
+        await user.set({"username": payload.username})
         return MyProfile(**user.model_dump())
+
+    @classmethod
+    async def delete_account(cls, user: User) -> None:
+        now = datetime.now(tz=pytz.UTC)
+        await user.set({"deleted_at": now})
+
+        # Content shares the account's tombstone timestamp so it can be told apart from content deleted earlier
+        update = {"$set": {"deleted_at": now, "updated_at": now}}
+        await ArticleModel.find({"author_id": user.username, "deleted_at": None}).update(update)
+        await BookmarkItem.find({"owner_id": user.username, "deleted_at": None}).update(update)
+        await BookmarkItemNote.find({"owner_id": user.username, "deleted_at": None}).update(update)
+        await CollectionModel.find({"owner_id": user.username, "deleted_at": None}).update(update)
+        await CollectionItem.find({"owner_id": user.username, "deleted_at": None}).update(update)
+        await Follow.delete_account_follows(username=user.username, deleted_at=now)
+        published_feed.remove_owner(owner_id=user.username)
+
+    @classmethod
+    async def restore_account_content(cls, user: User) -> None:
+        if user.deleted_at is None:
+            return
+
+        update = {"$set": {"deleted_at": None, "updated_at": datetime.now(tz=pytz.UTC)}}
+        await ArticleModel.find({"author_id": user.username, "deleted_at": user.deleted_at}).update(update)
+        await BookmarkItem.find({"owner_id": user.username, "deleted_at": user.deleted_at}).update(update)
+        await BookmarkItemNote.find({"owner_id": user.username, "deleted_at": user.deleted_at}).update(update)
+        await CollectionModel.find({"owner_id": user.username, "deleted_at": user.deleted_at}).update(update)
+        await CollectionItem.find({"owner_id": user.username, "deleted_at": user.deleted_at}).update(update)
+        await Follow.restore_account_follows(username=user.username, deleted_at=user.deleted_at)
+
+    @classmethod
+    async def count_stats(cls, user: User | UserView) -> UserStats:
+        articles = await ArticleModel.find({"author_id": user.username, "deleted_at": None}).count()
+        bookmarks = await BookmarkItem.find({"owner_id": user.username, "deleted_at": None}).count()
+        published_collections = await CollectionModel.find(
+            {"owner_id": user.username, "published_at": {"$type": "date"}, "deleted_at": None}
+        ).count()
+
+        followers = await UserFollow.find({"followee_id": user.username, "deleted_at": None}).count()
+        following = await UserFollow.find({"follower_id": user.username, "deleted_at": None}).count()
+
+        return UserStats(
+            articles=articles,
+            bookmarks=bookmarks,
+            published_collections=published_collections,
+            followers=followers,
+            following=following,
+        )
+
+    @classmethod
+    async def get_public_profile(cls, username: str) -> PublicProfile:
+        query = {"username": username, "deleted_at": None}
+        user = await User.find_view(query)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        if user.stats is None:
+            # One off backfill, from here on the counters are kept up to date by increment_stats
+            user.stats = await cls.count_stats(user=user)
+            await User.find_one({"_id": user.id}).update({"$set": {"stats": user.stats.model_dump()}})
+
+        return PublicProfile(
+            name=user.name,
+            picture=user.picture,
+            username=user.username,
+            article_count=user.stats.articles,
+            bookmark_count=user.stats.bookmarks,
+            published_collection_count=user.stats.published_collections,
+            follower_count=user.stats.followers,
+            following_count=user.stats.following,
+            created_at=user.created_at,
+        )
@@ -0,0 +1,114 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+import pytz
+from beanie import UpdateResponse
+from fastapi import HTTPException
+
+from melly.libaccount.models import RefreshTokenFamily
+from melly.libshared.invalidation import InvalidationEvent
+from melly.libshared.logger import logger
+from melly.libshared.revocation import RevocationFilter
+from melly.libshared.settings import api_settings
+
+
+def generate_jti() -> str:
+    return uuid.uuid4().hex
+
+
+class RefreshTokens:
+    """
+    Rotating refresh tokens grouped in families, one per login. The store is the source of truth for refreshes while
+    access tokens, checked on every request, go through `token_revocations` and only hit the store for revoked or
+    possibly revoked families.
+    """
+
+    @classmethod
+    async def start_family(cls, user_identifier: str) -> RefreshTokenFamily:
+        expires_at = datetime.now(tz=pytz.UTC) + timedelta(seconds=api_settings.refresh_token_expiry)
+        family = RefreshTokenFamily(user_identifier=user_identifier, current_jti=generate_jti(), expires_at=expires_at)
+        await family.insert()
+        return family
+
+    @classmethod
+    async def rotate(cls, family_id: str, jti: str, user_identifier: str) -> RefreshTokenFamily:
+        """
+        Swaps `jti` for a new one in a single atomic update. Presenting a `jti` that was already rotated out revokes
+        the family, whoever holds the current token has to log in again too.
+        """
+        now = datetime.now(tz=pytz.UTC)
+        query = {"_id": family_id, "user_identifier": user_identifier, "current_jti": jti, "revoked_at": None}
+        update = {
+            "$set": {
+                "current_jti": generate_jti(),
+                "rotated_at": now,
+                "expires_at": now + timedelta(seconds=api_settings.refresh_token_expiry),
+            }
+        }
+        family = await RefreshTokenFamily.find_one(query).update(update, response_type=UpdateResponse.NEW_DOCUMENT)
+        if family is not None:
+            return family
+
+        query = {"_id": family_id, "user_identifier": user_identifier, "revoked_at": None}
+        reused = await RefreshTokenFamily.find_one(query).update(
+            {"$set": {"revoked_at": now, "revoked_reason": "reuse"}}, response_type=UpdateResponse.NEW_DOCUMENT
+        )
+        if reused is not None:
+            logger.warning(f"Refresh token reused, revoked family {family_id} of {user_identifier}")
+            token_revocations.revoke(family_id)
+
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    @classmethod
+    async def revoke(cls, family_id: str, user_identifier: str) -> None:
+        query = {"_id": family_id, "user_identifier": user_identifier, "revoked_at": None}
+        now = datetime.now(tz=pytz.UTC)
+        await RefreshTokenFamily.find_one(query).update({"$set": {"revoked_at": now, "revoked_reason": "logout"}})
+        token_revocations.revoke(family_id)
+
+    @classmethod
+    async def revoke_all(cls, user_identifier: str) -> List[str]:
+        query = {"user_identifier": user_identifier, "revoked_at": None}
+        families = await RefreshTokenFamily.aggregate([{"$match": query}, {"$project": {"_id": 1}}]).to_list(None)
+        family_ids = [x.get("_id") for x in families]
+        if not family_ids:
+            return []
+
+        now = datetime.now(tz=pytz.UTC)
+        await RefreshTokenFamily.find({"_id": {"$in": family_ids}, "revoked_at": None}).update(
+            {"$set": {"revoked_at": now, "revoked_reason": "logout_everywhere"}}
+        )
+        for family_id in family_ids:
+            token_revocations.revoke(family_id)
+        return family_ids
+
+    @classmethod
+    async def is_revoked(cls, family_id: str) -> bool:
+        # Expired families are gone, so are the access tokens issued with them
+        family = await RefreshTokenFamily.find_one({"_id": family_id})
+        return family is None or family.revoked_at is not None
+
+    @classmethod
+    async def load_revocations(cls) -> None:
+        """
+        Seeds `token_revocations` with the families revoked before this process started, expired ones are removed by
+        the TTL index.
+        """
+        pipeline = [{"$match": {"revoked_at": {"$type": "date"}}}, {"$project": {"_id": 1}}]
+        async for family in RefreshTokenFamily.aggregate(pipeline):
+            token_revocations.revoke(family.get("_id"))
+
+    @classmethod
+    def on_change(cls, event: InvalidationEvent) -> None:
+        # Revoked by another worker, inserts never carry a revocation
+        if event.operation != "insert" and event.document_id is not None and event.touches("revoked_at"):
+            token_revocations.suspect(event.document_id)
+
+
+token_revocations = RevocationFilter(
+    lookup=RefreshTokens.is_revoked,
+    size_in_bits=api_settings.token_revocation_filter_bits,
+    hashes=api_settings.token_revocation_filter_hashes,
+    cache_size=api_settings.token_revocation_cache_size,
+)
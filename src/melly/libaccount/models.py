@@ -1,15 +1,25 @@
 import uuid
 from datetime import datetime
 from secrets import token_hex
-from typing import Literal, List
+from typing import Dict, Literal, List
 
 import pytz
-from beanie import Document
-from pydantic import EmailStr, HttpUrl, Field, IPvAnyAddress
+from beanie import Document, PydanticObjectId, UpdateResponse
+from pydantic import BaseModel, EmailStr, HttpUrl, Field, IPvAnyAddress
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
+from melly.libshared.constants import DELETED_FILTER
 from melly.libshared.models import BaseDateTimeMeta, BaseMellyAPIModel
 
 
+class UserStats(BaseModel):
+    articles: int = 0
+    bookmarks: int = 0
+    published_collections: int = 0
+    followers: int = 0
+    following: int = 0
+
+
 class User(Document, BaseDateTimeMeta):
     email: EmailStr
     name: str
@@ -21,16 +31,116 @@ class User(Document, BaseDateTimeMeta):
 
     identifier: str = Field(default_factory=lambda: str(uuid.uuid4()))
 
+    # Maintained incrementally on create/delete, `None` for accounts created before stats existed
+    stats: UserStats | None = None
+
     class Settings:
         name = "users"
+        indexes = [
+            IndexModel([("email", ASCENDING)], unique=True),
+            IndexModel([("username", ASCENDING)]),
+            IndexModel([("identifier", ASCENDING)], unique=True),
+            # Accounts too big to fan out to, see libsocial.domain.timeline
+            IndexModel([("stats.followers", DESCENDING)], partialFilterExpression={"stats.followers": {"$gt": 0}}),
+            IndexModel([("deleted_at", ASCENDING)], partialFilterExpression=DELETED_FILTER),
+        ]
 
     @property
     def is_deleted(self) -> bool:
         return self.deleted_at is not None
 
     async def reactivate(self) -> None:
-        self.deleted_at = None
-        await self.save()
+        # Only `deleted_at`, saving the whole user would overwrite the stats restored with its content
+        await self.set({"deleted_at": None})
+
+    @classmethod
+    async def find_by_identifier(cls, identifier: str) -> "User | None":
+        """
+        Active user of `identifier`, the `sub` of every token issued to them.
+        """
+        return await cls.find_one({"identifier": identifier, "deleted_at": None})
+
+    @classmethod
+    async def find_view(cls, query: dict) -> "UserView | None":
+        """
+        Read only `UserView` of the first user matching `query`, fetched with a projection and built without
+        validation.
+        """
+        raw = await cls.get_motor_collection().find_one(query, projection=UserView.projection)
+        return UserView.from_document(raw) if raw else None
+
+    @classmethod
+    async def increment_stats(cls, username: str, **amounts: int) -> None:
+        inc = {f"stats.{key}": value for key, value in amounts.items()}
+        # Accounts without stats yet are skipped, they get a full recount when their profile is first viewed
+        await cls.find({"username": username, "stats": {"$type": "object"}}).update({"$inc": inc})
+
+    @classmethod
+    async def find_profiles(cls, usernames: List[str]) -> Dict[str, dict]:
+        """
+        Name and picture of several users in one `$in` query, keyed by username.
+        """
+        pipeline = [
+            {"$match": {"username": {"$in": list(set(usernames))}}},
+            {"$project": {"_id": 0, "username": 1, "name": 1, "picture": 1}},
+        ]
+        users = await cls.aggregate(pipeline).to_list(length=None)
+        return {x.get("username"): x for x in users}
+
+
+class UserView:
+    """
+    Read model of a `User` for requests that only read it. Stored documents were validated when written, so building
+    one skips validation and Beanie's state tracking, it can't be saved.
+    """
+
+    __slots__ = ("id", "identifier", "email", "name", "picture", "username", "stats", "created_at", "deleted_at")
+
+    projection = {x: 1 for x in __slots__ if x != "id"}
+
+    def __init__(
+        self,
+        id: PydanticObjectId,
+        identifier: str,
+        email: str,
+        name: str,
+        username: str,
+        created_at: datetime,
+        picture: str | None = None,
+        stats: UserStats | None = None,
+        deleted_at: datetime | None = None,
+    ):
+        self.id = id
+        self.identifier = identifier
+        self.email = email
+        self.name = name
+        self.picture = picture
+        self.username = username
+        self.stats = stats
+        self.created_at = created_at
+        self.deleted_at = deleted_at
+
+    @classmethod
+    def from_document(cls, raw: dict) -> "UserView":
+        stats = raw.get("stats")
+        return cls(
+            id=raw["_id"],
+            identifier=raw["identifier"],
+            email=raw["email"],
+            name=raw["name"],
+            picture=raw.get("picture"),
+            username=raw["username"],
+            stats=UserStats.model_construct(**stats) if stats is not None else None,
+            created_at=raw["created_at"],
+            deleted_at=raw.get("deleted_at"),
+        )
+
+    @property
+    def is_deleted(self) -> bool:
+        return self.deleted_at is not None
+
+    def to_dict(self) -> dict:
+        return {x: getattr(self, x) for x in self.__slots__}
 
 
 class SocialAuthSession(Document, BaseDateTimeMeta):
@@ -46,15 +156,57 @@ class SocialAuthSession(Document, BaseDateTimeMeta):
 
     profile: dict | None = None
 
+    # Set together once the provider confirmed who logged in
     exchange_code: str | None = None
+    user_id: PydanticObjectId | None = None
 
     class Settings:
         name = "social_auth_sessions"
+        indexes = [
+            IndexModel([("nonce", ASCENDING)], unique=True),
+            IndexModel(
+                [("exchange_code", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"exchange_code": {"$type": "string"}},
+            ),
+            IndexModel([("deleted_at", ASCENDING)], partialFilterExpression=DELETED_FILTER),
+        ]
 
-    async def create_exchange_code(self) -> str:
-        self.exchange_code = token_hex(55)
-        await self.save()
-        return self.exchange_code
+    async def complete(self, user: "User") -> str | None:
+        """
+        Stores what the provider returned along with the user and a new exchange code in a single write. `None` when
+        the session was completed already, a replayed callback.
+        """
+        exchange_code = token_hex(55)
+        now = datetime.now(tz=pytz.UTC)
+        update = {
+            "$set": {
+                "auth_provider_user_id": self.auth_provider_user_id,
+                "auth_provider_access_token": self.auth_provider_access_token,
+                "profile": self.profile,
+                "exchange_code": exchange_code,
+                "user_id": user.id,
+                "updated_at": now,
+            }
+        }
+        query = {"_id": self.id, "exchange_code": None, "deleted_at": None}
+        result = await SocialAuthSession.find_one(query).update(update)
+        if result.modified_count == 0:
+            return None
+
+        self.exchange_code = exchange_code
+        self.user_id = user.id
+        return exchange_code
+
+    @classmethod
+    async def consume(cls, exchange_code: str, created_after: datetime) -> "SocialAuthSession | None":
+        """
+        Ends the session of `exchange_code` and returns it, each code can be exchanged once.
+        """
+        now = datetime.now(tz=pytz.UTC)
+        query = {"exchange_code": exchange_code, "deleted_at": None, "created_at": {"$gte": created_after}}
+        update = {"$set": {"deleted_at": now, "updated_at": now}}
+        return await cls.find_one(query).update(update, response_type=UpdateResponse.NEW_DOCUMENT)
 
     @classmethod
     async def create_session(
@@ -70,7 +222,7 @@ class SocialAuthSession(Document, BaseDateTimeMeta):
             ip=ip,
             user_agent=user_agent,
         )
-        await session.save()
+        await session.insert()
         return session
 
     async def remove_session(self) -> None:
@@ -78,6 +230,31 @@ class SocialAuthSession(Document, BaseDateTimeMeta):
         await self.save()
 
 
+class RefreshTokenFamily(Document):
+    """
+    The refresh tokens of one login. Tokens rotate on every refresh and only `current_jti` can be exchanged, an older
+    one coming back means the family leaked so the whole family is revoked. Expires along with its latest token.
+    """
+
+    id: str = Field(default_factory=lambda: token_hex(16))
+    user_identifier: str
+    current_jti: str
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now(tz=pytz.UTC))
+    rotated_at: datetime | None = None
+    revoked_at: datetime | None = None
+    revoked_reason: Literal["logout", "logout_everywhere", "reuse"] | None = None
+    expires_at: datetime
+
+    class Settings:
+        name = "refresh-token-families"
+        indexes = [
+            IndexModel([("user_identifier", ASCENDING)]),
+            IndexModel([("revoked_at", ASCENDING)], partialFilterExpression={"revoked_at": {"$type": "date"}}),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
+
+
 class AccessTokenResponse(BaseMellyAPIModel):
     access_token: str = Field(..., alias="accessToken")
     refresh_token: str = Field(..., alias="refreshToken")
@@ -98,3 +275,17 @@ class MyProfile(BaseMellyAPIModel):
 
 class UsernameIn(BaseMellyAPIModel):
     username: str
+
+
+class PublicProfile(BaseMellyAPIModel):
+    name: str
+    picture: HttpUrl | None = None
+    username: str
+
+    article_count: int = Field(0, alias="articleCount")
+    bookmark_count: int = Field(0, alias="bookmarkCount")
+    published_collection_count: int = Field(0, alias="publishedCollectionCount")
+    follower_count: int = Field(0, alias="followerCount")
+    following_count: int = Field(0, alias="followingCount")
+
+    created_at: datetime = Field(..., alias="createdAt")
@@ -1,20 +1,65 @@
 from datetime import datetime
-from typing import List
+from typing import List, Set
 
 import pytz
 from fastapi import HTTPException
 from slugify import slugify
 
-from melly.libaccount.models import User
-from melly.libarticle.models import Article as ArticleModel, ArticleOut, ArticleIn
+from melly.libaccount.models import User, UserView
+from melly.libarticle.models import (
+    Article as ArticleModel,
+    ArticleBatchItemOut,
+    ArticleOut,
+    ArticleIn,
+    ArticleSummaryOut,
+)
 from melly.libshared.constants import Sort
+from melly.libshared.counters import CounterBuffer
+from melly.libshared.fields import build_projection
+from melly.libshared.markdown import RenderCache, RenderedMarkdown, hash_markdown, render_markdown
 from melly.libshared.settings import api_settings
+from melly.libshared.slug import generate_id, insert_with_unique_slug
+from melly.libsocial.domain.timeline import Timeline
+
+render_cache = RenderCache(max_entries=api_settings.article_render_cache_size)
+article_views = CounterBuffer(
+    model=ArticleModel,
+    key_field="slug",
+    field="view_count",
+    interval_in_seconds=api_settings.article_view_flush_interval_in_seconds,
+    max_keys=api_settings.article_view_flush_max_keys,
+)
+
+# Stored fields each summary field is built from
+summary_fragments = {
+    "canonical_url": {"slug": 1},
+    "excerpt": {
+        "excerpt": 1,
+        # Only articles saved before excerpts were stored need their content
+        "content_in_markdown": {"$cond": [{"$ifNull": ["$excerpt", False]}, "$$REMOVE", "$content_in_markdown"]},
+    },
+    "author_name": {"author_id": 1},
+    "author_picture": {"author_id": 1},
+}
 
 
 class Article:
+    @classmethod
+    def render(cls, article: dict) -> RenderedMarkdown:
+        markdown = article.get("content_in_markdown")
+        content_hash = hash_markdown(markdown)
+        if article.get("content_hash") == content_hash and article.get("content_in_html") is not None:
+            return RenderedMarkdown(
+                html=article.get("content_in_html"), excerpt=article.get("excerpt"), content_hash=content_hash
+            )
+
+        # Saved before articles were rendered or by an older renderer, render once per process until the next edit
+        return render_cache.render(markdown)
+
     @classmethod
     def build_article_response(cls, article: dict) -> ArticleOut:
         canonical_url = f"{api_settings.fe_base_url}/articles/{article.get('slug')}"
+        rendered = cls.render(article)
 
         return ArticleOut(
             title=article.get("title"),
@@ -22,23 +67,27 @@ class Article:
             image=article.get("image"),
             slug=article.get("slug"),
             content_in_markdown=article.get("content_in_markdown"),
+            content_in_html=rendered.html,
+            excerpt=rendered.excerpt,
+            content_hash=rendered.content_hash,
             author_name=article.get("author").get("name"),
             author_picture=article.get("author").get("picture"),
             author_id=article.get("author").get("username"),
             created_at=article.get("created_at"),
             canonical_url=canonical_url,
+            view_count=article.get("view_count", 0) + article_views.pending(article.get("slug")),
         )
 
     @classmethod
     async def get_my_articles(
-        cls, user: User, skip: int = 0, limit: int = 10, sort: Sort = Sort.Descending
+        cls, user: User | UserView, skip: int = 0, limit: int = 10, sort: Sort = Sort.Descending
     ) -> List[ArticleOut]:
         sort_direction = -1 if sort.value == Sort.Descending.value else 1
         pipeline = [
             {"$match": {"author_id": user.username, "deleted_at": {"$eq": None}}},
+            {"$sort": {"created_at": sort_direction}},
             {"$skip": skip},
             {"$limit": limit},
-            {"$sort": {"created_at": sort_direction}},
             {
                 "$lookup": {
                     "from": "users",
@@ -52,6 +101,47 @@ class Article:
         articles = await ArticleModel.aggregate(pipeline).to_list()
         return [cls.build_article_response(x) for x in articles]
 
+    @classmethod
+    def build_article_summary(cls, article: dict, fields: Set[str]) -> ArticleSummaryOut:
+        values = {**article, "canonical_url": f"{api_settings.fe_base_url}/articles/{article.get('slug')}"}
+        if "author" in article:
+            values.update(
+                author_name=article.get("author").get("name"), author_picture=article.get("author").get("picture")
+            )
+        if "excerpt" in fields and not article.get("excerpt"):
+            values["excerpt"] = render_cache.render(article.get("content_in_markdown") or "").excerpt
+
+        return ArticleSummaryOut(**{x: values.get(x) for x in fields})
+
+    @classmethod
+    async def get_my_article_summaries(
+        cls, user: User | UserView, fields: Set[str], skip: int = 0, limit: int = 10, sort: Sort = Sort.Descending
+    ) -> List[ArticleSummaryOut]:
+        sort_direction = -1 if sort.value == Sort.Descending.value else 1
+        pipeline = [
+            {"$match": {"author_id": user.username, "deleted_at": {"$eq": None}}},
+            {"$sort": {"created_at": sort_direction}},
+            {"$skip": skip},
+            {"$limit": limit},
+            build_projection(fields=fields, fragments=summary_fragments),
+        ]
+        if fields & {"author_name", "author_picture"}:
+            pipeline += [
+                {
+                    "$lookup": {
+                        "from": "users",
+                        "localField": "author_id",
+                        "foreignField": "username",
+                        "pipeline": [{"$project": {"_id": 0, "name": 1, "picture": 1}}],
+                        "as": "author",
+                    }
+                },
+                {"$unwind": "$author"},
+            ]
+
+        articles = await ArticleModel.aggregate(pipeline).to_list(length=limit)
+        return [cls.build_article_summary(x, fields=fields) for x in articles]
+
     @classmethod
     async def get_article_by_slug(cls, slug: str) -> ArticleOut:
         pipeline = [
@@ -73,24 +163,81 @@ class Article:
         article = articles[0]
         return cls.build_article_response(article)
 
+    @classmethod
+    async def view_article(cls, slug: str) -> ArticleOut:
+        """
+        Reads the article and counts the view without writing, `article_views` stores it later.
+        """
+        article = await cls.get_article_by_slug(slug=slug)
+        article_views.increment(slug)
+        return article.model_copy(update={"view_count": article.view_count + 1})
+
+    @classmethod
+    async def batch_get(cls, slugs: List[str]) -> List[ArticleBatchItemOut]:
+        """
+        Articles for `slugs` in request order with one query for the articles and one for their authors.
+        """
+        pipeline = [{"$match": {"slug": {"$in": list(set(slugs))}, "deleted_at": {"$eq": None}}}]
+        articles = await ArticleModel.aggregate(pipeline).to_list(length=None)
+        authors = await User.find_profiles(usernames=[x.get("author_id") for x in articles])
+
+        found = {}
+        for article in articles:
+            author = authors.get(article.get("author_id"))
+            if author is not None:
+                found[article.get("slug")] = cls.build_article_response({**article, "author": author})
+
+        return [ArticleBatchItemOut(slug=x, found=x in found, article=found.get(x)) for x in slugs]
+
     @classmethod
     async def create_article(cls, payload: ArticleIn, user: User) -> ArticleOut:
-        now = datetime.now(tz=pytz.UTC)
-        slug = f"{slugify(payload.title)}-{int(now.timestamp())}"
-        article = ArticleModel(**payload.model_dump(), slug=slug, author_id=user.username)
-        await article.save()
-        return await cls.get_article_by_slug(slug=slug)
+        # Title first since article slugs double as the public canonical URL
+        def make_slug() -> str:
+            return f"{slugify(payload.title)}-{generate_id()}"
+
+        rendered = render_markdown(payload.content_in_markdown)
+        article = ArticleModel(
+            **payload.model_dump(),
+            content_in_html=rendered.html,
+            excerpt=rendered.excerpt,
+            content_hash=rendered.content_hash,
+            slug=make_slug(),
+            author_id=user.username,
+        )
+        await insert_with_unique_slug(article, make_slug=make_slug)
+        await User.increment_stats(username=user.username, articles=1)
+        await Timeline.fan_out(kind="article", slug=article.slug, actor_id=user.username, created_at=article.created_at)
+        return await cls.get_article_by_slug(slug=article.slug)
 
     @classmethod
     async def update_article(cls, payload: ArticleIn, user: User, slug: str) -> ArticleOut:
-        article = await ArticleModel.find_one({"slug": slug, "author_id": user.username})
+        article = await ArticleModel.find_one({"slug": slug, "author_id": user.username, "deleted_at": None})
         if article is None:
             raise HTTPException(status_code=404, detail="Article not found")
 
-        article.title = payload.title
-        article.description = payload.description
-        article.image = payload.image
-        article.content_in_markdown = payload.content_in_markdown
-        await article.save()
+        # Only the edited fields, saving the whole article would overwrite views flushed since it was read
+        values = {
+            "title": payload.title,
+            "description": payload.description,
+            "image": str(payload.image) if payload.image is not None else None,
+            "content_in_markdown": payload.content_in_markdown,
+            "updated_at": datetime.now(tz=pytz.UTC),
+        }
+        if article.content_hash != hash_markdown(payload.content_in_markdown) or article.content_in_html is None:
+            rendered = render_markdown(payload.content_in_markdown)
+            values.update(content_in_html=rendered.html, excerpt=rendered.excerpt, content_hash=rendered.content_hash)
+        await ArticleModel.get_motor_collection().update_one({"_id": article.id}, {"$set": values})
 
         return await cls.get_article_by_slug(slug=slug)
+
+    @classmethod
+    async def delete_article(cls, slug: str, user: User) -> None:
+        article = await ArticleModel.find_one({"slug": slug, "author_id": user.username, "deleted_at": None})
+        if article is None:
+            raise HTTPException(status_code=404, detail="Article not found")
+
+        now = datetime.now(tz=pytz.UTC)
+        await ArticleModel.get_motor_collection().update_one(
+            {"_id": article.id}, {"$set": {"deleted_at": now, "updated_at": now}}
+        )
+        await User.increment_stats(username=user.username, articles=-1)
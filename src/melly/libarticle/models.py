@@ -1,9 +1,11 @@
 from datetime import datetime
 
 import pytz
-from beanie import Document, before_event, Replace, Update, SaveChanges
+from beanie import Document, before_event, Insert, Save, Replace, Update, SaveChanges
 from pydantic import HttpUrl, Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
+from melly.libshared.constants import NOT_DELETED_FILTER, DELETED_FILTER
 from melly.libshared.models import BaseDateTimeMeta, BaseMellyAPIModel
 
 
@@ -15,14 +17,31 @@ class Article(Document, BaseDateTimeMeta):
     slug: str
     content_in_markdown: str
 
+    # Rendered once per edit, see libshared.markdown
+    content_in_html: str | None = None
+    excerpt: str | None = None
+    content_hash: str | None = None
+
     author_id: str
 
-    @before_event(Replace, Update, SaveChanges)
+    # Written behind by `article_views`, see libshared.counters
+    view_count: int = 0
+
+    @before_event(Insert, Save, Replace, Update, SaveChanges)
     async def bump_updated_at(self):
         self.updated_at = datetime.now(tz=pytz.UTC)
 
     class Settings:
         name = "articles"
+        indexes = [
+            IndexModel([("slug", ASCENDING)], unique=True),
+            IndexModel(
+                [("author_id", ASCENDING), ("created_at", DESCENDING)], partialFilterExpression=NOT_DELETED_FILTER
+            ),
+            IndexModel([("deleted_at", ASCENDING)], partialFilterExpression=DELETED_FILTER),
+            # Sync, tombstones included
+            IndexModel([("author_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)]),
+        ]
 
 
 class ArticleIn(BaseMellyAPIModel):
@@ -42,4 +61,36 @@ class ArticleOut(ArticleIn):
 
     canonical_url: HttpUrl = Field(..., alias="canonicalUrl")
 
+    content_in_html: str = Field(..., alias="contentInHtml")
+    excerpt: str
+    content_hash: str = Field(..., alias="contentHash")
+
     created_at: datetime = Field(..., alias="createdAt")
+
+    view_count: int = Field(0, alias="viewCount")
+
+
+class ArticleSummaryOut(BaseMellyAPIModel):
+    """
+    List view of an article without its content, every field is optional so clients can ask for a subset.
+    """
+
+    title: str | None = None
+    description: str | None = None
+    image: HttpUrl | None = None
+    slug: str | None = None
+    excerpt: str | None = None
+
+    author_name: str | None = Field(None, alias="authorName")
+    author_picture: HttpUrl | None = Field(None, alias="authorPicture")
+    author_id: str | None = None
+
+    canonical_url: HttpUrl | None = Field(None, alias="canonicalUrl")
+
+    created_at: datetime | None = Field(None, alias="createdAt")
+
+
+class ArticleBatchItemOut(BaseMellyAPIModel):
+    slug: str
+    found: bool
+    article: ArticleOut | None = None
@@ -1,12 +1,55 @@
 from datetime import datetime
-from typing import List
+from typing import List, Literal, Set, Tuple
 
 import pytz
-from coolname import generate_slug
+from beanie import UpdateResponse
+from beanie.exceptions import RevisionIdWasChanged
 from fastapi import HTTPException
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
-from melly.libaccount.models import User
-from melly.libcollection.models import BookmarkItem, BookmarkItemOut, BookmarkItemIn, BookmarkNoteIn, BookmarkNote
+from melly.libaccount.models import User, UserView
+from melly.libcollection.domain.collection import Collection
+from melly.libcollection.domain.metadata import BookmarkMetadata
+from melly.libcollection.domain.trending import Trending
+from melly.libcollection.models import (
+    BookmarkItem,
+    BookmarkItemOut,
+    BookmarkItemIn,
+    BookmarkBatchItemOut,
+    BookmarkItemSummaryOut,
+    BookmarkItemNote,
+    BookmarkNoteIn,
+    BookmarkNote,
+    BookmarkNoteOut,
+    BookmarkNotePageOut,
+    UrlSaveCountOut,
+)
+from melly.libshared.constants import Sort
+from melly.libshared.cursor import after_cursor_query, encode_cursor
+from melly.libshared.fields import build_projection
+from melly.libshared.settings import api_settings
+from melly.libshared.slug import generate_id, insert_with_unique_slug
+from melly.libshared.url import normalize_url, hash_url, url_domain
+from melly.libsocial.domain.timeline import Timeline
+
+# Bookmarks that never counted their notes still embed all of them
+note_count_expression = {"$ifNull": ["$note_count", {"$size": {"$ifNull": ["$notes", []]}}]}
+
+# Stored fields each summary field is built from
+summary_fragments = {
+    "note_count": {"note_count": note_count_expression},
+    "owner_name": {"owner_id": 1},
+    "owner_picture": {"owner_id": 1},
+}
+
+
+def note_preview_stage() -> dict:
+    """
+    Trims the notes of bookmarks down to the latest few right after `$match`, so no more than those leave the server.
+    """
+    notes = {"$slice": [{"$ifNull": ["$notes", []]}, -api_settings.bookmark_note_preview_size]}
+    return {"$set": {"notes": notes, "note_count": note_count_expression}}
 
 
 class Bookmark:
@@ -15,12 +58,23 @@ class Bookmark:
         owner_name = bookmark.get("owner").get("name")
         owner_picture = bookmark.get("owner").get("picture")
 
-        return BookmarkItemOut(**bookmark, owner_name=owner_name, owner_picture=owner_picture)
+        notes = bookmark.get("notes") or []
+        note_count = bookmark.get("note_count")
+        if note_count is None:
+            note_count = len(notes)
+        notes = notes[-api_settings.bookmark_note_preview_size :]
+
+        return BookmarkItemOut(
+            **{**bookmark, "notes": notes, "note_count": note_count},
+            owner_name=owner_name,
+            owner_picture=owner_picture,
+        )
 
     @classmethod
-    async def get_bookmark_by_slug(cls, slug: str) -> BookmarkItemOut:
+    async def find_bookmark(cls, query: dict) -> BookmarkItemOut | None:
         pipeline = [
-            {"$match": {"slug": slug, "deleted_at": {"$eq": None}}},
+            {"$match": {**query, "deleted_at": {"$eq": None}}},
+            note_preview_stage(),
             {
                 "$lookup": {
                     "from": "users",
@@ -33,34 +87,168 @@ class Bookmark:
         ]
         result = await BookmarkItem.aggregate(pipeline).to_list(length=1)
         if len(result) == 0:
-            raise HTTPException(status_code=404, detail="Bookmark item not found")
+            return None
         return cls.build_bookmark_response(result[0])
 
+    @classmethod
+    async def get_bookmark_by_slug(cls, slug: str) -> BookmarkItemOut:
+        bookmark = await cls.find_bookmark(query={"slug": slug})
+        if bookmark is None:
+            raise HTTPException(status_code=404, detail="Bookmark item not found")
+        return bookmark
+
+    @classmethod
+    async def batch_get(cls, slugs: List[str]) -> List[BookmarkBatchItemOut]:
+        """
+        Bookmarks for `slugs` in request order with one query for the bookmarks and one for their owners.
+        """
+        pipeline = [
+            {"$match": {"slug": {"$in": list(set(slugs))}, "deleted_at": {"$eq": None}}},
+            note_preview_stage(),
+        ]
+        bookmarks = await BookmarkItem.aggregate(pipeline).to_list(length=None)
+        owners = await User.find_profiles(usernames=[x.get("owner_id") for x in bookmarks])
+
+        found = {}
+        for bookmark in bookmarks:
+            owner = owners.get(bookmark.get("owner_id"))
+            if owner is not None:
+                found[bookmark.get("slug")] = cls.build_bookmark_response({**bookmark, "owner": owner})
+
+        return [BookmarkBatchItemOut(slug=x, found=x in found, bookmark=found.get(x)) for x in slugs]
+
+    @classmethod
+    async def save_bookmark(cls, payload: BookmarkItemIn, user: User) -> Tuple[BookmarkItemOut, bool]:
+        """
+        Saves the bookmark unless the user already saved the same page, in which case the existing bookmark is
+        returned. The second item tells whether a new bookmark was created.
+        """
+        url_hash = hash_url(str(payload.url))
+        existing_query = {"owner_id": user.username, "url_hash": url_hash}
+
+        existing = await cls.find_bookmark(query=existing_query)
+        if existing:
+            return existing, False
+
+        item = BookmarkItem(
+            **payload.model_dump(exclude={"url"}),
+            url=normalize_url(str(payload.url)),
+            url_hash=url_hash,
+            domain=url_domain(str(payload.url)),
+            slug=generate_id(),
+            owner_id=user.username,
+        )
+        try:
+            await insert_with_unique_slug(item)
+        except DuplicateKeyError:
+            # Lost a race against a concurrent save of the same page
+            existing = await cls.find_bookmark(query=existing_query)
+            if existing is None:
+                raise
+            return existing, False
+
+        await User.increment_stats(username=user.username, bookmarks=1)
+        await Trending.count(tags=item.tags, url_hash=item.url_hash, url=str(item.url))
+        await Timeline.fan_out(kind="bookmark", slug=item.slug, actor_id=user.username, created_at=item.created_at)
+        await BookmarkMetadata.enrich(item)
+        return await cls.get_bookmark_by_slug(slug=item.slug), True
+
     @classmethod
     async def create_bookmark(cls, payload: BookmarkItemIn, user: User) -> BookmarkItemOut:
-        slug = f"{generate_slug(4)}-{int(datetime.now(tz=pytz.UTC).timestamp())}"
-        item = BookmarkItem(**payload.model_dump(), slug=slug, owner_id=user.username)
-        await item.save()
-        return await cls.get_bookmark_by_slug(slug=slug)
+        bookmark, created = await cls.save_bookmark(payload=payload, user=user)
+        if not created:
+            raise HTTPException(status_code=409, detail="Bookmark already exists")
+        return bookmark
 
     @classmethod
     async def update_bookmark(cls, slug: str, payload: BookmarkItemIn, user: User) -> BookmarkItemOut:
-        query = {"slug": slug, "owner_id": user.username}
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
         item = await BookmarkItem.find_one(query)
         if not item:
             raise HTTPException(status_code=404, detail="Bookmark item not found")
 
-        item.url = payload.url
+        url_hash = hash_url(str(payload.url))
+        query = {"owner_id": user.username, "url_hash": url_hash, "slug": {"$ne": slug}, "deleted_at": None}
+        url_changed = url_hash != item.url_hash
+        if url_changed and await BookmarkItem.find_one(query):
+            raise HTTPException(status_code=409, detail="Bookmark already exists")
+
+        if url_changed:
+            item.metadata = None
+        # Only what the update adds is counted, removals don't take back earlier saves
+        added_tags = [x for x in payload.tags if x not in item.tags]
+        item.url = normalize_url(str(payload.url))
+        item.url_hash = url_hash
+        item.domain = url_domain(str(payload.url))
         item.tags = payload.tags
         item.content = payload.content
-        await item.save()
+        try:
+            await item.save()
+        except (DuplicateKeyError, RevisionIdWasChanged):
+            # Beanie reports duplicate keys on save as a revision conflict
+            raise HTTPException(status_code=409, detail="Bookmark already exists")
 
+        await Trending.count(
+            tags=added_tags, url_hash=item.url_hash if url_changed else None, url=str(item.url) if url_changed else None
+        )
+        if url_changed:
+            await BookmarkMetadata.enrich(item)
         return await cls.get_bookmark_by_slug(slug=slug)
 
     @classmethod
-    async def my_bookmarks(cls, user: User, skip: int = 0, limit: int = 10) -> List[BookmarkItemOut]:
+    async def count_saves(cls, url: str) -> UrlSaveCountOut:
+        # A user can only have one live bookmark per page, so bookmarks are users
+        count = await BookmarkItem.find({"url_hash": hash_url(url), "deleted_at": None}).count()
+        return UrlSaveCountOut(url=normalize_url(url), count=count)
+
+    @classmethod
+    def my_bookmarks_pipeline(
+        cls,
+        user: User | UserView,
+        skip: int = 0,
+        limit: int = 10,
+        sort: Sort = Sort.Descending,
+        sort_by: Literal["created_at", "updated_at"] = "created_at",
+        tag: str | None = None,
+        domain: str | None = None,
+        after: datetime | None = None,
+        before: datetime | None = None,
+    ) -> List[dict]:
+        """
+        `$match`, `$sort`, `$skip` and `$limit` stages of a page of the user's bookmarks, ahead of any join so only the
+        page is joined. The date range applies to `sort_by`. Every combination has an index: `(owner_id, sort_by)`,
+        `(owner_id, tags, sort_by)` and `(owner_id, domain, sort_by)`.
+        """
+        match = {"owner_id": user.username, "deleted_at": {"$eq": None}}
+        if tag is not None:
+            match["tags"] = tag
+        if domain is not None:
+            # Accepts a bare host as well as a URL
+            match["domain"] = url_domain(domain if "://" in domain else f"https://{domain}")
+
+        date_range = {}
+        if after is not None:
+            date_range["$gte"] = after
+        if before is not None:
+            date_range["$lt"] = before
+        if date_range:
+            match[sort_by] = date_range
+
+        sort_direction = -1 if sort == Sort.Descending else 1
+        return [
+            {"$match": match},
+            {"$sort": {sort_by: sort_direction}},
+            {"$skip": skip},
+            {"$limit": limit},
+        ]
+
+    @classmethod
+    async def my_bookmarks(
+        cls, user: User | UserView, skip: int = 0, limit: int = 10, **filters
+    ) -> List[BookmarkItemOut]:
         pipeline = [
-            {"$match": {"owner_id": user.username, "deleted_at": {"$eq": None}}},
+            *cls.my_bookmarks_pipeline(user=user, skip=skip, limit=limit, **filters),
+            note_preview_stage(),
             {
                 "$lookup": {
                     "from": "users",
@@ -70,21 +258,258 @@ class Bookmark:
                 }
             },
             {"$unwind": "$owner"},
-            {"$skip": skip},
-            {"$limit": limit},
         ]
         result = await BookmarkItem.aggregate(pipeline).to_list(length=limit)
         return [cls.build_bookmark_response(item) for item in result]
 
+    @classmethod
+    def build_bookmark_summary(cls, bookmark: dict, fields: Set[str]) -> BookmarkItemSummaryOut:
+        values = dict(bookmark)
+        if "owner" in bookmark:
+            values.update(
+                owner_name=bookmark.get("owner").get("name"), owner_picture=bookmark.get("owner").get("picture")
+            )
+
+        return BookmarkItemSummaryOut(**{x: values.get(x) for x in fields})
+
+    @classmethod
+    async def my_bookmark_summaries(
+        cls, user: User | UserView, fields: Set[str], skip: int = 0, limit: int = 10, **filters
+    ) -> List[BookmarkItemSummaryOut]:
+        pipeline = [
+            *cls.my_bookmarks_pipeline(user=user, skip=skip, limit=limit, **filters),
+            build_projection(fields=fields, fragments=summary_fragments),
+        ]
+        if fields & {"owner_name", "owner_picture"}:
+            pipeline += [
+                {
+                    "$lookup": {
+                        "from": "users",
+                        "localField": "owner_id",
+                        "foreignField": "username",
+                        "pipeline": [{"$project": {"_id": 0, "name": 1, "picture": 1}}],
+                        "as": "owner",
+                    }
+                },
+                {"$unwind": "$owner"},
+            ]
+
+        result = await BookmarkItem.aggregate(pipeline).to_list(length=limit)
+        return [cls.build_bookmark_summary(item, fields=fields) for item in result]
+
     @classmethod
     async def create_note(cls, payload: BookmarkNoteIn, slug: str, user: User) -> BookmarkItemOut:
-        query = {"slug": slug, "owner_id": user.username}
+        """
+        Appends the note in a single update while the notes are embedded, moving them out once there are more than
+        `bookmark_embedded_notes_limit`.
+        """
+        now = datetime.now(tz=pytz.UTC)
+        note = BookmarkNote(**payload.model_dump(), created_at=now)
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+        collection = BookmarkItem.get_motor_collection()
+
+        update = {
+            "notes": {"$concatArrays": [{"$ifNull": ["$notes", []]}, {"$literal": [note.model_dump()]}]},
+            "note_count": {"$add": [note_count_expression, 1]},
+            "updated_at": now,
+        }
+        item = await collection.find_one_and_update(
+            {**query, "notes_moved_at": None},
+            [{"$set": update}],
+            projection={"note_count": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if item is not None:
+            if item.get("note_count") > api_settings.bookmark_embedded_notes_limit:
+                await cls.move_notes(slug=slug)
+            return await cls.get_bookmark_by_slug(slug=slug)
+
+        query["notes_moved_at"] = {"$type": "date"}
+        if await collection.count_documents(query, limit=1) == 0:
+            raise HTTPException(status_code=404, detail="Bookmark item not found")
+
+        moved_note = BookmarkItemNote(**note.model_dump(), bookmark_slug=slug, owner_id=user.username)
+        await moved_note.insert()
+        update = {
+            "notes": {
+                "$slice": [
+                    {"$concatArrays": ["$notes", {"$literal": [note.model_dump()]}]},
+                    -api_settings.bookmark_note_preview_size,
+                ]
+            },
+            "note_count": {"$add": ["$note_count", 1]},
+            "updated_at": now,
+        }
+        result = await collection.update_one(query, [{"$set": update}])
+        if result.matched_count == 0:
+            # Lost a race against the bookmark being deleted
+            await moved_note.delete()
+            raise HTTPException(status_code=404, detail="Bookmark item not found")
+
+        return await cls.get_bookmark_by_slug(slug=slug)
+
+    @classmethod
+    async def move_notes(cls, slug: str) -> None:
+        """
+        Copies the embedded notes of the bookmark to `BookmarkItemNote` and keeps only the latest few in the bookmark.
+        The swap only goes through when the notes did not change since they were copied, otherwise it starts over.
+        Idempotent, so it also moves notes of bookmarks saved before notes had a limit.
+        """
+        collection = BookmarkItem.get_motor_collection()
+        while True:
+            item = await collection.find_one(
+                {"slug": slug, "deleted_at": None, "notes_moved_at": None},
+                projection={"notes": 1, "owner_id": 1, "created_at": 1},
+            )
+            if item is None:
+                return
+
+            notes = item.get("notes") or []
+            # Leftovers of an earlier attempt that lost against a note being deleted
+            await BookmarkItemNote.find(
+                {"bookmark_slug": slug, "slug": {"$nin": [x.get("slug") for x in notes]}}
+            ).delete()
+            if notes:
+                requests = []
+                for note in notes:
+                    moved_note = BookmarkItemNote(
+                        **{**note, "created_at": note.get("created_at") or item.get("created_at")},
+                        bookmark_slug=slug,
+                        owner_id=item.get("owner_id"),
+                    )
+                    document = moved_note.model_dump(exclude={"id", "revision_id"})
+                    requests.append(ReplaceOne({"slug": note.get("slug")}, document, upsert=True))
+                await BookmarkItemNote.get_motor_collection().bulk_write(requests, ordered=False)
+
+            now = datetime.now(tz=pytz.UTC)
+            update = {
+                "$set": {
+                    "notes": notes[-api_settings.bookmark_note_preview_size :],
+                    "note_count": len(notes),
+                    "notes_moved_at": now,
+                    "updated_at": now,
+                }
+            }
+            result = await collection.update_one(
+                {"_id": item.get("_id"), "notes_moved_at": None, "notes": notes}, update
+            )
+            if result.matched_count > 0:
+                return
+
+    @classmethod
+    async def get_notes(cls, slug: str, cursor: str | None = None, limit: int = 10) -> BookmarkNotePageOut:
+        """
+        Notes of the bookmark oldest first, in `(created_at, slug)` keyset pages.
+        """
+        query = {"slug": slug, "deleted_at": None}
+        item = await BookmarkItem.get_motor_collection().find_one(query, projection={"notes_moved_at": 1})
+        if item is None:
+            raise HTTPException(status_code=404, detail="Bookmark item not found")
+
+        if item.get("notes_moved_at") is None:
+            pipeline = [
+                {"$match": query},
+                {"$unwind": "$notes"},
+                {"$replaceWith": "$notes"},
+                {"$match": after_cursor_query(cursor)},
+                {"$sort": {"created_at": 1, "slug": 1}},
+                {"$limit": limit},
+            ]
+            result = await BookmarkItem.aggregate(pipeline).to_list(length=limit)
+        else:
+            pipeline = [
+                {"$match": {"bookmark_slug": slug, "deleted_at": {"$eq": None}, **after_cursor_query(cursor)}},
+                {"$sort": {"created_at": 1, "slug": 1}},
+                {"$limit": limit},
+            ]
+            result = await BookmarkItemNote.aggregate(pipeline).to_list(length=limit)
+
+        next_cursor = None
+        if len(result) == limit:
+            last = result[-1]
+            next_cursor = encode_cursor(created_at=last.get("created_at"), slug=last.get("slug"))
+
+        return BookmarkNotePageOut(notes=[BookmarkNoteOut(**x) for x in result], next_cursor=next_cursor)
+
+    @classmethod
+    async def update_note(cls, slug: str, note_slug: str, payload: BookmarkNoteIn, user: User) -> BookmarkNoteOut:
+        now = datetime.now(tz=pytz.UTC)
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+        collection = BookmarkItem.get_motor_collection()
+
+        item = await collection.find_one_and_update(
+            {**query, "notes_moved_at": None, "notes.slug": note_slug},
+            {"$set": {"notes.$.content": payload.content, "notes.$.updated_at": now, "updated_at": now}},
+            projection={"notes": {"$elemMatch": {"slug": note_slug}}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if item is not None:
+            return BookmarkNoteOut(**item.get("notes")[0])
+
+        note = await BookmarkItemNote.find_one(
+            {"slug": note_slug, "bookmark_slug": slug, "owner_id": user.username, "deleted_at": None}
+        ).update(
+            {"$set": {"content": payload.content, "updated_at": now}},
+            response_type=UpdateResponse.NEW_DOCUMENT,
+        )
+        if note is None:
+            raise HTTPException(status_code=404, detail="Note not found")
+
+        # The note may be one of the latest few the bookmark keeps
+        await collection.update_one(
+            query,
+            {"$set": {"notes.$[note].content": payload.content, "notes.$[note].updated_at": now, "updated_at": now}},
+            array_filters=[{"note.slug": note_slug}],
+        )
+        return BookmarkNoteOut(**note.model_dump())
+
+    @classmethod
+    async def delete_note(cls, slug: str, note_slug: str, user: User) -> None:
+        now = datetime.now(tz=pytz.UTC)
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+        collection = BookmarkItem.get_motor_collection()
+
+        update = {
+            "notes": {"$filter": {"input": "$notes", "cond": {"$ne": ["$$this.slug", {"$literal": note_slug}]}}},
+            "note_count": {"$subtract": [note_count_expression, 1]},
+            "updated_at": now,
+        }
+        result = await collection.update_one(
+            {**query, "notes_moved_at": None, "notes.slug": note_slug}, [{"$set": update}]
+        )
+        if result.matched_count > 0:
+            return
+
+        note = await BookmarkItemNote.find_one(
+            {"slug": note_slug, "bookmark_slug": slug, "owner_id": user.username, "deleted_at": None}
+        ).update({"$set": {"deleted_at": now, "updated_at": now}}, response_type=UpdateResponse.NEW_DOCUMENT)
+        if note is None:
+            raise HTTPException(status_code=404, detail="Note not found")
+
+        # Refill the latest few the bookmark keeps
+        latest = (
+            await BookmarkItemNote.find({"bookmark_slug": slug, "deleted_at": None})
+            .sort([("created_at", -1), ("slug", -1)])
+            .limit(api_settings.bookmark_note_preview_size)
+            .to_list()
+        )
+        notes = [BookmarkNote(**x.model_dump()).model_dump() for x in reversed(latest)]
+        await collection.update_one(query, {"$set": {"notes": notes, "updated_at": now}, "$inc": {"note_count": -1}})
+
+    @classmethod
+    async def delete_bookmark(cls, slug: str, user: User) -> None:
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
         item = await BookmarkItem.find_one(query)
         if not item:
             raise HTTPException(status_code=404, detail="Bookmark item not found")
 
-        note = BookmarkNote(**payload.model_dump())
-        item.notes.append(note)
+        now = datetime.now(tz=pytz.UTC)
+        item.deleted_at = now
         await item.save()
+        await User.increment_stats(username=user.username, bookmarks=-1)
+        await BookmarkItemNote.find({"bookmark_slug": slug, "deleted_at": None}).update(
+            {"$set": {"deleted_at": now, "updated_at": now}}
+        )
 
-        return await cls.get_bookmark_by_slug(slug=slug)
+        # Collections only hold bookmark slugs
+        await Collection.remove_bookmark_everywhere(bookmark_slug=slug, now=now)
@@ -1,13 +1,67 @@
 from datetime import datetime
-from typing import List
+from typing import List, Set
 
 import pytz
-from coolname import generate_slug
+from beanie import UpdateResponse
 from fastapi import HTTPException
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 
-from melly.libaccount.models import User
-from melly.libcollection.models import Collection as CollectionModel, CollectionIn, CollectionOut, CollectionTitleIn
+from melly.libaccount.models import User, UserView
+from melly.libcollection.domain.feed import PublishedFeed
+from melly.libcollection.models import (
+    Collection as CollectionModel,
+    CollectionIn,
+    CollectionOut,
+    CollectionSummaryOut,
+    CollectionTitleIn,
+    CollectionComment,
+    CollectionItem,
+    CollectionItemPageOut,
+)
 from melly.libshared.constants import Sort
+from melly.libshared.cursor import decode_position_cursor, encode_position_cursor
+from melly.libshared.fields import build_projection
+from melly.libshared.invalidation import InvalidationEvent
+from melly.libshared.settings import api_settings
+from melly.libshared.slug import generate_id, insert_with_unique_slug
+from melly.libsocial.domain.timeline import Timeline
+
+# Collections that never counted their items still embed all of them
+item_count_expression = {"$ifNull": ["$item_count", {"$size": {"$ifNull": ["$items", []]}}]}
+
+# Stored fields each summary field is built from
+summary_fragments = {
+    "item_count": {"item_count": item_count_expression},
+    "owner_name": {"owner_id": 1},
+    "owner_picture": {"owner_id": 1},
+}
+
+
+def item_preview_stage() -> dict:
+    """
+    Trims the items of collections down to the first few right after `$match`, so no more than those leave the server.
+    """
+    items = {"$slice": [{"$ifNull": ["$items", []]}, api_settings.collection_item_preview_size]}
+    return {"$set": {"items": items, "item_count": item_count_expression}}
+
+
+def position_between(before: float | None, after: float | None) -> float | None:
+    """
+    Position of an item placed between items at `before` and `after`, `None` for either end. `None` when the two are
+    too close to fit anything between them and the items need new positions.
+    """
+    if before is None and after is None:
+        return 1.0
+    if before is None:
+        return after - 1.0
+    if after is None:
+        return before + 1.0
+
+    position = (before + after) / 2
+    if before < position < after:
+        return position
+    return None
 
 
 class Collection:
@@ -16,16 +70,27 @@ class Collection:
         owner_name = collection.get("owner").get("name")
         owner_picture = collection.get("owner").get("picture")
 
-        return CollectionOut(**collection, owner_name=owner_name, owner_picture=owner_picture)
+        items = collection.get("items") or []
+        item_count = collection.get("item_count")
+        if item_count is None:
+            item_count = len(items)
+        items = items[: api_settings.collection_item_preview_size]
+
+        return CollectionOut(
+            **{**collection, "items": items, "item_count": item_count},
+            owner_name=owner_name,
+            owner_picture=owner_picture,
+        )
 
     @classmethod
-    async def get_collection_by_slug(cls, slug: str, user: User | None = None) -> CollectionOut:
+    async def get_collection_by_slug(cls, slug: str, user: User | UserView | None = None) -> CollectionOut:
         match = {"$match": {"slug": slug, "deleted_at": {"$eq": None}}}
         if user:
             match = {"$match": {"slug": slug, "owner_id": user.username, "deleted_at": {"$eq": None}}}
 
         pipeline = [
             match,
+            item_preview_stage(),
             {
                 "$lookup": {
                     "from": "users",
@@ -44,18 +109,30 @@ class Collection:
 
     @classmethod
     async def create_collection(cls, payload: CollectionIn, user: User) -> CollectionOut:
-        slug = f"{generate_slug(4)}-{int(datetime.now(tz=pytz.UTC).timestamp())}"
-        item = CollectionModel(**payload.model_dump(), slug=slug, owner_id=user.username)
-        await item.save()
-        return await cls.get_collection_by_slug(slug=slug)
+        items = list(dict.fromkeys(payload.items))
+        item = CollectionModel(
+            **payload.model_dump(exclude={"items"}),
+            items=items,
+            item_count=len(items),
+            slug=generate_id(),
+            owner_id=user.username,
+        )
+        await insert_with_unique_slug(item)
+        if len(items) > api_settings.collection_embedded_items_limit:
+            await cls.move_items(slug=item.slug)
+        return await cls.get_collection_by_slug(slug=item.slug)
 
     @classmethod
     async def get_my_collections(
-        cls, user: User, skip: int = 0, limit: int = 10, sort: Sort = Sort.Descending
+        cls, user: User | UserView, skip: int = 0, limit: int = 10, sort: Sort = Sort.Descending
     ) -> List[CollectionOut]:
         sort_order = -1 if sort == Sort.Descending else 1
         pipeline = [
             {"$match": {"owner_id": user.username, "deleted_at": {"$eq": None}}},
+            {"$sort": {"created_at": sort_order}},
+            {"$skip": skip},
+            {"$limit": limit},
+            item_preview_stage(),
             {
                 "$lookup": {
                     "from": "users",
@@ -65,36 +142,601 @@ class Collection:
                 }
             },
             {"$unwind": "$owner"},
+        ]
+        result = await CollectionModel.aggregate(pipeline).to_list(length=limit)
+        return [cls.build_collection_response(collection) for collection in result]
+
+    @classmethod
+    def build_collection_summary(cls, collection: dict, fields: Set[str]) -> CollectionSummaryOut:
+        values = dict(collection)
+        if "owner" in collection:
+            values.update(
+                owner_name=collection.get("owner").get("name"), owner_picture=collection.get("owner").get("picture")
+            )
+
+        return CollectionSummaryOut(**{x: values.get(x) for x in fields})
+
+    @classmethod
+    async def get_my_collection_summaries(
+        cls, user: User | UserView, fields: Set[str], skip: int = 0, limit: int = 10, sort: Sort = Sort.Descending
+    ) -> List[CollectionSummaryOut]:
+        sort_order = -1 if sort == Sort.Descending else 1
+        pipeline = [
+            {"$match": {"owner_id": user.username, "deleted_at": {"$eq": None}}},
             {"$sort": {"created_at": sort_order}},
             {"$skip": skip},
             {"$limit": limit},
+            build_projection(fields=fields, fragments=summary_fragments),
         ]
+        if fields & {"owner_name", "owner_picture"}:
+            pipeline += [
+                {
+                    "$lookup": {
+                        "from": "users",
+                        "localField": "owner_id",
+                        "foreignField": "username",
+                        "pipeline": [{"$project": {"_id": 0, "name": 1, "picture": 1}}],
+                        "as": "owner",
+                    }
+                },
+                {"$unwind": "$owner"},
+            ]
+
         result = await CollectionModel.aggregate(pipeline).to_list(length=limit)
-        return [cls.build_collection_response(collection) for collection in result]
+        return [cls.build_collection_summary(collection, fields=fields) for collection in result]
 
     @classmethod
     async def update_collection(cls, slug: str, payload: CollectionTitleIn, user: User) -> CollectionOut:
-        query = {"slug": slug, "owner_id": user.username}
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+        update = {"$set": {"title": payload.title, "updated_at": datetime.now(tz=pytz.UTC)}}
+        result = await CollectionModel.get_motor_collection().update_one(query, update)
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Collection not found")
+
+        collection = await cls.get_collection_by_slug(slug=slug)
+        published_feed.replace(collection)
+        return collection
+
+    @classmethod
+    async def find_items_state(cls, slug: str, user: User) -> dict:
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+        item = await CollectionModel.get_motor_collection().find_one(query, projection={"items_moved_at": 1})
+        if item is None:
+            raise HTTPException(status_code=404, detail="Collection not found")
+        return item
+
+    @classmethod
+    async def add_bookmark_to_collection(cls, slug: str, bookmark_slug: str, user: User) -> CollectionOut:
+        """
+        Appends the bookmark in a single update while the items are embedded, moving them out once there are more than
+        `collection_embedded_items_limit`.
+        """
+        now = datetime.now(tz=pytz.UTC)
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+        collection = CollectionModel.get_motor_collection()
+
+        update = {
+            "items": {"$concatArrays": [{"$ifNull": ["$items", []]}, {"$literal": [bookmark_slug]}]},
+            "item_count": {"$add": [item_count_expression, 1]},
+            "updated_at": now,
+        }
+        item = await collection.find_one_and_update(
+            {**query, "items_moved_at": None, "items": {"$ne": bookmark_slug}},
+            [{"$set": update}],
+            projection={"item_count": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if item is not None:
+            if item.get("item_count") > api_settings.collection_embedded_items_limit:
+                await cls.move_items(slug=slug)
+        else:
+            state = await cls.find_items_state(slug=slug, user=user)
+            if state.get("items_moved_at") is None:
+                raise HTTPException(status_code=400, detail="Bookmark already in collection")
+
+            last = (
+                await CollectionItem.find({"collection_slug": slug, "deleted_at": None})
+                .sort([("position", -1), ("bookmark_slug", -1)])
+                .first_or_none()
+            )
+            position = position_between(last.position if last else None, None)
+            try:
+                await CollectionItem(
+                    collection_slug=slug, bookmark_slug=bookmark_slug, owner_id=user.username, position=position
+                ).insert()
+            except DuplicateKeyError:
+                raise HTTPException(status_code=400, detail="Bookmark already in collection")
+
+            # Only shows up in the first few when there are fewer than those
+            update = {
+                "items": {
+                    "$slice": [
+                        {"$concatArrays": ["$items", {"$literal": [bookmark_slug]}]},
+                        api_settings.collection_item_preview_size,
+                    ]
+                },
+                "item_count": {"$add": ["$item_count", 1]},
+                "updated_at": now,
+            }
+            await collection.update_one(query, [{"$set": update}])
+
+        collection = await cls.get_collection_by_slug(slug=slug)
+        published_feed.replace(collection)
+        return collection
+
+    @classmethod
+    async def remove_bookmark_from_collection(cls, slug: str, bookmark_slug: str, user: User) -> CollectionOut:
+        now = datetime.now(tz=pytz.UTC)
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+        collection = CollectionModel.get_motor_collection()
+
+        update = {
+            "items": {"$filter": {"input": "$items", "cond": {"$ne": ["$$this", {"$literal": bookmark_slug}]}}},
+            "item_count": {"$subtract": [item_count_expression, 1]},
+            "updated_at": now,
+        }
+        result = await collection.update_one(
+            {**query, "items_moved_at": None, "items": bookmark_slug}, [{"$set": update}]
+        )
+        if result.matched_count == 0:
+            state = await cls.find_items_state(slug=slug, user=user)
+            if state.get("items_moved_at") is None:
+                raise HTTPException(status_code=404, detail="Bookmark not in collection")
+
+            item = await CollectionItem.find_one(
+                {"collection_slug": slug, "bookmark_slug": bookmark_slug, "deleted_at": None}
+            ).update({"$set": {"deleted_at": now, "updated_at": now}}, response_type=UpdateResponse.NEW_DOCUMENT)
+            if item is None:
+                raise HTTPException(status_code=404, detail="Bookmark not in collection")
+
+            await collection.update_one(query, {"$inc": {"item_count": -1}, "$set": {"updated_at": now}})
+            await cls.refresh_item_preview(slug=slug)
+
+        collection = await cls.get_collection_by_slug(slug=slug)
+        published_feed.replace(collection)
+        return collection
+
+    @classmethod
+    async def move_item(cls, slug: str, bookmark_slug: str, after: str | None, user: User) -> CollectionOut:
+        """
+        Moves the bookmark right after the `after` one, or to the top. Embedded items are moved in a single update,
+        moved out ones get a position between their new neighbours so no other item is rewritten.
+        """
+        if after == bookmark_slug:
+            raise HTTPException(status_code=400, detail="Bookmark can't be moved after itself")
+
+        now = datetime.now(tz=pytz.UTC)
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+        collection = CollectionModel.get_motor_collection()
+
+        rest = {"$filter": {"input": "$items", "cond": {"$ne": ["$$this", {"$literal": bookmark_slug}]}}}
+        if after is None:
+            items = {"$concatArrays": [{"$literal": [bookmark_slug]}, rest]}
+        else:
+            at = {"$add": [{"$indexOfArray": ["$$rest", {"$literal": after}]}, 1]}
+            items = {
+                "$let": {
+                    "vars": {"rest": rest},
+                    "in": {
+                        "$let": {
+                            "vars": {"at": at},
+                            "in": {
+                                "$concatArrays": [
+                                    {"$slice": ["$$rest", "$$at"]},
+                                    {"$literal": [bookmark_slug]},
+                                    {"$slice": ["$$rest", "$$at", {"$max": [{"$size": "$$rest"}, 1]}]},
+                                ]
+                            },
+                        }
+                    },
+                }
+            }
+        moved = [bookmark_slug] if after is None else [bookmark_slug, after]
+        result = await collection.update_one(
+            {**query, "items_moved_at": None, "items": {"$all": moved}},
+            [{"$set": {"items": items, "updated_at": now}}],
+        )
+        if result.matched_count == 0:
+            state = await cls.find_items_state(slug=slug, user=user)
+            if state.get("items_moved_at") is None:
+                raise HTTPException(status_code=404, detail="Bookmark not in collection")
+
+            await cls.move_moved_item(slug=slug, bookmark_slug=bookmark_slug, after=after)
+            await collection.update_one(query, {"$set": {"updated_at": now}})
+            await cls.refresh_item_preview(slug=slug)
+
+        collection = await cls.get_collection_by_slug(slug=slug)
+        published_feed.replace(collection)
+        return collection
+
+    @classmethod
+    async def move_moved_item(cls, slug: str, bookmark_slug: str, after: str | None) -> None:
+        live = {"collection_slug": slug, "deleted_at": None}
+        item = await CollectionItem.find_one({**live, "bookmark_slug": bookmark_slug})
+        if item is None:
+            raise HTTPException(status_code=404, detail="Bookmark not in collection")
+
+        previous = None
+        following_query = {**live, "bookmark_slug": {"$ne": bookmark_slug}}
+        if after is not None:
+            previous = await CollectionItem.find_one({**live, "bookmark_slug": after})
+            if previous is None:
+                raise HTTPException(status_code=404, detail="Bookmark not in collection")
+
+            following_query["$or"] = [
+                {"position": {"$gt": previous.position}},
+                {"position": previous.position, "bookmark_slug": {"$gt": after}},
+            ]
+
+        following = (
+            await CollectionItem.find(following_query).sort([("position", 1), ("bookmark_slug", 1)]).first_or_none()
+        )
+        position = position_between(previous.position if previous else None, following.position if following else None)
+        if position is None:
+            await cls.renumber_items(slug=slug)
+            return await cls.move_moved_item(slug=slug, bookmark_slug=bookmark_slug, after=after)
+
+        now = datetime.now(tz=pytz.UTC)
+        await CollectionItem.find_one({"_id": item.id}).update({"$set": {"position": position, "updated_at": now}})
+
+    @classmethod
+    async def renumber_items(cls, slug: str) -> None:
+        """
+        Spreads the positions of the items back out once moves wore a gap down to nothing, rare enough to rewrite them
+        all.
+        """
+        pipeline = [
+            {"$match": {"collection_slug": slug, "deleted_at": {"$eq": None}}},
+            {"$sort": {"position": 1, "bookmark_slug": 1}},
+            {"$project": {"_id": 1}},
+        ]
+        items = await CollectionItem.aggregate(pipeline).to_list(length=None)
+        requests = [UpdateOne({"_id": x.get("_id")}, {"$set": {"position": float(i + 1)}}) for i, x in enumerate(items)]
+        if requests:
+            await CollectionItem.get_motor_collection().bulk_write(requests, ordered=False)
+
+    @classmethod
+    async def reorder_items(cls, slug: str, items: List[str], user: User) -> CollectionOut:
+        """
+        Puts every item of the collection in the order of `items`, which has to hold exactly the bookmarks already in
+        it. Moved out items only rewrite the ones whose position changed.
+        """
+        now = datetime.now(tz=pytz.UTC)
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+        collection = CollectionModel.get_motor_collection()
+        invalid = HTTPException(status_code=400, detail="Items must be the bookmarks in the collection")
+        if len(set(items)) != len(items):
+            raise invalid
+
+        current = {"$ifNull": ["$items", []]}
+        same_items = {
+            "$and": [
+                {"$setEquals": [current, {"$literal": items}]},
+                {"$eq": [{"$size": current}, len(items)]},
+            ]
+        }
+        result = await collection.update_one(
+            {**query, "items_moved_at": None, "$expr": same_items},
+            {"$set": {"items": items, "item_count": len(items), "updated_at": now}},
+        )
+        if result.matched_count == 0:
+            state = await cls.find_items_state(slug=slug, user=user)
+            if state.get("items_moved_at") is None:
+                raise invalid
+
+            pipeline = [
+                {"$match": {"collection_slug": slug, "deleted_at": {"$eq": None}}},
+                {"$project": {"bookmark_slug": 1, "position": 1}},
+            ]
+            stored = {x.get("bookmark_slug"): x for x in await CollectionItem.aggregate(pipeline).to_list(None)}
+            if stored.keys() != set(items):
+                raise invalid
+
+            requests = [
+                UpdateOne({"_id": stored[x].get("_id")}, {"$set": {"position": float(i + 1), "updated_at": now}})
+                for i, x in enumerate(items)
+                if stored[x].get("position") != float(i + 1)
+            ]
+            if requests:
+                await CollectionItem.get_motor_collection().bulk_write(requests, ordered=False)
+            await collection.update_one(query, {"$set": {"updated_at": now}})
+            await cls.refresh_item_preview(slug=slug)
+
+        collection = await cls.get_collection_by_slug(slug=slug)
+        published_feed.replace(collection)
+        return collection
+
+    @classmethod
+    async def get_items(
+        cls, slug: str, cursor: str | None = None, limit: int = 10, user: User | UserView | None = None
+    ) -> CollectionItemPageOut:
+        """
+        Bookmark slugs of the collection in order, in `(position, slug)` keyset pages. Collections of others have to
+        be published. Embedded items are at positions 1, 2, 3... which is also where they land when moved out.
+        """
+        query = {"slug": slug, "deleted_at": None, "published_at": {"$type": "date"}}
+        if user:
+            query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+
+        start, after = 0, None
+        if cursor is not None:
+            position, after = decode_position_cursor(cursor)
+            start = max(int(position), 0)
+
+        projection = {"items_moved_at": 1, "items": {"$slice": [start, limit]}}
+        item = await CollectionModel.get_motor_collection().find_one(query, projection=projection)
+        if item is None:
+            raise HTTPException(status_code=404, detail="Collection not found")
+
+        if item.get("items_moved_at") is None:
+            items = item.get("items") or []
+            next_cursor = None
+            if len(items) == limit:
+                next_cursor = encode_position_cursor(position=float(start + limit), slug=items[-1])
+            return CollectionItemPageOut(items=items, next_cursor=next_cursor)
+
+        match = {"collection_slug": slug, "deleted_at": {"$eq": None}}
+        if cursor is not None:
+            match["$or"] = [
+                {"position": {"$gt": position}},
+                {"position": position, "bookmark_slug": {"$gt": after}},
+            ]
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"position": 1, "bookmark_slug": 1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "bookmark_slug": 1, "position": 1}},
+        ]
+        result = await CollectionItem.aggregate(pipeline).to_list(length=limit)
+
+        next_cursor = None
+        if len(result) == limit:
+            last = result[-1]
+            next_cursor = encode_position_cursor(position=last.get("position"), slug=last.get("bookmark_slug"))
+
+        return CollectionItemPageOut(items=[x.get("bookmark_slug") for x in result], next_cursor=next_cursor)
+
+    @classmethod
+    async def refresh_item_preview(cls, slug: str) -> None:
+        pipeline = [
+            {"$match": {"collection_slug": slug, "deleted_at": {"$eq": None}}},
+            {"$sort": {"position": 1, "bookmark_slug": 1}},
+            {"$limit": api_settings.collection_item_preview_size},
+            {"$project": {"_id": 0, "bookmark_slug": 1}},
+        ]
+        items = await CollectionItem.aggregate(pipeline).to_list(length=None)
+        await CollectionModel.get_motor_collection().update_one(
+            {"slug": slug}, {"$set": {"items": [x.get("bookmark_slug") for x in items]}}
+        )
+
+    @classmethod
+    async def move_items(cls, slug: str) -> None:
+        """
+        Copies the embedded items of the collection to `CollectionItem` and keeps only the first few in the
+        collection. The swap only goes through when the items did not change since they were copied, otherwise it
+        starts over. Idempotent, so it also moves items of collections saved before items had a limit.
+        """
+        collection = CollectionModel.get_motor_collection()
+        while True:
+            item = await collection.find_one(
+                {"slug": slug, "deleted_at": None, "items_moved_at": None}, projection={"items": 1, "owner_id": 1}
+            )
+            if item is None:
+                return
+
+            stored_items = item.get("items") or []
+            items = list(dict.fromkeys(stored_items))
+            now = datetime.now(tz=pytz.UTC)
+
+            # Leftovers of an earlier attempt that lost against a bookmark being removed
+            await CollectionItem.find({"collection_slug": slug, "bookmark_slug": {"$nin": items}}).delete()
+            requests = [
+                UpdateOne(
+                    {"collection_slug": slug, "bookmark_slug": x, "deleted_at": None},
+                    {
+                        "$set": {"position": float(i + 1)},
+                        "$setOnInsert": {"owner_id": item.get("owner_id"), "created_at": now, "updated_at": None},
+                    },
+                    upsert=True,
+                )
+                for i, x in enumerate(items)
+            ]
+            if requests:
+                await CollectionItem.get_motor_collection().bulk_write(requests, ordered=False)
+
+            update = {
+                "$set": {
+                    "items": items[: api_settings.collection_item_preview_size],
+                    "item_count": len(items),
+                    "items_moved_at": now,
+                    "updated_at": now,
+                }
+            }
+            result = await collection.update_one(
+                {"_id": item.get("_id"), "items_moved_at": None, "items": stored_items}, update
+            )
+            if result.matched_count > 0:
+                return
+
+    @classmethod
+    async def remove_bookmark_everywhere(cls, bookmark_slug: str, now: datetime) -> None:
+        """
+        Drops the dangling references to a deleted bookmark. Embedded ones are found by the multikey index on `items`.
+        """
+        update = {
+            "items": {"$filter": {"input": "$items", "cond": {"$ne": ["$$this", {"$literal": bookmark_slug}]}}},
+            "item_count": {"$subtract": [item_count_expression, 1]},
+            "updated_at": now,
+        }
+        await CollectionModel.get_motor_collection().update_many(
+            {"items": bookmark_slug, "deleted_at": None, "items_moved_at": None}, [{"$set": update}]
+        )
+
+        pipeline = [
+            {"$match": {"bookmark_slug": bookmark_slug, "deleted_at": {"$eq": None}}},
+            {"$project": {"collection_slug": 1}},
+        ]
+        items = await CollectionItem.aggregate(pipeline).to_list(length=None)
+        if not items:
+            return
+
+        await CollectionItem.find({"_id": {"$in": [x.get("_id") for x in items]}}).update(
+            {"$set": {"deleted_at": now, "updated_at": now}}
+        )
+        for slug in {x.get("collection_slug") for x in items}:
+            await CollectionModel.get_motor_collection().update_one(
+                {"slug": slug}, {"$inc": {"item_count": -1}, "$set": {"updated_at": now}}
+            )
+            await cls.refresh_item_preview(slug=slug)
+
+    @classmethod
+    async def delete_collection(cls, slug: str, user: User) -> None:
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
         item = await CollectionModel.find_one(query)
         if not item:
             raise HTTPException(status_code=404, detail="Collection not found")
 
-        item.title = payload.title
+        now = datetime.now(tz=pytz.UTC)
+        item.deleted_at = now
         await item.save()
+        await CollectionComment.find({"collection_slug": slug, "deleted_at": None}).update(
+            {"$set": {"deleted_at": now, "updated_at": now}}
+        )
+        await CollectionItem.find({"collection_slug": slug, "deleted_at": None}).update(
+            {"$set": {"deleted_at": now, "updated_at": now}}
+        )
+        if item.is_published:
+            await User.increment_stats(username=user.username, published_collections=-1)
+            published_feed.remove(slug=slug)
 
-        return await cls.get_collection_by_slug(slug=slug)
+    @classmethod
+    async def find_published(cls, slugs: List[str]) -> List[CollectionOut]:
+        pipeline = [
+            {
+                "$match": {
+                    "slug": {"$in": list(set(slugs))},
+                    "published_at": {"$type": "date"},
+                    "deleted_at": {"$eq": None},
+                }
+            },
+            item_preview_stage(),
+            {
+                "$lookup": {
+                    "from": "users",
+                    "localField": "owner_id",
+                    "foreignField": "username",
+                    "as": "owner",
+                }
+            },
+            {"$unwind": "$owner"},
+        ]
+        result = await CollectionModel.aggregate(pipeline).to_list(length=None)
+        return [cls.build_collection_response(collection) for collection in result]
 
     @classmethod
-    async def add_bookmark_to_collection(cls, slug: str, bookmark_slug: str, user: User) -> CollectionOut:
-        query = {"slug": slug, "owner_id": user.username}
+    async def get_published_collections(
+        cls, username: str | None = None, skip: int = 0, limit: int = 10
+    ) -> List[CollectionOut]:
+        match = {"published_at": {"$type": "date"}, "deleted_at": {"$eq": None}}
+        if username:
+            match = {"owner_id": username, **match}
+
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"published_at": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            item_preview_stage(),
+            {
+                "$lookup": {
+                    "from": "users",
+                    "localField": "owner_id",
+                    "foreignField": "username",
+                    "as": "owner",
+                }
+            },
+            {"$unwind": "$owner"},
+        ]
+        result = await CollectionModel.aggregate(pipeline).to_list(length=limit)
+        return [cls.build_collection_response(collection) for collection in result]
+
+    @classmethod
+    async def on_change(cls, event: InvalidationEvent) -> None:
+        """
+        Change stream subscriber for `collections` and `users`, drops the published feed when something it shows changed
+        on any worker. New documents can't be in the feed yet, collections are always created unpublished. Other writes
+        only drop it when they touch a collection in the window or its owner, looked up by `_id`.
+        """
+        if event.operation == "insert" or published_feed.is_stale:
+            return
+
+        if event.collection == "users":
+            if not event.touches("name", "picture", "username", "deleted_at"):
+                return
+            # The window only knows the new username once it reloads
+            if event.document_id is None or event.touches("username"):
+                published_feed.invalidate()
+                return
+
+            user = await User.get_motor_collection().find_one({"_id": event.document_id}, projection={"username": 1})
+            if user is not None and published_feed.has_owner(user.get("username")):
+                published_feed.invalidate()
+            return
+
+        if not event.touches("title", "items", "item_count", "published_at", "deleted_at", "owner_id"):
+            return
+        # Published elsewhere, or replaced or deleted without the changed fields
+        if event.document_id is None or event.touches("published_at"):
+            published_feed.invalidate()
+            return
+
+        collection = await CollectionModel.get_motor_collection().find_one(
+            {"_id": event.document_id}, projection={"slug": 1}
+        )
+        if collection is not None and published_feed.contains(collection.get("slug")):
+            published_feed.invalidate()
+
+    @classmethod
+    async def get_recently_published(cls, skip: int = 0, limit: int = 10) -> List[CollectionOut]:
+        collections = await published_feed.page(skip=skip, limit=limit)
+        if collections is None:
+            collections = await cls.get_published_collections(skip=skip, limit=limit)
+
+        return collections
+
+    @classmethod
+    async def publish_collection(cls, slug: str, user: User) -> CollectionOut:
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
         item = await CollectionModel.find_one(query)
         if not item:
             raise HTTPException(status_code=404, detail="Collection not found")
 
-        if bookmark_slug in item.items:
-            raise HTTPException(status_code=400, detail="Bookmark already in collection")
+        if not item.is_published:
+            await item.publish()
+            await User.increment_stats(username=user.username, published_collections=1)
+            await Timeline.fan_out(kind="collection", slug=slug, actor_id=user.username, created_at=item.published_at)
 
-        item.items.append(bookmark_slug)
-        await item.save()
+        collection = await cls.get_collection_by_slug(slug=slug)
+        published_feed.add(collection)
+        return collection
+
+    @classmethod
+    async def unpublish_collection(cls, slug: str, user: User) -> CollectionOut:
+        query = {"slug": slug, "owner_id": user.username, "deleted_at": None}
+        item = await CollectionModel.find_one(query)
+        if not item:
+            raise HTTPException(status_code=404, detail="Collection not found")
+
+        if item.is_published:
+            await item.unpublish()
+            await User.increment_stats(username=user.username, published_collections=-1)
+            published_feed.remove(slug=slug)
 
         return await cls.get_collection_by_slug(slug=slug)
+
+
+published_feed = PublishedFeed(
+    size=api_settings.published_feed_size,
+    refresh_in_seconds=api_settings.published_feed_refresh_in_seconds,
+    loader=lambda limit: Collection.get_published_collections(limit=limit),
+)
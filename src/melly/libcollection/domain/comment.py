@@ -0,0 +1,170 @@
+from datetime import datetime
+from typing import List
+
+import pytz
+from fastapi import HTTPException
+
+from melly.libaccount.models import User
+from melly.libcollection.models import (
+    Collection as CollectionModel,
+    CollectionComment,
+    CollectionCommentIn,
+    CollectionCommentOut,
+    CollectionCommentPageOut,
+    CollectionCommentThreadOut,
+    CollectionCommentContentIn,
+)
+from melly.libshared.cursor import encode_cursor, after_cursor_query
+from melly.libshared.slug import generate_id, insert_with_unique_slug
+
+author_lookup = [
+    {
+        "$lookup": {
+            "from": "users",
+            "localField": "author_id",
+            "foreignField": "username",
+            "as": "author",
+        }
+    },
+    {"$unwind": "$author"},
+]
+
+
+class Comment:
+    @classmethod
+    def build_comment_response(cls, comment: dict) -> CollectionCommentOut:
+        author_name = comment.get("author").get("name")
+        author_picture = comment.get("author").get("picture")
+
+        return CollectionCommentOut(**comment, author_name=author_name, author_picture=author_picture)
+
+    @classmethod
+    async def ensure_collection_is_published(cls, slug: str) -> None:
+        query = {"slug": slug, "published_at": {"$type": "date"}, "deleted_at": None}
+        if await CollectionModel.find(query).count() == 0:
+            raise HTTPException(status_code=404, detail="Collection not found")
+
+    @classmethod
+    async def get_comment_by_slug(cls, slug: str) -> CollectionCommentOut:
+        pipeline = [{"$match": {"slug": slug, "deleted_at": {"$eq": None}}}, *author_lookup]
+        result = await CollectionComment.aggregate(pipeline).to_list(length=1)
+        if len(result) == 0:
+            raise HTTPException(status_code=404, detail="Comment not found")
+
+        return cls.build_comment_response(result[0])
+
+    @classmethod
+    async def create_comment(
+        cls, collection_slug: str, payload: CollectionCommentIn, user: User
+    ) -> CollectionCommentOut:
+        await cls.ensure_collection_is_published(slug=collection_slug)
+
+        if payload.parent_comment_slug:
+            query = {"slug": payload.parent_comment_slug, "collection_slug": collection_slug, "deleted_at": None}
+            result = await CollectionComment.find_one(query).update({"$inc": {"reply_count": 1}})
+            if result.matched_count == 0:
+                raise HTTPException(status_code=404, detail="Parent comment not found")
+
+        comment = CollectionComment(
+            content=payload.content,
+            author_id=user.username,
+            collection_slug=collection_slug,
+            slug=generate_id(),
+            parent_comment_slug=payload.parent_comment_slug,
+        )
+        await insert_with_unique_slug(comment)
+
+        return await cls.get_comment_by_slug(slug=comment.slug)
+
+    @classmethod
+    async def get_comments(
+        cls, collection_slug: str, cursor: str | None = None, limit: int = 10
+    ) -> CollectionCommentPageOut:
+        await cls.ensure_collection_is_published(slug=collection_slug)
+
+        match = {
+            "collection_slug": collection_slug,
+            "parent_comment_slug": None,
+            "deleted_at": {"$eq": None},
+            **after_cursor_query(cursor),
+        }
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"created_at": 1, "slug": 1}},
+            {"$limit": limit},
+            *author_lookup,
+        ]
+        result = await CollectionComment.aggregate(pipeline).to_list(length=limit)
+        comments = [cls.build_comment_response(x) for x in result]
+
+        next_cursor = None
+        if len(result) == limit:
+            last = result[-1]
+            next_cursor = encode_cursor(created_at=last.get("created_at"), slug=last.get("slug"))
+
+        return CollectionCommentPageOut(comments=comments, next_cursor=next_cursor)
+
+    @classmethod
+    async def get_thread(cls, collection_slug: str) -> List[CollectionCommentThreadOut]:
+        await cls.ensure_collection_is_published(slug=collection_slug)
+
+        # The whole tree in one indexed query, linked up in memory in two linear passes
+        pipeline = [
+            {"$match": {"collection_slug": collection_slug, "deleted_at": {"$eq": None}}},
+            {"$sort": {"created_at": 1, "slug": 1}},
+            *author_lookup,
+        ]
+        result = await CollectionComment.aggregate(pipeline).to_list(length=None)
+
+        nodes = {}
+        for comment in result:
+            node = CollectionCommentThreadOut(
+                **comment,
+                author_name=comment.get("author").get("name"),
+                author_picture=comment.get("author").get("picture"),
+            )
+            nodes[node.slug] = node
+
+        roots = []
+        for node in nodes.values():
+            if node.parent_comment_slug is None:
+                roots.append(node)
+            elif node.parent_comment_slug in nodes:
+                nodes[node.parent_comment_slug].replies.append(node)
+            # Replies whose parent was deleted go away together with it
+
+        return roots
+
+    @classmethod
+    async def update_comment(
+        cls, collection_slug: str, slug: str, payload: CollectionCommentContentIn, user: User
+    ) -> CollectionCommentOut:
+        query = {"slug": slug, "collection_slug": collection_slug, "author_id": user.username, "deleted_at": None}
+        comment = await CollectionComment.find_one(query)
+        if not comment:
+            raise HTTPException(status_code=404, detail="Comment not found")
+
+        comment.content = payload.content
+        await comment.save()
+
+        return await cls.get_comment_by_slug(slug=slug)
+
+    @classmethod
+    async def delete_comment(cls, collection_slug: str, slug: str, user: User) -> None:
+        query = {"slug": slug, "collection_slug": collection_slug, "deleted_at": None}
+        comment = await CollectionComment.find_one(query)
+        if not comment:
+            raise HTTPException(status_code=404, detail="Comment not found")
+
+        if comment.author_id != user.username:
+            # Collection owners moderate the comments on their collections
+            query = {"slug": collection_slug, "owner_id": user.username, "deleted_at": None}
+            if await CollectionModel.find(query).count() == 0:
+                raise HTTPException(status_code=404, detail="Comment not found")
+
+        comment.deleted_at = datetime.now(tz=pytz.UTC)
+        await comment.save()
+
+        if comment.parent_comment_slug:
+            query = {"slug": comment.parent_comment_slug, "collection_slug": collection_slug, "deleted_at": None}
+            await CollectionComment.find_one(query).update({"$inc": {"reply_count": -1}})
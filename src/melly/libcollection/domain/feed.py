@@ -0,0 +1,94 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, List
+
+from melly.libcollection.models import CollectionOut
+
+
+class PublishedFeed:
+    """
+    In-memory window of the newest published collections, ordered by `published_at` descending.
+
+    The window is loaded once from Mongo and then kept current by publish/unpublish/update/delete on this worker. Writes
+    made by other workers invalidate it through the change stream (see `Collection.on_change`), reloading every
+    `refresh_in_seconds` is the safety net for when the stream is down. Pages that fall outside the window return
+    `None` so the caller can fall back to an indexed query.
+    """
+
+    def __init__(self, size: int, refresh_in_seconds: int, loader: Callable[[int], Awaitable[List[CollectionOut]]]):
+        self.size = size
+        self.refresh_in_seconds = refresh_in_seconds
+        self.loader = loader
+
+        self._items: List[CollectionOut] = []
+        # True when the window holds every published collection, so a short page is genuinely the end of the feed
+        self._complete = False
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_in_seconds
+
+    async def load(self) -> None:
+        async with self._lock:
+            if not self.is_stale:
+                return
+
+            items = await self.loader(self.size)
+            self._items = items
+            self._complete = len(items) < self.size
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    async def page(self, skip: int, limit: int) -> List[CollectionOut] | None:
+        if self.is_stale:
+            await self.load()
+
+        if skip + limit > len(self._items) and not self._complete:
+            return None
+
+        return self._items[skip : skip + limit]
+
+    def add(self, collection: CollectionOut) -> None:
+        if self._loaded_at is None or collection.published_at is None:
+            return
+
+        self.remove(slug=collection.slug)
+
+        index = 0
+        while index < len(self._items) and self._items[index].published_at > collection.published_at:
+            index += 1
+
+        if index >= self.size or (index == len(self._items) and not self._complete):
+            # Older than everything in a partial window, there may be unseen collections in between
+            return
+
+        self._items.insert(index, collection)
+        if len(self._items) > self.size:
+            self._items.pop()
+            self._complete = False
+
+    def replace(self, collection: CollectionOut) -> None:
+        if collection.published_at is None:
+            self.remove(slug=collection.slug)
+            return
+
+        for index, item in enumerate(self._items):
+            if item.slug == collection.slug:
+                self._items[index] = collection
+                return
+
+    def contains(self, slug: str) -> bool:
+        return any(x.slug == slug for x in self._items)
+
+    def has_owner(self, owner_id: str) -> bool:
+        return any(x.owner_id == owner_id for x in self._items)
+
+    def remove(self, slug: str) -> None:
+        self._items = [x for x in self._items if x.slug != slug]
+
+    def remove_owner(self, owner_id: str) -> None:
+        self._items = [x for x in self._items if x.owner_id != owner_id]
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from typing import Dict
+
+import pytz
+
+from melly.libcollection.models import BookmarkItem, LinkMetadata, LinkMetadataCache
+from melly.libshared.linkmetadata import LinkMetadataFetcher
+from melly.libshared.settings import api_settings
+
+
+class BookmarkMetadata:
+    @classmethod
+    async def enrich(cls, item: BookmarkItem) -> None:
+        """
+        Fills in the metadata of a freshly saved bookmark. Pages seen before are served from the shared cache right
+        away, anything else is queued for the background fetcher.
+        """
+        if item.url_hash is None or not api_settings.link_metadata_enabled:
+            return
+
+        cached = await LinkMetadataCache.find_one({"url_hash": item.url_hash})
+        if cached is None:
+            metadata_fetcher.enqueue(url=str(item.url), key=item.url_hash)
+            return
+
+        if cached.metadata is not None:
+            await cls.apply(url_hash=item.url_hash, metadata=cached.metadata)
+
+    @classmethod
+    async def apply(cls, url_hash: str, metadata: LinkMetadata) -> None:
+        # Every bookmark of the page saved while it was being fetched, served by the index on `url_hash`
+        query = {"url_hash": url_hash, "metadata": None, "deleted_at": None}
+        await BookmarkItem.find(query).update(
+            {"$set": {"metadata": metadata.model_dump(), "updated_at": datetime.now(tz=pytz.UTC)}}
+        )
+
+    @classmethod
+    async def store(cls, url: str, url_hash: str, metadata: Dict[str, str | None] | None) -> None:
+        ttl = api_settings.link_metadata_cache_ttl_in_seconds
+        if metadata is None:
+            # Failures are remembered for a shorter while so broken pages aren't fetched over and over
+            ttl = api_settings.link_metadata_failure_ttl_in_seconds
+
+        now = datetime.now(tz=pytz.UTC)
+        entry = LinkMetadataCache(
+            url_hash=url_hash,
+            url=url,
+            metadata=LinkMetadata(**metadata) if metadata else None,
+            fetched_at=now,
+            expires_at=now + timedelta(seconds=ttl),
+        )
+        await LinkMetadataCache.get_motor_collection().update_one(
+            {"url_hash": url_hash}, {"$set": entry.model_dump(exclude={"id", "revision_id"})}, upsert=True
+        )
+
+        if entry.metadata is not None:
+            await cls.apply(url_hash=url_hash, metadata=entry.metadata)
+
+
+metadata_fetcher = LinkMetadataFetcher(
+    on_fetched=BookmarkMetadata.store,
+    workers=api_settings.link_metadata_workers,
+    queue_size=api_settings.link_metadata_queue_size,
+    per_host_limit=api_settings.link_metadata_per_host_limit,
+    timeout_in_seconds=api_settings.link_metadata_timeout_in_seconds,
+    max_bytes=api_settings.link_metadata_max_bytes,
+    allow_private_hosts=api_settings.link_metadata_allow_private_hosts,
+)
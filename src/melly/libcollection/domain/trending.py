@@ -0,0 +1,125 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+import pytz
+from pymongo import UpdateOne
+
+from melly.libcollection.models import (
+    TrendingCounter,
+    TrendingKind,
+    TrendingOut,
+    TrendingTagOut,
+    TrendingUrlOut,
+    TrendingWindow,
+)
+from melly.libshared.constants import TRENDING_WINDOWS
+from melly.libshared.settings import api_settings
+
+
+def bucket_start(at: datetime) -> datetime:
+    seconds = api_settings.trending_bucket_in_seconds
+    return datetime.fromtimestamp(int(at.timestamp()) // seconds * seconds, tz=pytz.UTC)
+
+
+class TrendingTopK:
+    """
+    The latest top `size` pages and tags of each window. A window is recomputed by `loader` once it is older than
+    `refresh_in_seconds`, requests in between are served from memory.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        refresh_in_seconds: int,
+        loader: Callable[[TrendingWindow, int], Awaitable[TrendingOut]],
+    ):
+        self.size = size
+        self.refresh_in_seconds = refresh_in_seconds
+        self.loader = loader
+
+        self._results: Dict[str, TrendingOut] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._locks = {x: asyncio.Lock() for x in TRENDING_WINDOWS}
+
+    def is_stale(self, window: TrendingWindow) -> bool:
+        loaded_at = self._loaded_at.get(window)
+        return loaded_at is None or time.monotonic() - loaded_at > self.refresh_in_seconds
+
+    async def get(self, window: TrendingWindow) -> TrendingOut:
+        if self.is_stale(window):
+            # One aggregation per window however many requests arrive while it runs
+            async with self._locks[window]:
+                if self.is_stale(window):
+                    self._results[window] = await self.loader(window, self.size)
+                    self._loaded_at[window] = time.monotonic()
+        return self._results[window]
+
+    def invalidate(self) -> None:
+        self._loaded_at.clear()
+
+
+class Trending:
+    @classmethod
+    async def count(cls, tags: Iterable[str], url_hash: str | None = None, url: str | None = None) -> None:
+        """
+        Counts a save of `url` and a use of each of `tags` in the current bucket, in one bulk write.
+        """
+        counts = [("tag", x, x) for x in dict.fromkeys(x.strip() for x in tags) if x]
+        if url_hash is not None:
+            counts.append(("url", url_hash, url))
+        if not counts:
+            return
+
+        bucket = bucket_start(datetime.now(tz=pytz.UTC))
+        expires_at = bucket + timedelta(
+            seconds=max(TRENDING_WINDOWS.values()) + api_settings.trending_bucket_in_seconds
+        )
+        requests = [
+            UpdateOne(
+                {"kind": kind, "key": key, "bucket": bucket},
+                {"$inc": {"total": 1}, "$setOnInsert": {"label": label, "expires_at": expires_at}},
+                upsert=True,
+            )
+            for kind, key, label in counts
+        ]
+        await TrendingCounter.get_motor_collection().bulk_write(requests, ordered=False)
+
+    @classmethod
+    async def top(cls, kind: TrendingKind, since: datetime, limit: int) -> List[dict]:
+        pipeline = [
+            {"$match": {"kind": kind, "bucket": {"$gte": since}}},
+            {"$group": {"_id": "$key", "label": {"$first": "$label"}, "count": {"$sum": "$total"}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": limit},
+        ]
+        return await TrendingCounter.aggregate(pipeline).to_list(length=None)
+
+    @classmethod
+    async def load(cls, window: TrendingWindow, size: int) -> TrendingOut:
+        """
+        Adds up the buckets of the last `window`, the oldest one may have started up to a bucket earlier.
+        """
+        now = datetime.now(tz=pytz.UTC)
+        since = bucket_start(now - timedelta(seconds=TRENDING_WINDOWS[window]))
+        urls = await cls.top(kind="url", since=since, limit=size)
+        tags = await cls.top(kind="tag", since=since, limit=size)
+        return TrendingOut(
+            window=window,
+            urls=[TrendingUrlOut(url=x.get("label"), count=x.get("count")) for x in urls],
+            tags=[TrendingTagOut(tag=x.get("label"), count=x.get("count")) for x in tags],
+            refreshed_at=now,
+        )
+
+    @classmethod
+    async def get_trending(cls, window: TrendingWindow, limit: int = 10) -> TrendingOut:
+        trending = await trending_top_k.get(window)
+        return trending.model_copy(update={"urls": trending.urls[:limit], "tags": trending.tags[:limit]})
+
+
+trending_top_k = TrendingTopK(
+    size=api_settings.trending_size,
+    refresh_in_seconds=api_settings.trending_refresh_in_seconds,
+    loader=Trending.load,
+)
@@ -1,24 +1,59 @@
 from datetime import datetime
-from typing import List
+from typing import List, Literal
 
 import pytz
-from beanie import Document, before_event, Replace, Update, SaveChanges
-from coolname import generate_slug
+from beanie import Document, before_event, Insert, Save, Replace, Update, SaveChanges
 from pydantic import HttpUrl, Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
+from melly.libshared.constants import NOT_DELETED_FILTER, DELETED_FILTER, PUBLISHED_FILTER
 from melly.libshared.models import BaseDateTimeMeta, BaseMellyAPIModel
+from melly.libshared.slug import generate_id
 
 
 class BookmarkNote(BaseMellyAPIModel):
     content: str
-    slug: str = Field(default_factory=lambda: f"{generate_slug(3)}-{int(datetime.now(tz=pytz.UTC).timestamp())}")
+    slug: str = Field(default_factory=generate_id)
     created_at: datetime | None = Field(default_factory=lambda: datetime.now(tz=pytz.UTC))
+    updated_at: datetime | None = None
 
 
 class BookmarkNoteOut(BaseMellyAPIModel):
     content: str
     slug: str
     created_at: datetime = Field(alias="createdAt")
+    updated_at: datetime | None = Field(None, alias="updatedAt")
+
+
+class BookmarkNotePageOut(BaseMellyAPIModel):
+    notes: List[BookmarkNoteOut] = Field(default_factory=list)
+    next_cursor: str | None = None
+
+
+class LinkMetadata(BaseMellyAPIModel):
+    title: str | None = None
+    description: str | None = None
+    image: str | None = None
+    site_name: str | None = None
+
+
+class LinkMetadataCache(Document):
+    """
+    Metadata fetched for a page, shared by every bookmark of it. `metadata` is `None` when the fetch failed.
+    """
+
+    url_hash: str
+    url: str
+    metadata: LinkMetadata | None = None
+    fetched_at: datetime = Field(default_factory=lambda: datetime.now(tz=pytz.UTC))
+    expires_at: datetime
+
+    class Settings:
+        name = "link-metadata"
+        indexes = [
+            IndexModel([("url_hash", ASCENDING)], unique=True),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
 
 
 class BookmarkItem(Document, BaseDateTimeMeta):
@@ -28,14 +63,82 @@ class BookmarkItem(Document, BaseDateTimeMeta):
     slug: str
     owner_id: str
 
+    # See libshared.url.hash_url, `None` for bookmarks saved before URLs were normalized
+    url_hash: str | None = None
+    # See libshared.url.url_domain, `None` for bookmarks saved before they could be filtered by domain
+    domain: str | None = None
+
+    # Filled in the background once the page was fetched
+    metadata: LinkMetadata | None = None
+
+    # Every note until there are more than `bookmark_embedded_notes_limit`, then only the latest few while the rest
+    # live in `BookmarkItemNote` from `notes_moved_at` on. `note_count` is `None` for bookmarks that never counted
+    # their notes, the length of `notes` then.
     notes: List[BookmarkNote] = Field(default_factory=list)
+    note_count: int | None = None
+    notes_moved_at: datetime | None = None
 
-    @before_event(Replace, Update, SaveChanges)
+    @before_event(Insert, Save, Replace, Update, SaveChanges)
     async def bump_updated_at(self):
         self.updated_at = datetime.now(tz=pytz.UTC)
 
     class Settings:
         name = "bookmark-items"
+        indexes = [
+            IndexModel([("slug", ASCENDING)], unique=True),
+            IndexModel(
+                [("owner_id", ASCENDING), ("created_at", DESCENDING)], partialFilterExpression=NOT_DELETED_FILTER
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("url_hash", ASCENDING)],
+                unique=True,
+                partialFilterExpression={**NOT_DELETED_FILTER, "url_hash": {"$type": "string"}},
+            ),
+            IndexModel([("url_hash", ASCENDING)], partialFilterExpression=NOT_DELETED_FILTER),
+            # Listing filters, sorting by `updated_at` without a filter is served by the sync index below
+            IndexModel(
+                [("owner_id", ASCENDING), ("tags", ASCENDING), ("created_at", DESCENDING)],
+                partialFilterExpression=NOT_DELETED_FILTER,
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("tags", ASCENDING), ("updated_at", DESCENDING)],
+                partialFilterExpression=NOT_DELETED_FILTER,
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("domain", ASCENDING), ("created_at", DESCENDING)],
+                partialFilterExpression=NOT_DELETED_FILTER,
+            ),
+            IndexModel(
+                [("owner_id", ASCENDING), ("domain", ASCENDING), ("updated_at", DESCENDING)],
+                partialFilterExpression=NOT_DELETED_FILTER,
+            ),
+            IndexModel([("deleted_at", ASCENDING)], partialFilterExpression=DELETED_FILTER),
+            # Sync, tombstones included
+            IndexModel([("owner_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)]),
+        ]
+
+
+class BookmarkItemNote(Document, BaseDateTimeMeta):
+    """
+    A note of a bookmark whose notes outgrew the bookmark document.
+    """
+
+    content: str
+    slug: str
+    bookmark_slug: str
+    owner_id: str
+
+    class Settings:
+        name = "bookmark-item-notes"
+        indexes = [
+            IndexModel([("slug", ASCENDING)], unique=True),
+            IndexModel(
+                [("bookmark_slug", ASCENDING), ("created_at", ASCENDING), ("slug", ASCENDING)],
+                partialFilterExpression=NOT_DELETED_FILTER,
+            ),
+            IndexModel([("owner_id", ASCENDING)]),
+            IndexModel([("deleted_at", ASCENDING)], partialFilterExpression=DELETED_FILTER),
+        ]
 
 
 class BookmarkItemIn(BaseMellyAPIModel):
@@ -45,7 +148,10 @@ class BookmarkItemIn(BaseMellyAPIModel):
 
 
 class BookmarkItemOut(BookmarkItemIn):
+    # The latest few notes, the rest are paged through `/bookmarks/{slug}/notes`
     notes: List[BookmarkNoteOut] | None = Field(default_factory=list)
+    note_count: int = 0
+    metadata: LinkMetadata | None = None
 
     slug: str
 
@@ -57,16 +163,97 @@ class BookmarkItemOut(BookmarkItemIn):
     updated_at: datetime | None = None
 
 
+class BookmarkItemSummaryOut(BaseMellyAPIModel):
+    """
+    List view of a bookmark with a note count instead of the notes, every field is optional so clients can ask for a
+    subset.
+    """
+
+    url: HttpUrl | None = None
+    tags: List[str] | None = None
+    content: str | None = None
+    slug: str | None = None
+    metadata: LinkMetadata | None = None
+    note_count: int | None = None
+
+    owner_name: str | None = None
+    owner_picture: HttpUrl | None = None
+    owner_id: str | None = None
+
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+
+class BookmarkBatchItemOut(BaseMellyAPIModel):
+    slug: str
+    found: bool
+    bookmark: BookmarkItemOut | None = None
+
+
 class BookmarkNoteIn(BaseMellyAPIModel):
     content: str
 
 
+class UrlSaveCountOut(BaseMellyAPIModel):
+    url: HttpUrl
+    count: int
+
+
+TrendingKind = Literal["url", "tag"]
+TrendingWindow = Literal["1h", "24h", "7d"]
+
+
+class TrendingCounter(Document):
+    """
+    Saves of a page (`url_hash`) or uses of a tag during the `trending_bucket_in_seconds` starting at `bucket`. Windows
+    add up the buckets they span, buckets older than the largest window expire.
+    """
+
+    kind: TrendingKind
+    key: str
+    # The page or the tag as it was first counted in the bucket
+    label: str
+    bucket: datetime
+    total: int = 0
+    expires_at: datetime
+
+    class Settings:
+        name = "trending-counters"
+        indexes = [
+            IndexModel([("kind", ASCENDING), ("key", ASCENDING), ("bucket", ASCENDING)], unique=True),
+            IndexModel([("kind", ASCENDING), ("bucket", ASCENDING)]),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
+
+
+class TrendingUrlOut(BaseMellyAPIModel):
+    url: HttpUrl
+    count: int
+
+
+class TrendingTagOut(BaseMellyAPIModel):
+    tag: str
+    count: int
+
+
+class TrendingOut(BaseMellyAPIModel):
+    window: TrendingWindow
+    urls: List[TrendingUrlOut] = Field(default_factory=list)
+    tags: List[TrendingTagOut] = Field(default_factory=list)
+    refreshed_at: datetime = Field(alias="refreshedAt")
+
+
 class Collection(Document, BaseDateTimeMeta):
     title: str
     slug: str
     owner_id: str
 
+    # Bookmark slugs in order until there are more than `collection_embedded_items_limit`, then only the first few
+    # while all of them live in `CollectionItem` from `items_moved_at` on. `item_count` is `None` for collections that
+    # never counted their items, the length of `items` then.
     items: List[str] = Field(default_factory=list)
+    item_count: int | None = None
+    items_moved_at: datetime | None = None
 
     published_at: datetime | None = None
 
@@ -84,12 +271,58 @@ class Collection(Document, BaseDateTimeMeta):
     def is_published(self) -> bool:
         return self.published_at is not None
 
-    @before_event(Replace, Update, SaveChanges)
+    @before_event(Insert, Save, Replace, Update, SaveChanges)
     async def bump_updated_at(self):
         self.updated_at = datetime.now(tz=pytz.UTC)
 
     class Settings:
         name = "collections"
+        indexes = [
+            IndexModel([("slug", ASCENDING)], unique=True),
+            IndexModel(
+                [("owner_id", ASCENDING), ("created_at", DESCENDING)], partialFilterExpression=NOT_DELETED_FILTER
+            ),
+            IndexModel([("items", ASCENDING)], partialFilterExpression=NOT_DELETED_FILTER),
+            IndexModel(
+                [("owner_id", ASCENDING), ("published_at", DESCENDING)],
+                partialFilterExpression={**NOT_DELETED_FILTER, **PUBLISHED_FILTER},
+            ),
+            IndexModel(
+                [("published_at", DESCENDING)], partialFilterExpression={**NOT_DELETED_FILTER, **PUBLISHED_FILTER}
+            ),
+            IndexModel([("deleted_at", ASCENDING)], partialFilterExpression=DELETED_FILTER),
+            # Sync, tombstones included
+            IndexModel([("owner_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)]),
+        ]
+
+
+class CollectionItem(Document, BaseDateTimeMeta):
+    """
+    A bookmark of a collection whose items outgrew the collection document. Items are ordered by `position`, a
+    fractional key, so moving one only rewrites that one.
+    """
+
+    collection_slug: str
+    bookmark_slug: str
+    owner_id: str
+    position: float
+
+    class Settings:
+        name = "collection-items"
+        indexes = [
+            IndexModel(
+                [("collection_slug", ASCENDING), ("bookmark_slug", ASCENDING)],
+                unique=True,
+                partialFilterExpression=NOT_DELETED_FILTER,
+            ),
+            IndexModel(
+                [("collection_slug", ASCENDING), ("position", ASCENDING), ("bookmark_slug", ASCENDING)],
+                partialFilterExpression=NOT_DELETED_FILTER,
+            ),
+            IndexModel([("bookmark_slug", ASCENDING)], partialFilterExpression=NOT_DELETED_FILTER),
+            IndexModel([("owner_id", ASCENDING)]),
+            IndexModel([("deleted_at", ASCENDING)], partialFilterExpression=DELETED_FILTER),
+        ]
 
 
 class SlugIn(BaseMellyAPIModel):
@@ -105,7 +338,23 @@ class CollectionIn(CollectionTitleIn):
     items: List[str] = Field(default_factory=list)
 
 
+class CollectionItemsIn(BaseMellyAPIModel):
+    items: List[str]
+
+
+class CollectionItemMoveIn(BaseMellyAPIModel):
+    # `None` moves the bookmark to the top
+    after: str | None = None
+
+
+class CollectionItemPageOut(BaseMellyAPIModel):
+    items: List[str] = Field(default_factory=list)
+    next_cursor: str | None = None
+
+
 class CollectionOut(CollectionIn):
+    # The first few items, the rest are paged through `/collections/{slug}/items`
+    item_count: int = 0
     slug: str
     owner_name: str
     owner_picture: HttpUrl | None = None
@@ -117,6 +366,26 @@ class CollectionOut(CollectionIn):
     updated_at: datetime | None = None
 
 
+class CollectionSummaryOut(BaseMellyAPIModel):
+    """
+    List view of a collection with an item count instead of the items, every field is optional so clients can ask for
+    a subset.
+    """
+
+    title: str | None = None
+    slug: str | None = None
+    item_count: int | None = None
+
+    owner_name: str | None = None
+    owner_picture: HttpUrl | None = None
+    owner_id: str | None = None
+
+    published_at: datetime | None = None
+
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+
 class CollectionComment(Document, BaseDateTimeMeta):
     content: str
     author_id: str
@@ -126,5 +395,62 @@ class CollectionComment(Document, BaseDateTimeMeta):
     slug: str
     parent_comment_slug: str | None = None
 
+    # Denormalized so listing top level comments never needs to look at their replies
+    reply_count: int = 0
+
+    @before_event(Save, Replace, Update, SaveChanges)
+    async def bump_updated_at(self):
+        self.updated_at = datetime.now(tz=pytz.UTC)
+
     class Settings:
         name = "collection-comments"
+        indexes = [
+            IndexModel([("slug", ASCENDING)], unique=True),
+            IndexModel(
+                [("collection_slug", ASCENDING), ("created_at", ASCENDING), ("slug", ASCENDING)],
+                partialFilterExpression=NOT_DELETED_FILTER,
+            ),
+            IndexModel(
+                [
+                    ("collection_slug", ASCENDING),
+                    ("parent_comment_slug", ASCENDING),
+                    ("created_at", ASCENDING),
+                    ("slug", ASCENDING),
+                ],
+                partialFilterExpression=NOT_DELETED_FILTER,
+            ),
+            IndexModel([("deleted_at", ASCENDING)], partialFilterExpression=DELETED_FILTER),
+        ]
+
+
+class CollectionCommentIn(BaseMellyAPIModel):
+    content: str
+    parent_comment_slug: str | None = None
+
+
+class CollectionCommentContentIn(BaseMellyAPIModel):
+    content: str
+
+
+class CollectionCommentOut(BaseMellyAPIModel):
+    content: str
+    slug: str
+    collection_slug: str
+    parent_comment_slug: str | None = None
+    reply_count: int = 0
+
+    author_name: str
+    author_picture: HttpUrl | None = None
+    author_id: str
+
+    created_at: datetime
+    updated_at: datetime | None = None
+
+
+class CollectionCommentPageOut(BaseMellyAPIModel):
+    comments: List[CollectionCommentOut] = Field(default_factory=list)
+    next_cursor: str | None = None
+
+
+class CollectionCommentThreadOut(CollectionCommentOut):
+    replies: List["CollectionCommentThreadOut"] = Field(default_factory=list)
@@ -0,0 +1,212 @@
+import gzip
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSIBLE_TYPES = {"application/json", "application/javascript", "application/xml", "image/svg+xml"}
+
+
+def compress_gzip(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def compress_brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=5)
+
+
+def compress_zstd(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+# In order of preference when a client accepts several equally, brotli and zstd need the `compression` extra
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {}
+if zstandard is not None:
+    COMPRESSORS["zstd"] = compress_zstd
+if brotli is not None:
+    COMPRESSORS["br"] = compress_brotli
+COMPRESSORS["gzip"] = compress_gzip
+
+
+def negotiate_encoding(accept_encoding: str, available: Dict[str, Callable] = COMPRESSORS) -> str | None:
+    """
+    Picks the encoding with the highest `q` value in `Accept-Encoding` that is `available`, ties go to the order of
+    `available`.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        q = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith("+json")
+        or media_type.endswith("+xml")
+    )
+
+
+class CompressionCache:
+    """
+    LRU of compressed bodies keyed by a digest of the uncompressed body and the encoding, bounded to `max_bytes` of
+    compressed data. Identical hot responses are compressed once instead of once per request.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[Tuple[bytes, str], bytes] = OrderedDict()
+
+    @staticmethod
+    def key(body: bytes, encoding: str) -> Tuple[bytes, str]:
+        return hashlib.blake2b(body, digest_size=16).digest(), encoding
+
+    def get(self, key: Tuple[bytes, str]) -> bytes | None:
+        compressed = self._entries.get(key)
+        if compressed is not None:
+            self._entries.move_to_end(key)
+        return compressed
+
+    def set(self, key: Tuple[bytes, str], compressed: bytes) -> None:
+        if len(compressed) > self.max_bytes or key in self._entries:
+            return
+
+        self._entries[key] = compressed
+        self.size += len(compressed)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+
+class CompressionMiddleware:
+    """
+    Compresses complete response bodies of at least `minimum_size` bytes with the best encoding the client accepts.
+    Bodies of `offload_size` bytes or more are compressed in a worker thread so they don't block the event loop.
+    Responses to requests without credentials go through `cache`. Streamed responses are passed through as is.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        offload_size: int = 64 * 1024,
+        cache: CompressionCache | None = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.cache = cache
+
+    async def compress(self, body: bytes, encoding: str, cacheable: bool) -> bytes:
+        key = None
+        if cacheable and self.cache is not None:
+            key = self.cache.key(body=body, encoding=encoding)
+            compressed = self.cache.get(key)
+            if compressed is not None:
+                return compressed
+
+        compressor = COMPRESSORS[encoding]
+        if len(body) >= self.offload_size:
+            compressed = await anyio.to_thread.run_sync(compressor, body)
+        else:
+            compressed = compressor(body)
+
+        if key is not None:
+            self.cache.set(key, compressed)
+
+        return compressed
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = negotiate_encoding(request_headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        cacheable = "authorization" not in request_headers
+        start_message: Message | None = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message, passthrough
+
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not is_compressible(headers.get("content-type", "")):
+                    passthrough = True
+                    await send(message)
+                    return
+
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+                start_message = message
+                return
+
+            passthrough = True
+            body = message.get("body", b"")
+            if message["type"] != "http.response.body" or message.get("more_body", False):
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) >= self.minimum_size:
+                compressed = await self.compress(body=body, encoding=encoding, cacheable=cacheable)
+                if len(compressed) < len(body):
+                    headers = MutableHeaders(raw=start_message["headers"])
+                    headers["content-encoding"] = encoding
+                    headers["content-length"] = str(len(compressed))
+                    if headers.get("etag", "").startswith('"'):
+                        # The bytes differ from the identity representation
+                        headers["etag"] = f"W/{headers['etag']}"
+                    message = {**message, "body": compressed}
+
+            await send(start_message)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
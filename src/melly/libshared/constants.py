@@ -4,3 +4,31 @@ from enum import Enum
 class Sort(str, Enum):
     Ascending = "asc"
     Descending = "desc"
+
+
+# Partial index filters. Every read path filters on `deleted_at: None`, so indexes serving them only need to cover live
+# documents while the purger only ever looks at tombstones.
+NOT_DELETED_FILTER = {"deleted_at": None}
+DELETED_FILTER = {"deleted_at": {"$type": "date"}}
+PUBLISHED_FILTER = {"published_at": {"$type": "date"}}
+
+# Most slugs accepted by the `:batchGet` endpoints
+MAX_BATCH_GET_SLUGS = 100
+
+# Largest page of changes `/sync` returns
+MAX_SYNC_PAGE_SIZE = 500
+
+# Largest page of bookmark notes
+MAX_NOTES_PAGE_SIZE = 100
+
+# Largest page of collection items
+MAX_COLLECTION_ITEMS_PAGE_SIZE = 500
+
+# Largest page of the home timeline
+MAX_TIMELINE_PAGE_SIZE = 100
+
+# Largest number of trending pages and tags
+MAX_TRENDING_PAGE_SIZE = 100
+
+# Trending windows in seconds
+TRENDING_WINDOWS = {"1h": 60 * 60, "24h": 60 * 60 * 24, "7d": 60 * 60 * 24 * 7}
@@ -0,0 +1,99 @@
+import asyncio
+from collections import Counter
+from typing import Type
+
+from beanie import Document
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from melly.libshared.logger import logger
+
+
+class CounterBuffer:
+    """
+    Write-behind `$inc` of `field` on the documents matching `key_field`. Increments are added up in memory and written
+    with one unordered `bulk_write` every `interval_in_seconds`, or as soon as `max_keys` keys are pending. Counts
+    pending on a worker are lost if it dies without going through `stop`.
+    """
+
+    def __init__(self, model: Type[Document], key_field: str, field: str, interval_in_seconds: float, max_keys: int):
+        self.model = model
+        self.key_field = key_field
+        self.field = field
+        self.interval_in_seconds = interval_in_seconds
+        self.max_keys = max_keys
+
+        self._pending: Counter[str] = Counter()
+        self._flushing: Counter[str] = Counter()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._flush_task: asyncio.Task | None = None
+
+    def increment(self, key: str, amount: int = 1) -> None:
+        self._pending[key] += amount
+        if len(self._pending) >= self.max_keys and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.try_flush())
+
+    def pending(self, key: str) -> int:
+        """
+        Increments of `key` that may not be stored yet, add them to the stored count for an up to date one.
+        """
+        return self._pending.get(key, 0) + self._flushing.get(key, 0)
+
+    async def flush(self) -> int:
+        async with self._lock:
+            if not self._pending:
+                return 0
+
+            # Increments arriving while the write runs go to the next flush
+            self._flushing, self._pending = self._pending, Counter()
+            keys = list(self._flushing)
+            requests = [UpdateOne({self.key_field: x}, {"$inc": {self.field: self._flushing[x]}}) for x in keys]
+            try:
+                await self.model.get_motor_collection().bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                # Only the failed ones are retried, the rest were applied
+                for error in e.details.get("writeErrors", []):
+                    key = keys[error.get("index")]
+                    self._pending[key] += self._flushing[key]
+                raise
+            except BaseException:
+                # Including cancellation on shutdown, the write may or may not have been applied
+                self._pending.update(self._flushing)
+                raise
+            finally:
+                self._flushing = Counter()
+
+            return len(requests)
+
+    async def try_flush(self) -> None:
+        try:
+            await self.flush()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Flushing {self.model.get_collection_name()} {self.field} failed: {e}")
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_in_seconds)
+            await self.try_flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._flush_task is not None:
+            await self._flush_task
+            self._flush_task = None
+
+        await self.try_flush()
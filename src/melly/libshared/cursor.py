@@ -0,0 +1,56 @@
+import base64
+import math
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(created_at: datetime, slug: str) -> str:
+    """
+    Opaque keyset pagination cursor for `(created_at, slug)` ordered pages.
+    """
+    raw = f"{created_at.isoformat()}|{slug}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("utf-8")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("utf-8")).decode("utf-8")
+        created_at, slug = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), slug
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_position_cursor(position: float, slug: str) -> str:
+    """
+    Opaque keyset pagination cursor for `(position, slug)` ordered pages.
+    """
+    raw = f"{position!r}|{slug}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("utf-8")
+
+
+def decode_position_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("utf-8")).decode("utf-8")
+        position, slug = raw.split("|", 1)
+        position = float(position)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Positions are always finite, `nan` and `inf` only come from crafted cursors
+    if not math.isfinite(position):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position, slug
+
+
+def after_cursor_query(cursor: str | None, field: str = "created_at") -> dict:
+    """
+    Builds the `$match` clause that continues an ascending `(field, slug)` keyset page after `cursor`.
+    """
+    if cursor is None:
+        return {}
+
+    value, slug = decode_cursor(cursor)
+    return {"$or": [{field: {"$gt": value}}, {field: value, "slug": {"$gt": slug}}]}
@@ -0,0 +1,51 @@
+from typing import Any, Dict, List, Set, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+SUMMARY = "summary"
+
+
+def parse_fields(fields: str | None, model: Type[BaseModel]) -> Set[str] | None:
+    """
+    Turns a `fields=title,slug` query param into field names of `model`, aliases are accepted too. `summary` selects
+    every field of the model. `None` means no sparse fieldset was asked for.
+    """
+    if fields is None:
+        return None
+
+    names = {}
+    for name, info in model.model_fields.items():
+        names[name] = name
+        if info.alias:
+            names[info.alias] = name
+
+    requested = {x.strip() for x in fields.split(",") if x.strip()}
+    if SUMMARY in requested:
+        return set(model.model_fields)
+
+    if not requested:
+        raise HTTPException(status_code=400, detail="No fields requested")
+
+    unknown = sorted(requested - names.keys())
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    return {names[x] for x in requested}
+
+
+def build_projection(fields: Set[str], fragments: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    `$project` stage for the requested `fields`, `fragments` maps each output field to the stored fields (or
+    expressions) it is built from.
+    """
+    projection = {"_id": 0}
+    for field in sorted(fields):
+        projection.update(fragments.get(field, {field: 1}))
+    return {"$project": projection}
+
+
+def sparse_response(items: List[BaseModel]) -> JSONResponse:
+    # Fields that weren't asked for are left out rather than sent as nulls
+    return JSONResponse([x.model_dump(mode="json", by_alias=True, exclude_unset=True) for x in items])
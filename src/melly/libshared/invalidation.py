@@ -0,0 +1,197 @@
+import asyncio
+import inspect
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Set
+
+import pytz
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure, PyMongoError
+
+from melly.libshared.logger import logger
+
+# ChangeStreamHistoryLost, InvalidResumeToken and ChangeStreamFatalError, the stream has to start over from now
+RESUME_ERROR_CODES = {260, 280, 286}
+
+
+class InvalidationEvent:
+    """
+    A write seen on the change stream. `updated_fields` holds the top level fields an update touched, `None` when any
+    field may have changed (inserts, replaces, deletes and full invalidations).
+    """
+
+    __slots__ = ("collection", "operation", "document_id", "updated_fields")
+
+    def __init__(
+        self, collection: str, operation: str, document_id: Any = None, updated_fields: Set[str] | None = None
+    ):
+        self.collection = collection
+        self.operation = operation
+        self.document_id = document_id
+        self.updated_fields = updated_fields
+
+    @classmethod
+    def from_change(cls, change: dict) -> "InvalidationEvent":
+        updated_fields = change.get("updated_fields")
+        if updated_fields is not None:
+            updated_fields = {x.split(".", 1)[0] for x in updated_fields}
+
+        return cls(
+            collection=change.get("ns", {}).get("coll"),
+            operation=change.get("operationType"),
+            document_id=change.get("documentKey", {}).get("_id"),
+            updated_fields=updated_fields,
+        )
+
+    def touches(self, *fields: str) -> bool:
+        return self.updated_fields is None or not self.updated_fields.isdisjoint(fields)
+
+
+class InvalidationBus:
+    """
+    Fans invalidation events out to the local caches subscribed to a collection. A failing subscriber is logged and
+    doesn't keep the others from being notified.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable[[InvalidationEvent], Awaitable[None] | None]]] = {}
+
+    @property
+    def collections(self) -> List[str]:
+        return list(self._subscribers)
+
+    def subscribe(
+        self, collections: List[str], callback: Callable[[InvalidationEvent], Awaitable[None] | None]
+    ) -> None:
+        for collection in collections:
+            callbacks = self._subscribers.setdefault(collection, [])
+            if callback not in callbacks:
+                callbacks.append(callback)
+
+    async def publish(self, event: InvalidationEvent) -> None:
+        for callback in self._subscribers.get(event.collection, []):
+            try:
+                result = callback(event)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Invalidation subscriber failed for {event.collection}: {e}")
+
+    async def invalidate_all(self) -> None:
+        for collection in self.collections:
+            await self.publish(InvalidationEvent(collection=collection, operation="invalidate"))
+
+
+class ChangeStreamSubscriber:
+    """
+    Watches `collections` through one database level change stream and publishes every write to `bus`.
+
+    The resume token is kept in the `change-stream-tokens` collection under `name`, written at most every
+    `persist_interval_in_seconds` and on stop, so a restarted stream picks up where it left off. When the token can't
+    be resumed from, the stream starts over from now and every subscriber is invalidated since events were missed.
+    """
+
+    def __init__(
+        self,
+        database: AsyncIOMotorDatabase,
+        collections: List[str],
+        bus: InvalidationBus,
+        name: str,
+        persist_interval_in_seconds: int = 5,
+        max_retry_delay_in_seconds: int = 60,
+    ):
+        self.database = database
+        self.collections = collections
+        self.bus = bus
+        self.name = name
+        self.persist_interval_in_seconds = persist_interval_in_seconds
+        self.max_retry_delay_in_seconds = max_retry_delay_in_seconds
+
+        self.tokens = database["change-stream-tokens"]
+        self.token: dict | None = None
+
+        self._persisted_token: dict | None = None
+        self._persisted_at = 0.0
+        self._retry_delay = 1
+        self._task: asyncio.Task | None = None
+
+    @property
+    def pipeline(self) -> List[dict]:
+        # Only the names of updated fields are shipped, not their values
+        updated_fields = {"$map": {"input": {"$objectToArray": "$updateDescription.updatedFields"}, "in": "$$this.k"}}
+        removed_fields = {"$ifNull": ["$updateDescription.removedFields", []]}
+        return [
+            {"$match": {"ns.coll": {"$in": self.collections}}},
+            {"$addFields": {"updated_fields": {"$setUnion": [updated_fields, removed_fields]}}},
+            {"$project": {"operationType": 1, "ns": 1, "documentKey": 1, "updated_fields": 1}},
+        ]
+
+    async def load_token(self) -> dict | None:
+        state = await self.tokens.find_one({"_id": self.name})
+        return state.get("token") if state else None
+
+    async def persist_token(self, force: bool = False) -> None:
+        if self.token is None or self.token == self._persisted_token:
+            return
+        if not force and time.monotonic() - self._persisted_at < self.persist_interval_in_seconds:
+            return
+
+        await self.tokens.update_one(
+            {"_id": self.name},
+            {"$set": {"token": self.token, "updated_at": datetime.now(tz=pytz.UTC)}},
+            upsert=True,
+        )
+        self._persisted_token = self.token
+        self._persisted_at = time.monotonic()
+
+    async def watch(self) -> None:
+        async with self.database.watch(self.pipeline, resume_after=self.token) as stream:
+            self._retry_delay = 1
+            async for change in stream:
+                self.token = change.get("_id")
+                await self.bus.publish(InvalidationEvent.from_change(change))
+                await self.persist_token()
+
+    async def run(self) -> None:
+        try:
+            self.token = await self.load_token()
+        except PyMongoError as e:
+            logger.error(f"Could not load change stream resume token: {e}")
+
+        while True:
+            try:
+                await self.watch()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if self.token is not None and e.code in RESUME_ERROR_CODES:
+                    logger.warning(f"Change stream can't resume, starting over: {e}")
+                    self.token = None
+                    await self.bus.invalidate_all()
+                    continue
+                logger.error(f"Change stream failed: {e}")
+            except PyMongoError as e:
+                logger.error(f"Change stream failed: {e}")
+
+            await asyncio.sleep(self._retry_delay)
+            self._retry_delay = min(self._retry_delay * 2, self.max_retry_delay_in_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        try:
+            await self.persist_token(force=True)
+        except PyMongoError as e:
+            logger.error(f"Could not persist change stream resume token: {e}")
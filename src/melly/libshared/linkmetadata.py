@@ -0,0 +1,291 @@
+import asyncio
+import ipaddress
+import socket
+from html.parser import HTMLParser
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import httpcore
+import httpx
+
+from melly.libshared.logger import logger
+
+MAX_TITLE_LENGTH = 300
+MAX_DESCRIPTION_LENGTH = 1000
+
+
+class BlockedHostError(Exception):
+    pass
+
+
+class GuardedNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    Resolves hosts once and connects to the address that was checked, so a host can't resolve to a public address for
+    the check and to an internal one for the connection. TLS still verifies and sends SNI for the host name.
+    """
+
+    def __init__(self, allow_private_hosts: bool = False):
+        self.allow_private_hosts = allow_private_hosts
+        self._backend = httpcore.AnyIOBackend()
+
+    async def resolve(self, host: str, port: int) -> List[str]:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return list(dict.fromkeys(x[4][0] for x in infos))
+
+    async def connect_tcp(
+        self, host: str, port: int, timeout: float | None = None, **kwargs
+    ) -> httpcore.AsyncNetworkStream:
+        addresses = await self.resolve(host, port)
+        if not self.allow_private_hosts and not all(
+            ipaddress.ip_address(x.split("%", 1)[0]).is_global for x in addresses
+        ):
+            raise BlockedHostError(f"{host} resolves to a non public address")
+
+        error: Exception | None = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(address, port, timeout=timeout, **kwargs)
+            except (OSError, httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error or OSError(f"{host} did not resolve")
+
+    async def connect_unix_socket(
+        self, path: str, timeout: float | None = None, **kwargs
+    ) -> httpcore.AsyncNetworkStream:
+        raise BlockedHostError("Unix sockets are off limits")
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class GuardedTransport(httpx.AsyncHTTPTransport):
+    """
+    `httpx` transport whose connections go through `GuardedNetworkBackend`.
+    """
+
+    def __init__(self, limits: httpx.Limits, allow_private_hosts: bool = False):
+        super().__init__(limits=limits)
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=GuardedNetworkBackend(allow_private_hosts=allow_private_hosts),
+        )
+
+
+class OpenGraphParser(HTMLParser):
+    """
+    Collects OpenGraph and plain HTML metadata from the `<head>`, stops looking once the `<body>` starts.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta: Dict[str, str] = {}
+        self.title: str | None = None
+        self.done = False
+
+        self._in_title = False
+        self._title_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+
+        if tag == "body":
+            self.done = True
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            name = (attrs.get("property") or attrs.get("name") or "").lower()
+            content = attrs.get("content")
+            if name and content and name not in self.meta:
+                self.meta[name] = content.strip()
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts).strip() or None
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+
+
+def parse_metadata(html: str, url: str) -> Dict[str, str | None]:
+    parser = OpenGraphParser()
+    try:
+        parser.feed(html)
+    except Exception:
+        # Best effort, keep whatever was collected before the markup broke down
+        pass
+
+    meta = parser.meta
+    title = meta.get("og:title") or meta.get("twitter:title") or parser.title
+    description = meta.get("og:description") or meta.get("twitter:description") or meta.get("description")
+    image = meta.get("og:image") or meta.get("og:image:url") or meta.get("twitter:image")
+
+    if image:
+        image = urljoin(url, image)
+        if urlsplit(image).scheme not in ("http", "https"):
+            image = None
+
+    return {
+        "title": title[:MAX_TITLE_LENGTH] if title else None,
+        "description": description[:MAX_DESCRIPTION_LENGTH] if description else None,
+        "image": image,
+        "site_name": meta.get("og:site_name"),
+    }
+
+
+class LinkMetadataFetcher:
+    """
+    Bounded pool of workers fetching and parsing link metadata in the background.
+
+    URLs are queued with `enqueue`, a full queue drops the URL instead of blocking the request that queued it and a URL
+    that is already queued or being fetched is not queued again. All workers share one pooled `httpx` client, no more
+    than `per_host_limit` requests go to the same host at once, every fetch is bounded by `timeout_in_seconds` and at
+    most `max_bytes` of a response is read. Results, `None` for failures, are passed to `on_fetched`.
+    """
+
+    def __init__(
+        self,
+        on_fetched: Callable[[str, str, Dict[str, str | None] | None], Awaitable[None]],
+        workers: int = 4,
+        queue_size: int = 1000,
+        per_host_limit: int = 2,
+        timeout_in_seconds: float = 5.0,
+        max_bytes: int = 512 * 1024,
+        allow_private_hosts: bool = False,
+        user_agent: str = "MellyBot/1.0 (+https://melly.com)",
+    ):
+        self.on_fetched = on_fetched
+        self.workers = workers
+        self.queue_size = queue_size
+        self.per_host_limit = per_host_limit
+        self.timeout_in_seconds = timeout_in_seconds
+        self.max_bytes = max_bytes
+        self.allow_private_hosts = allow_private_hosts
+        self.user_agent = user_agent
+
+        self._queue: asyncio.Queue[Tuple[str, str]] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._client: httpx.AsyncClient | None = None
+        self._pending: Set[str] = set()
+        self._hosts: Dict[str, Tuple[asyncio.Semaphore, int]] = {}
+
+    @property
+    def is_running(self) -> bool:
+        return len(self._tasks) > 0
+
+    def start(self, transport: httpx.AsyncBaseTransport | None = None) -> None:
+        if self.is_running:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        limits = httpx.Limits(max_connections=self.workers * 2, max_keepalive_connections=self.workers)
+        # Redirects open their connections through the same transport, so they are checked too
+        self._client = httpx.AsyncClient(
+            transport=transport or GuardedTransport(limits=limits, allow_private_hosts=self.allow_private_hosts),
+            timeout=httpx.Timeout(self.timeout_in_seconds),
+            follow_redirects=True,
+            max_redirects=3,
+            headers={"user-agent": self.user_agent, "accept": "text/html,application/xhtml+xml"},
+        )
+        self._tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._pending.clear()
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def enqueue(self, url: str, key: str) -> bool:
+        if not self.is_running or key in self._pending:
+            return False
+
+        try:
+            self._queue.put_nowait((url, key))
+        except asyncio.QueueFull:
+            logger.warning(f"Link metadata queue is full, dropping {url}")
+            return False
+
+        self._pending.add(key)
+        return True
+
+    async def join(self) -> None:
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def acquire_host(self, host: str) -> None:
+        # Semaphores are refcounted so hosts that are no longer being fetched don't pile up
+        semaphore, users = self._hosts.get(host, (None, 0))
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host_limit)
+        self._hosts[host] = (semaphore, users + 1)
+
+        await semaphore.acquire()
+
+    def release_host(self, host: str) -> None:
+        semaphore, users = self._hosts.get(host)
+        semaphore.release()
+        if users <= 1:
+            del self._hosts[host]
+        else:
+            self._hosts[host] = (semaphore, users - 1)
+
+    async def read(self, url: str) -> str | None:
+        async with self._client.stream("GET", url) as response:
+            if response.status_code >= 400:
+                return None
+
+            content_type = response.headers.get("content-type", "")
+            if "html" not in content_type:
+                return None
+
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) >= self.max_bytes:
+                    break
+
+            return bytes(body[: self.max_bytes]).decode(response.encoding or "utf-8", errors="replace")
+
+    async def fetch(self, url: str) -> Dict[str, str | None] | None:
+        host = urlsplit(url).hostname or ""
+        await self.acquire_host(host)
+        try:
+            # The client timeout applies per read, this one bounds servers trickling bytes
+            html = await asyncio.wait_for(self.read(url), timeout=self.timeout_in_seconds * 2)
+        except (httpx.HTTPError, BlockedHostError, asyncio.TimeoutError, OSError) as e:
+            logger.info(f"Could not fetch link metadata for {url}: {e!r}")
+            return None
+        finally:
+            self.release_host(host)
+
+        if html is None:
+            return None
+
+        return parse_metadata(html=html, url=url)
+
+    async def work(self) -> None:
+        while True:
+            url, key = await self._queue.get()
+            try:
+                metadata = await self.fetch(url)
+                await self.on_fetched(url, key, metadata)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Link metadata worker failed for {url}: {e}")
+            finally:
+                self._pending.discard(key)
+                self._queue.task_done()
@@ -0,0 +1,88 @@
+import hashlib
+import re
+from collections import OrderedDict
+from typing import NamedTuple
+
+from markdown_it import MarkdownIt
+
+# Bump whenever the rendered output changes so stored renderings are treated as stale
+RENDERER_VERSION = "1"
+EXCERPT_LENGTH = 280
+
+_whitespace = re.compile(r"\s+")
+
+
+def _render_link_open(self, tokens, idx, options, env):
+    tokens[idx].attrSet("rel", "nofollow noopener noreferrer")
+    return self.renderToken(tokens, idx, options, env)
+
+
+# Raw HTML is escaped and markdown-it refuses `javascript:` and friends in links, which keeps the output safe to embed
+_md = MarkdownIt("commonmark", {"html": False}).enable(["table", "strikethrough"])
+_md.add_render_rule("link_open", _render_link_open)
+
+
+class RenderedMarkdown(NamedTuple):
+    html: str
+    excerpt: str
+    content_hash: str
+
+
+def hash_markdown(text: str) -> str:
+    return hashlib.blake2b(f"{RENDERER_VERSION}\n{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def make_excerpt(text: str, length: int = EXCERPT_LENGTH) -> str:
+    text = _whitespace.sub(" ", text).strip()
+    if len(text) <= length:
+        return text
+
+    cut = text[:length].rsplit(" ", 1)[0] or text[:length]
+    return f"{cut.rstrip(' .,;:')}…"
+
+
+def render_markdown(text: str) -> RenderedMarkdown:
+    tokens = _md.parse(text)
+    html = _md.renderer.render(tokens, _md.options, {})
+
+    # Plaintext of the prose only, code blocks make for poor previews
+    parts = []
+    for token in tokens:
+        if token.type != "inline":
+            continue
+        for child in token.children or []:
+            if child.type in ("text", "code_inline"):
+                parts.append(child.content)
+            elif child.type in ("softbreak", "hardbreak"):
+                parts.append(" ")
+        parts.append(" ")
+
+    return RenderedMarkdown(html=html, excerpt=make_excerpt("".join(parts)), content_hash=hash_markdown(text))
+
+
+class RenderCache:
+    """
+    LRU of renderings keyed by content hash. Edits change the hash, so entries never need invalidating.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, RenderedMarkdown] = OrderedDict()
+
+    def render(self, text: str) -> RenderedMarkdown:
+        content_hash = hash_markdown(text)
+
+        rendered = self._entries.get(content_hash)
+        if rendered is not None:
+            self._entries.move_to_end(content_hash)
+            return rendered
+
+        rendered = render_markdown(text)
+        self._entries[content_hash] = rendered
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        return rendered
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -1,8 +1,11 @@
 from datetime import datetime
+from typing import List
 
 import pytz
 from pydantic import BaseModel, ConfigDict, Field, EmailStr, HttpUrl
 
+from melly.libshared.constants import MAX_BATCH_GET_SLUGS
+
 
 class BaseMellyAPIModel(BaseModel):
     model_config = ConfigDict(
@@ -34,6 +37,15 @@ class TokenPayload(BaseModel):
     iat: int
     nbf: int | None = None
 
+    # Refresh token family of the login, `None` for tokens issued before refresh tokens rotated
+    fid: str | None = None
+    # "refresh" for refresh tokens, access tokens don't set it
+    typ: str | None = None
+
 
 class UrlResponse(BaseMellyAPIModel):
     url: HttpUrl
+
+
+class BatchGetIn(BaseMellyAPIModel):
+    slugs: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_GET_SLUGS)
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Type
+
+import pytz
+from beanie import Document
+
+from melly.libshared.logger import logger
+
+
+class Purger:
+    """
+    Hard deletes soft deleted documents once they are older than the retention window. Deletion happens in batches of
+    `_id`s so a large backlog of tombstones never turns into one long running `delete_many`.
+    """
+
+    def __init__(
+        self, models: List[Type[Document]], retention_in_seconds: int, interval_in_seconds: int, batch_size: int
+    ):
+        self.models = models
+        self.retention_in_seconds = retention_in_seconds
+        self.interval_in_seconds = interval_in_seconds
+        self.batch_size = batch_size
+
+        self._task: asyncio.Task | None = None
+
+    async def purge_model(self, model: Type[Document], cutoff: datetime) -> int:
+        collection = model.get_motor_collection()
+        # Repeating the `$type` clause of the partial index filter lets the planner pick the tombstone index
+        query = {"deleted_at": {"$type": "date", "$lt": cutoff}}
+
+        purged = 0
+        while True:
+            cursor = collection.find(query, projection={"_id": 1}).limit(self.batch_size)
+            ids = [x.get("_id") async for x in cursor]
+            if len(ids) == 0:
+                break
+
+            result = await collection.delete_many({"_id": {"$in": ids}})
+            purged += result.deleted_count
+            if len(ids) < self.batch_size:
+                break
+
+        return purged
+
+    async def purge(self) -> int:
+        cutoff = datetime.now(tz=pytz.UTC) - timedelta(seconds=self.retention_in_seconds)
+
+        purged = 0
+        for model in self.models:
+            count = await self.purge_model(model=model, cutoff=cutoff)
+            if count > 0:
+                logger.info(f"Purged {count} documents from {model.get_collection_name()}")
+            purged += count
+
+        return purged
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Purger failed: {e}")
+
+            await asyncio.sleep(self.interval_in_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,188 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, List, Pattern
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument
+from starlette.responses import JSONResponse
+from starlette.routing import compile_path
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from melly.libshared.logger import logger
+
+
+class RateLimitRule:
+    """
+    A token bucket of `capacity` requests refilled evenly over `period_in_seconds` for one `METHOD /path/{template}`.
+    """
+
+    __slots__ = ("name", "method", "path_regex", "capacity", "period_in_seconds", "refill_rate")
+
+    def __init__(self, method: str, path: str, capacity: int, period_in_seconds: int):
+        self.name = f"{method} {path}"
+        self.method = method
+        self.path_regex: Pattern = compile_path(path)[0]
+        self.capacity = capacity
+        self.period_in_seconds = period_in_seconds
+        self.refill_rate = capacity / period_in_seconds
+
+    @classmethod
+    def parse(cls, route: str, limit: str) -> "RateLimitRule":
+        """
+        Parses a settings entry such as `{"POST /v1/bookmarks": "60/60"}`, 60 requests per 60 seconds.
+        """
+        method, path = route.split(" ", 1)
+        capacity, period = limit.split("/", 1)
+        return cls(method=method.upper(), path=path.strip(), capacity=int(capacity), period_in_seconds=int(period))
+
+
+class RateLimitBackend(ABC):
+    async def init(self) -> None:
+        pass
+
+    @abstractmethod
+    async def acquire(self, key: str, rule: RateLimitRule) -> float:
+        """
+        Takes one token from the bucket for `key`. Returns 0 when allowed, otherwise the seconds until a token is
+        available.
+        """
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Per process buckets kept in an LRU bounded to `max_keys`. An evicted key simply starts over with a full bucket.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    async def init(self) -> None:
+        self._buckets.clear()
+
+    async def acquire(self, key: str, rule: RateLimitRule) -> float:
+        now = time.monotonic()
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(tokens=rule.capacity, updated_at=now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        tokens = min(rule.capacity, bucket.tokens + (now - bucket.updated_at) * rule.refill_rate)
+        bucket.updated_at = now
+
+        if tokens >= 1:
+            bucket.tokens = tokens - 1
+            return 0.0
+
+        bucket.tokens = tokens
+        return (1 - tokens) / rule.refill_rate
+
+
+class MongoRateLimitBackend(RateLimitBackend):
+    """
+    Buckets shared by every worker and pod, refilled and taken in a single atomic `find_one_and_update` using the
+    server clock. Idle buckets are removed by a TTL index once they would have refilled completely.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection):
+        self.collection = collection
+
+    async def init(self) -> None:
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def acquire(self, key: str, rule: RateLimitRule) -> float:
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+        tokens = {
+            "$min": [
+                rule.capacity,
+                {"$add": [{"$ifNull": ["$tokens", rule.capacity]}, {"$multiply": [elapsed, rule.refill_rate]}]},
+            ]
+        }
+        pipeline = [
+            {"$set": {"tokens": tokens, "updated_at": "$$NOW"}},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {
+                "$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": {"$add": ["$$NOW", rule.period_in_seconds * 1000]},
+                }
+            },
+        ]
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        if bucket.get("allowed"):
+            return 0.0
+
+        return (1 - bucket.get("tokens")) / rule.refill_rate
+
+
+class RateLimitMiddleware:
+    """
+    Token bucket rate limiting for the routes configured in `rules`, keyed by whatever `key_func` derives from the
+    request (user `sub` or client IP). Rejected requests get a `429` with `Retry-After`. Backend failures fail open.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        rules: List[RateLimitRule],
+        backend: RateLimitBackend,
+        key_func: Callable[[Scope], str],
+    ):
+        self.app = app
+        self.backend = backend
+        self.key_func = key_func
+
+        self.rules: Dict[str, List[RateLimitRule]] = {}
+        for rule in rules:
+            self.rules.setdefault(rule.method, []).append(rule)
+
+    def match(self, method: str, path: str) -> RateLimitRule | None:
+        for rule in self.rules.get(method, []):
+            if rule.path_regex.match(path):
+                return rule
+
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.rules:
+            await self.app(scope, receive, send)
+            return
+
+        rule = self.match(method=scope["method"], path=scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            retry_after = await self.backend.acquire(key=f"{rule.name}|{self.key_func(scope)}", rule=rule)
+        except Exception as e:
+            logger.error(f"Rate limiter failed: {e}")
+            retry_after = 0.0
+
+        if retry_after > 0:
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=429,
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
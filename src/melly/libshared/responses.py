@@ -0,0 +1,16 @@
+from typing import List
+
+from pydantic import BaseModel
+from starlette.responses import Response
+
+
+def model_response(content: BaseModel | List[BaseModel], status_code: int = 200) -> Response:
+    """
+    Serializes models that were validated when they were built straight to JSON. Returning them instead makes FastAPI
+    dump them and validate the dump against the `response_model` once more before serializing it.
+    """
+    if isinstance(content, list):
+        body = b"[" + b",".join(x.model_dump_json(by_alias=True).encode() for x in content) + b"]"
+    else:
+        body = content.model_dump_json(by_alias=True).encode()
+    return Response(content=body, status_code=status_code, media_type="application/json")
@@ -0,0 +1,86 @@
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+
+class BloomFilter:
+    """
+    Fixed size set membership with false positives but no false negatives, `size_in_bits` bits and `hashes` probes per
+    key. About 1% false positives at `size_in_bits / 10` keys with 7 hashes.
+    """
+
+    def __init__(self, size_in_bits: int = 1 << 20, hashes: int = 7):
+        self.size_in_bits = size_in_bits
+        self.hashes = hashes
+        self._bits = bytearray((size_in_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        # Double hashing, two 64 bit halves of one digest stand in for `hashes` independent hashes
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size_in_bits
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[x >> 3] & (1 << (x & 7)) for x in self._positions(key))
+
+    def clear(self) -> None:
+        self._bits = bytearray(len(self._bits))
+
+
+class RevocationFilter:
+    """
+    In-process front of a revocation store. Revoked keys go into a bloom filter, so keys that were never revoked, the
+    common case, are answered without a lookup. Possible hits are confirmed with `lookup` and the answer is kept in an
+    LRU of `cache_size` keys.
+    """
+
+    def __init__(
+        self,
+        lookup: Callable[[str], Awaitable[bool]],
+        size_in_bits: int = 1 << 20,
+        hashes: int = 7,
+        cache_size: int = 10_000,
+    ):
+        self.lookup = lookup
+        self.cache_size = cache_size
+        self.bloom = BloomFilter(size_in_bits=size_in_bits, hashes=hashes)
+        self._cache: OrderedDict[str, bool] = OrderedDict()
+
+    def _remember(self, key: str, revoked: bool) -> None:
+        self._cache[key] = revoked
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def revoke(self, key: str) -> None:
+        self.bloom.add(key)
+        self._remember(key, True)
+
+    def suspect(self, key: str) -> None:
+        """
+        `key` may have been revoked elsewhere, the next check confirms it with `lookup`.
+        """
+        self.bloom.add(key)
+        self._cache.pop(key, None)
+
+    async def is_revoked(self, key: str) -> bool:
+        if key not in self.bloom:
+            return False
+
+        revoked = self._cache.get(key)
+        if revoked is None:
+            revoked = await self.lookup(key)
+            self._remember(key, revoked)
+        else:
+            self._cache.move_to_end(key)
+        return revoked
+
+    def clear(self) -> None:
+        self.bloom.clear()
+        self._cache.clear()
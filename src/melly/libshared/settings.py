@@ -1,6 +1,6 @@
 import base64
 from functools import lru_cache
-from typing import Literal
+from typing import Literal, Dict
 
 from pydantic import HttpUrl, field_validator
 from pydantic_settings import BaseSettings
@@ -33,11 +33,90 @@ class MellyAPISettings(BaseSettings):
     auth_token_expiry: int = 3600
     refresh_token_expiry: int = 60 * 60 * 24 * 7
 
+    # Revoked logins are checked against an in-process bloom filter, see libshared.revocation
+    token_revocation_filter_bits: int = 1 << 20
+    token_revocation_filter_hashes: int = 7
+    token_revocation_cache_size: int = 10_000
+
     # Social Providers
     social_auth_expiry_in_seconds: int = 600
     google_client_id: str
     google_client_secret: str
 
+    # Purger
+    purge_retention_in_seconds: int = 60 * 60 * 24 * 30
+    purge_interval_in_seconds: int = 60 * 60
+    purge_batch_size: int = 500
+
+    # Feeds
+    published_feed_size: int = 500
+    published_feed_refresh_in_seconds: int = 60
+
+    # Articles
+    article_render_cache_size: int = 1000
+    # Views are added up in memory and written every `article_view_flush_interval_in_seconds` or once
+    # `article_view_flush_max_keys` articles have pending views
+    article_view_flush_interval_in_seconds: float = 10.0
+    article_view_flush_max_keys: int = 1000
+
+    # Bookmark notes live in the bookmark until there are more than `bookmark_embedded_notes_limit`, then they are
+    # moved to their own collection and the bookmark only keeps the latest `bookmark_note_preview_size`
+    bookmark_embedded_notes_limit: int = 100
+    bookmark_note_preview_size: int = 3
+
+    # Same for the bookmarks of a collection, moved out past `collection_embedded_items_limit`
+    collection_embedded_items_limit: int = 500
+    collection_item_preview_size: int = 50
+
+    # Home timelines, posts of accounts with more than `timeline_fanout_max_followers` followers are read along with
+    # the timelines rather than written to every follower's
+    timeline_size: int = 500
+    timeline_backfill_size: int = 20
+    timeline_fanout_max_followers: int = 1000
+    timeline_fanout_batch_size: int = 500
+    timeline_high_follower_refresh_in_seconds: int = 60
+
+    # Trending pages and tags are counted in buckets of `trending_bucket_in_seconds`, the top `trending_size` of each
+    # window are recomputed every `trending_refresh_in_seconds`
+    trending_bucket_in_seconds: int = 60 * 5
+    trending_size: int = 100
+    trending_refresh_in_seconds: int = 60
+
+    # Sync, caught up tokens rewind by `sync_lag_in_seconds` so writes committed out of order aren't missed
+    sync_lag_in_seconds: int = 5
+
+    # Change streams, need `mongo_url` to point at a replica set
+    change_stream_enabled: bool = True
+    change_stream_name: str = "appmellyapi"
+    change_stream_persist_interval_in_seconds: int = 5
+
+    # Link metadata
+    link_metadata_enabled: bool = True
+    link_metadata_workers: int = 4
+    link_metadata_queue_size: int = 1000
+    link_metadata_per_host_limit: int = 2
+    link_metadata_timeout_in_seconds: float = 5.0
+    link_metadata_max_bytes: int = 512 * 1024
+    link_metadata_cache_ttl_in_seconds: int = 60 * 60 * 24 * 7
+    link_metadata_failure_ttl_in_seconds: int = 60 * 60
+    link_metadata_allow_private_hosts: bool = False
+
+    # Compression, brotli and zstd need the `compression` extra
+    compression_enabled: bool = True
+    compression_minimum_size: int = 1024
+    compression_offload_size: int = 64 * 1024
+    compression_cache_size_in_bytes: int = 32 * 1024 * 1024
+
+    # Rate limiting, "METHOD /path/{template}" to "<requests>/<seconds>"
+    rate_limit_enabled: bool = True
+    rate_limit_backend: Literal["memory", "mongo"] = "memory"
+    rate_limits: Dict[str, str] = {
+        "GET /v1/me/auth/google": "10/60",
+        "POST /v1/articles": "20/60",
+        "POST /v1/bookmarks": "60/60",
+        "POST /v1/collections/{slug}/comments": "30/60",
+    }
+
     @field_validator("base_url")
     @classmethod
     def validate_base_url(cls, v):
@@ -0,0 +1,64 @@
+import secrets
+import time
+from typing import Callable
+
+from beanie import Document
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+# Crockford's base32, lowercased so IDs can be used in URLs as is
+ALPHABET = "0123456789abcdefghjkmnpqrstvwxyz"
+RANDOM_BITS = 40
+
+_last_timestamp = 0
+_last_random = 0
+
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def generate_id() -> str:
+    """
+    Short, URL safe and time ordered ID: 48 bits of milliseconds followed by 40 random bits, 18 characters in total.
+    New IDs sort after older ones so they are appended to the right edge of a B-tree index instead of being scattered
+    over it. IDs made within the same millisecond in this process step the random part forward to stay ordered.
+    """
+    global _last_timestamp, _last_random
+
+    timestamp = int(time.time() * 1000)
+    random = secrets.randbits(RANDOM_BITS)
+    if timestamp <= _last_timestamp:
+        # Step forward by a random amount so neighbouring IDs can't be guessed from each other
+        timestamp = _last_timestamp
+        random = _last_random + 1 + secrets.randbits(16)
+        if random >= 1 << RANDOM_BITS:
+            timestamp += 1
+            random = secrets.randbits(RANDOM_BITS)
+
+    _last_timestamp = timestamp
+    _last_random = random
+
+    return _encode(timestamp, 10) + _encode(random, 8)
+
+
+async def insert_with_unique_slug(
+    document: Document, make_slug: Callable[[], str] = generate_id, max_attempts: int = 3
+) -> Document:
+    """
+    Inserts `document`, which is expected to be backed by a unique index on `slug`, picking a new slug with
+    `make_slug` whenever the current one is already taken.
+    """
+    for _ in range(max_attempts):
+        try:
+            return await document.insert()
+        except DuplicateKeyError as e:
+            if "slug" not in (e.details or {}).get("keyPattern", {}):
+                raise
+            document.slug = make_slug()
+
+    raise HTTPException(status_code=409, detail="Could not generate a unique slug")
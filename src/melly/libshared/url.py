@@ -0,0 +1,66 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Only parameters that never select content, `ref` or `si` pick branches, playlists and the like on some sites
+TRACKING_PARAMS = {
+    "fbclid",
+    "gclid",
+    "dclid",
+    "msclkid",
+    "yclid",
+    "igshid",
+    "mc_cid",
+    "mc_eid",
+    "_hsenc",
+    "_hsmi",
+}
+TRACKING_PARAM_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of `url` used for storage: lowercased scheme and host, no credentials, no default port, no fragment,
+    no tracking params, remaining params sorted and no trailing slash except for the root path.
+    """
+    parts = urlsplit(str(url).strip())
+    scheme = parts.scheme.lower()
+
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        # `hostname` drops the brackets of IPv6 addresses
+        host = f"[{host}]"
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+
+    params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not is_tracking_param(k)]
+    query = urlencode(sorted(params))
+
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def url_domain(url: str) -> str:
+    """
+    Lowercased host of `url` without a leading `www.`, what bookmarks are filtered by.
+    """
+    host = (urlsplit(str(url).strip()).hostname or "").lower()
+    return host.removeprefix("www.")
+
+
+def hash_url(url: str) -> str:
+    """
+    Hash identifying the page behind `url`. Built from the normalized URL with the scheme dropped so http and https
+    copies of the same page collide.
+    """
+    normalized = normalize_url(url)
+    _, _, rest = normalized.partition("://")
+    return hashlib.blake2b(rest.encode("utf-8"), digest_size=16).hexdigest()
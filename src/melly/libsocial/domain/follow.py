@@ -0,0 +1,152 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+import pytz
+from beanie import UpdateResponse
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from melly.libaccount.models import User
+from melly.libsocial.domain.timeline import Timeline
+from melly.libsocial.models import FollowOut, UserFollow
+
+
+class Follow:
+    @classmethod
+    async def follow(cls, username: str, user: User) -> None:
+        if username == user.username:
+            raise HTTPException(status_code=400, detail="You can't follow yourself")
+
+        if await User.find_view({"username": username, "deleted_at": None}) is None:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        try:
+            await UserFollow(follower_id=user.username, followee_id=username).insert()
+        except DuplicateKeyError:
+            # Already following
+            return
+
+        await User.increment_stats(username=user.username, following=1)
+        await User.increment_stats(username=username, followers=1)
+        await Timeline.backfill(owner_id=user.username, actor_id=username)
+
+    @classmethod
+    async def unfollow(cls, username: str, user: User) -> None:
+        now = datetime.now(tz=pytz.UTC)
+        query = {"follower_id": user.username, "followee_id": username, "deleted_at": None}
+        follow = await UserFollow.find_one(query).update(
+            {"$set": {"deleted_at": now, "updated_at": now}}, response_type=UpdateResponse.NEW_DOCUMENT
+        )
+        if follow is None:
+            raise HTTPException(status_code=404, detail="Not following this user")
+
+        await User.increment_stats(username=user.username, following=-1)
+        await User.increment_stats(username=username, followers=-1)
+        await Timeline.drop_actor(owner_id=user.username, actor_id=username)
+
+    @classmethod
+    async def adjust_stats(cls, follows: List[dict], amount: int) -> None:
+        """
+        Adds `amount` to the following and followers counts of both sides of `follows`, one bulk write.
+        """
+        amounts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        for follow in follows:
+            amounts[follow.get("follower_id")]["stats.following"] += amount
+            amounts[follow.get("followee_id")]["stats.followers"] += amount
+
+        # Accounts without stats yet are skipped like in `User.increment_stats`
+        requests = [
+            UpdateOne({"username": username, "stats": {"$type": "object"}}, {"$inc": dict(inc)})
+            for username, inc in amounts.items()
+        ]
+        if requests:
+            await User.get_motor_collection().bulk_write(requests, ordered=False)
+
+    @classmethod
+    async def delete_account_follows(cls, username: str, deleted_at: datetime) -> None:
+        """
+        Tombstones the follows of a deleted account in both directions with the account's timestamp, so it stops
+        counting as a follower and fan-out stops writing to its timeline.
+        """
+        collection = UserFollow.get_motor_collection()
+        query = {"$or": [{"follower_id": username}, {"followee_id": username}], "deleted_at": None}
+        follows = await collection.find(query, projection={"follower_id": 1, "followee_id": 1}).to_list(length=None)
+        if not follows:
+            return
+
+        await collection.update_many(
+            {"_id": {"$in": [x.get("_id") for x in follows]}, "deleted_at": None},
+            {"$set": {"deleted_at": deleted_at, "updated_at": deleted_at}},
+        )
+        await cls.adjust_stats(follows=follows, amount=-1)
+
+    @classmethod
+    async def restore_account_follows(cls, username: str, deleted_at: datetime) -> None:
+        """
+        Brings back the follows tombstoned with the account. Follows of accounts deleted since take their tombstone
+        instead and come back when that account does.
+        """
+        collection = UserFollow.get_motor_collection()
+        query = {"$or": [{"follower_id": username}, {"followee_id": username}], "deleted_at": deleted_at}
+        follows = await collection.find(query, projection={"follower_id": 1, "followee_id": 1}).to_list(length=None)
+        if not follows:
+            return
+
+        def counterpart(follow: dict) -> str:
+            return follow.get("followee_id") if follow.get("follower_id") == username else follow.get("follower_id")
+
+        deleted_users = (
+            await User.get_motor_collection()
+            .find(
+                {"username": {"$in": list({counterpart(x) for x in follows})}, "deleted_at": {"$type": "date"}},
+                projection={"username": 1, "deleted_at": 1},
+            )
+            .to_list(length=None)
+        )
+        tombstones = {x.get("username"): x.get("deleted_at") for x in deleted_users}
+
+        for other, other_deleted_at in tombstones.items():
+            ids = [x.get("_id") for x in follows if counterpart(x) == other]
+            await collection.update_many(
+                {"_id": {"$in": ids}}, {"$set": {"deleted_at": other_deleted_at, "updated_at": other_deleted_at}}
+            )
+
+        restored = [x for x in follows if counterpart(x) not in tombstones]
+        if not restored:
+            return
+
+        await collection.update_many(
+            {"_id": {"$in": [x.get("_id") for x in restored]}, "deleted_at": deleted_at},
+            {"$set": {"deleted_at": None, "updated_at": datetime.now(tz=pytz.UTC)}},
+        )
+        await cls.adjust_stats(follows=restored, amount=1)
+
+    @classmethod
+    async def list_follows(cls, match: dict, profile_field: str, skip: int = 0, limit: int = 10) -> List[FollowOut]:
+        pipeline = [
+            {"$match": {**match, "deleted_at": {"$eq": None}}},
+            {"$sort": {"created_at": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+        ]
+        follows = await UserFollow.aggregate(pipeline).to_list(length=limit)
+        profiles = await User.find_profiles(usernames=[x.get(profile_field) for x in follows])
+
+        result = []
+        for follow in follows:
+            profile = profiles.get(follow.get(profile_field))
+            if profile is not None:
+                result.append(FollowOut(**profile, followed_at=follow.get("created_at")))
+        return result
+
+    @classmethod
+    async def get_followers(cls, username: str, skip: int = 0, limit: int = 10) -> List[FollowOut]:
+        match = {"followee_id": username}
+        return await cls.list_follows(match=match, profile_field="follower_id", skip=skip, limit=limit)
+
+    @classmethod
+    async def get_following(cls, username: str, skip: int = 0, limit: int = 10) -> List[FollowOut]:
+        match = {"follower_id": username}
+        return await cls.list_follows(match=match, profile_field="followee_id", skip=skip, limit=limit)
@@ -0,0 +1,65 @@
+from typing import Dict, List
+
+from melly.libaccount.models import User, UserView
+from melly.libarticle.domain.article import Article
+from melly.libcollection.domain.bookmark import Bookmark
+from melly.libcollection.domain.collection import Collection
+from melly.libsocial.domain.timeline import Timeline, high_follower_accounts
+from melly.libsocial.models import TimelineItemOut, UserFollow, UserTimeline
+
+
+class HomeTimeline:
+    @classmethod
+    async def get_timeline(cls, user: User | UserView, skip: int = 0, limit: int = 20) -> List[TimelineItemOut]:
+        """
+        Newest posts of the accounts `user` follows. The fanned out ones come from a single timeline document, those
+        of accounts with too many followers to fan out are read from where they are stored and merged in.
+        """
+        wanted = skip + limit
+        timeline = await UserTimeline.get_motor_collection().find_one(
+            {"owner_id": user.username}, projection={"entries": {"$slice": wanted}}
+        )
+        entries = timeline.get("entries", []) if timeline else []
+
+        high_followers = await high_follower_accounts.get()
+        if high_followers:
+            query = {"follower_id": user.username, "followee_id": {"$in": list(high_followers)}, "deleted_at": None}
+            followed = await UserFollow.get_motor_collection().distinct("followee_id", query)
+            if followed:
+                entries = entries + await Timeline.recent_entries(actor_ids=followed, limit=wanted)
+
+        page = []
+        seen = set()
+        for entry in sorted(entries, key=lambda x: x.get("created_at"), reverse=True):
+            key = (entry.get("kind"), entry.get("slug"))
+            if key not in seen:
+                seen.add(key)
+                page.append(entry)
+
+        return await cls.hydrate(entries=page[skip:wanted])
+
+    @classmethod
+    async def hydrate(cls, entries: List[dict]) -> List[TimelineItemOut]:
+        """
+        Fetches the posts of `entries`, one batch per kind. Posts deleted or unpublished since they were fanned out are
+        left out.
+        """
+        slugs: Dict[str, List[str]] = {"article": [], "bookmark": [], "collection": []}
+        for entry in entries:
+            slugs[entry.get("kind")].append(entry.get("slug"))
+
+        found = {"article": {}, "bookmark": {}, "collection": {}}
+        if slugs["article"]:
+            found["article"] = {x.slug: x.article for x in await Article.batch_get(slugs=slugs["article"]) if x.found}
+        if slugs["bookmark"]:
+            bookmarks = await Bookmark.batch_get(slugs=slugs["bookmark"])
+            found["bookmark"] = {x.slug: x.bookmark for x in bookmarks if x.found}
+        if slugs["collection"]:
+            found["collection"] = {x.slug: x for x in await Collection.find_published(slugs=slugs["collection"])}
+
+        items = []
+        for entry in entries:
+            post = found[entry.get("kind")].get(entry.get("slug"))
+            if post is not None:
+                items.append(TimelineItemOut(**entry, **{entry.get("kind"): post}))
+        return items
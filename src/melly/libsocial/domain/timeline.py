@@ -0,0 +1,150 @@
+import time
+from datetime import datetime
+from typing import List, Set
+
+import pytz
+from pymongo import UpdateOne
+
+from melly.libaccount.models import User
+from melly.libarticle.models import Article as ArticleModel
+from melly.libcollection.models import BookmarkItem, Collection as CollectionModel
+from melly.libshared.settings import api_settings
+from melly.libsocial.models import TimelineEntry, TimelineKind, UserFollow, UserTimeline
+
+
+class HighFollowerAccounts:
+    """
+    Usernames of the accounts with more than `max_followers` followers. Their posts aren't fanned out, timelines read
+    them from where they are stored instead. Fan-out and reads look at the same set, so on a worker a post is always
+    either in the timelines or read with them. Reloaded every `refresh_in_seconds`.
+    """
+
+    def __init__(self, max_followers: int, refresh_in_seconds: int):
+        self.max_followers = max_followers
+        self.refresh_in_seconds = refresh_in_seconds
+
+        self._usernames: Set[str] = set()
+        self._loaded_at: float | None = None
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_in_seconds
+
+    async def get(self) -> Set[str]:
+        if self.is_stale:
+            # Served by the partial index on `stats.followers`
+            pipeline = [
+                {"$match": {"stats.followers": {"$gt": self.max_followers}, "deleted_at": None}},
+                {"$project": {"_id": 0, "username": 1}},
+            ]
+            users = await User.aggregate(pipeline).to_list(length=None)
+            self._usernames = {x.get("username") for x in users}
+            self._loaded_at = time.monotonic()
+        return self._usernames
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+
+class Timeline:
+    @classmethod
+    async def push(cls, owner_ids: List[str], entries: List[dict]) -> None:
+        """
+        Adds `entries` to the timelines of `owner_ids` in one bulk write, each timeline keeps its newest
+        `timeline_size` entries.
+        """
+        now = datetime.now(tz=pytz.UTC)
+        update = {
+            "$push": {"entries": {"$each": entries, "$sort": {"created_at": -1}, "$slice": api_settings.timeline_size}},
+            "$set": {"updated_at": now},
+        }
+        requests = [UpdateOne({"owner_id": x}, update, upsert=True) for x in owner_ids]
+        await UserTimeline.get_motor_collection().bulk_write(requests, ordered=False)
+
+    @classmethod
+    async def fan_out(cls, kind: TimelineKind, slug: str, actor_id: str, created_at: datetime) -> None:
+        """
+        Writes a new post to the timelines of the followers of `actor_id`, in batches of `timeline_fanout_batch_size`.
+        """
+        if actor_id in await high_follower_accounts.get():
+            return
+
+        entry = TimelineEntry(kind=kind, slug=slug, actor_id=actor_id, created_at=created_at).model_dump()
+        query = {"followee_id": actor_id, "deleted_at": None}
+        followers = []
+        async for follow in UserFollow.get_motor_collection().find(query, projection={"_id": 0, "follower_id": 1}):
+            followers.append(follow.get("follower_id"))
+            if len(followers) == api_settings.timeline_fanout_batch_size:
+                await cls.push(owner_ids=followers, entries=[entry])
+                followers = []
+
+        if followers:
+            await cls.push(owner_ids=followers, entries=[entry])
+
+    @classmethod
+    async def recent_entries(cls, actor_ids: List[str], limit: int) -> List[dict]:
+        """
+        Newest `limit` posts of `actor_ids` read from where they are stored, one indexed query per kind.
+        """
+        articles = await ArticleModel.aggregate(
+            [
+                {"$match": {"author_id": {"$in": actor_ids}, "deleted_at": {"$eq": None}}},
+                {"$sort": {"created_at": -1}},
+                {"$limit": limit},
+                {"$project": {"_id": 0, "slug": 1, "actor_id": "$author_id", "created_at": 1}},
+            ]
+        ).to_list(length=limit)
+        bookmarks = await BookmarkItem.aggregate(
+            [
+                {"$match": {"owner_id": {"$in": actor_ids}, "deleted_at": {"$eq": None}}},
+                {"$sort": {"created_at": -1}},
+                {"$limit": limit},
+                {"$project": {"_id": 0, "slug": 1, "actor_id": "$owner_id", "created_at": 1}},
+            ]
+        ).to_list(length=limit)
+        collections = await CollectionModel.aggregate(
+            [
+                {
+                    "$match": {
+                        "owner_id": {"$in": actor_ids},
+                        "published_at": {"$type": "date"},
+                        "deleted_at": {"$eq": None},
+                    }
+                },
+                {"$sort": {"published_at": -1}},
+                {"$limit": limit},
+                {"$project": {"_id": 0, "slug": 1, "actor_id": "$owner_id", "created_at": "$published_at"}},
+            ]
+        ).to_list(length=limit)
+
+        entries = [
+            *[{"kind": "article", **x} for x in articles],
+            *[{"kind": "bookmark", **x} for x in bookmarks],
+            *[{"kind": "collection", **x} for x in collections],
+        ]
+        entries.sort(key=lambda x: x.get("created_at"), reverse=True)
+        return entries[:limit]
+
+    @classmethod
+    async def backfill(cls, owner_id: str, actor_id: str) -> None:
+        """
+        Fills a new follow's latest posts into the timeline of the follower.
+        """
+        if actor_id in await high_follower_accounts.get():
+            return
+
+        entries = await cls.recent_entries(actor_ids=[actor_id], limit=api_settings.timeline_backfill_size)
+        if entries:
+            await cls.push(owner_ids=[owner_id], entries=entries)
+
+    @classmethod
+    async def drop_actor(cls, owner_id: str, actor_id: str) -> None:
+        await UserTimeline.get_motor_collection().update_one(
+            {"owner_id": owner_id}, {"$pull": {"entries": {"actor_id": actor_id}}}
+        )
+
+
+high_follower_accounts = HighFollowerAccounts(
+    max_followers=api_settings.timeline_fanout_max_followers,
+    refresh_in_seconds=api_settings.timeline_high_follower_refresh_in_seconds,
+)
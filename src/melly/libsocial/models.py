@@ -0,0 +1,81 @@
+from datetime import datetime
+from typing import List, Literal
+
+import pytz
+from beanie import Document
+from pydantic import Field, HttpUrl
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from melly.libarticle.models import ArticleOut
+from melly.libcollection.models import BookmarkItemOut, CollectionOut
+from melly.libshared.constants import DELETED_FILTER, NOT_DELETED_FILTER
+from melly.libshared.models import BaseDateTimeMeta, BaseMellyAPIModel
+
+TimelineKind = Literal["article", "bookmark", "collection"]
+
+
+class UserFollow(Document, BaseDateTimeMeta):
+    follower_id: str
+    followee_id: str
+
+    class Settings:
+        name = "user-follows"
+        indexes = [
+            IndexModel(
+                [("follower_id", ASCENDING), ("followee_id", ASCENDING)],
+                unique=True,
+                partialFilterExpression=NOT_DELETED_FILTER,
+            ),
+            # Followers of an account, walked by fan-out
+            IndexModel(
+                [("followee_id", ASCENDING), ("created_at", DESCENDING)], partialFilterExpression=NOT_DELETED_FILTER
+            ),
+            IndexModel(
+                [("follower_id", ASCENDING), ("created_at", DESCENDING)], partialFilterExpression=NOT_DELETED_FILTER
+            ),
+            IndexModel([("deleted_at", ASCENDING)], partialFilterExpression=DELETED_FILTER),
+        ]
+
+
+class TimelineEntry(BaseMellyAPIModel):
+    kind: TimelineKind
+    slug: str
+    actor_id: str
+    created_at: datetime
+
+
+class UserTimeline(Document):
+    """
+    Home timeline of a user, the newest `timeline_size` posts of the accounts they follow, newest first. Written by
+    fan-out when followed accounts post so reading it is a single document fetch however many accounts are followed.
+    """
+
+    owner_id: str
+    entries: List[TimelineEntry] = Field(default_factory=list)
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(tz=pytz.UTC))
+
+    class Settings:
+        name = "user-timelines"
+        indexes = [
+            IndexModel([("owner_id", ASCENDING)], unique=True),
+        ]
+
+
+class FollowOut(BaseMellyAPIModel):
+    name: str
+    picture: HttpUrl | None = None
+    username: str
+
+    followed_at: datetime = Field(..., alias="followedAt")
+
+
+class TimelineItemOut(BaseMellyAPIModel):
+    kind: TimelineKind
+    slug: str
+    actor_id: str
+    created_at: datetime
+
+    # The one matching `kind`
+    article: ArticleOut | None = None
+    bookmark: BookmarkItemOut | None = None
+    collection: CollectionOut | None = None
@@ -0,0 +1,146 @@
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import pytz
+from beanie import Document
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+from melly.libaccount.models import User, UserView
+from melly.libarticle.domain.article import Article
+from melly.libarticle.models import Article as ArticleModel
+from melly.libcollection.domain.bookmark import Bookmark
+from melly.libcollection.domain.collection import Collection
+from melly.libcollection.models import BookmarkItem, Collection as CollectionModel
+from melly.libshared.settings import api_settings
+from melly.libsync.models import SyncDeletedOut, SyncOut
+
+# Synced collections and the field holding their owner, each served by an `(owner, updated_at, _id)` index
+sync_sources: Dict[str, Tuple[type[Document], str]] = {
+    "articles": (ArticleModel, "author_id"),
+    "bookmarks": (BookmarkItem, "owner_id"),
+    "collections": (CollectionModel, "owner_id"),
+}
+
+# `(updated_at, _id)` of the last document sent, see Sync.after_position
+Position = Tuple[datetime | None, ObjectId | None]
+
+
+class Sync:
+    @classmethod
+    def encode_token(cls, issued_at: datetime, positions: Dict[str, Position]) -> str:
+        raw = {
+            "issued_at": issued_at.isoformat(),
+            "positions": {
+                name: [updated_at.isoformat() if updated_at else None, str(last_id) if last_id else None]
+                for name, (updated_at, last_id) in positions.items()
+            },
+        }
+        return base64.urlsafe_b64encode(json.dumps(raw).encode("utf-8")).decode("utf-8")
+
+    @classmethod
+    def decode_token(cls, token: str) -> Tuple[datetime, Dict[str, Position]]:
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(token.encode("utf-8")).decode("utf-8"))
+            positions = {}
+            for name in sync_sources:
+                updated_at, last_id = raw["positions"][name]
+                positions[name] = (
+                    datetime.fromisoformat(updated_at) if updated_at else None,
+                    ObjectId(last_id) if last_id else None,
+                )
+            issued_at = datetime.fromisoformat(raw["issued_at"])
+            if issued_at.tzinfo is None:
+                issued_at = issued_at.replace(tzinfo=pytz.UTC)
+            return issued_at, positions
+        except (ValueError, TypeError, KeyError, InvalidId):
+            raise HTTPException(status_code=400, detail="Invalid sync token")
+
+    @classmethod
+    def after_position(cls, position: Position) -> dict:
+        """
+        `$match` clause continuing an ascending `(updated_at, _id)` scan after `position`. Documents saved before
+        `updated_at` was set on insert have none and sort first. A position without an `_id` rewinds to everything
+        updated since its `updated_at`.
+        """
+        updated_at, last_id = position
+        if updated_at is None:
+            if last_id is None:
+                return {}
+            return {"$or": [{"updated_at": None, "_id": {"$gt": last_id}}, {"updated_at": {"$type": "date"}}]}
+
+        if last_id is None:
+            return {"updated_at": {"$gte": updated_at}}
+        return {"$or": [{"updated_at": {"$gt": updated_at}}, {"updated_at": updated_at, "_id": {"$gt": last_id}}]}
+
+    @classmethod
+    async def find_changes(cls, name: str, user: User | UserView, position: Position, limit: int) -> List[dict]:
+        model, owner_field = sync_sources[name]
+        pipeline = [
+            {"$match": {owner_field: user.username, **cls.after_position(position)}},
+            {"$sort": {"updated_at": 1, "_id": 1}},
+            {"$limit": limit},
+        ]
+        return await model.aggregate(pipeline).to_list(length=limit)
+
+    @classmethod
+    async def get_changes(cls, user: User | UserView, since: str | None = None, limit: int = 100) -> SyncOut:
+        """
+        Articles, bookmarks and collections of `user` created, updated or deleted since `since`, oldest change first.
+        Without `since` every document is sent, tombstones included, so clients can start from an empty store.
+
+        Each page holds at most `limit` documents. Once the changes run out, the token rewinds by
+        `sync_lag_in_seconds` so writes that committed after later ones are not missed, at the cost of resending a
+        few documents. Tokens older than the purge retention are refused, deletions may have been purged since.
+        """
+        now = datetime.now(tz=pytz.UTC)
+        lag = timedelta(seconds=api_settings.sync_lag_in_seconds)
+        retention = timedelta(seconds=api_settings.purge_retention_in_seconds)
+
+        positions: Dict[str, Position] = {name: (None, None) for name in sync_sources}
+        if since is not None:
+            issued_at, positions = cls.decode_token(since)
+            if issued_at - lag < now - retention:
+                raise HTTPException(status_code=410, detail="Sync token expired, sync from scratch")
+
+        # One more than the page so a full page tells whether there is more
+        results = await asyncio.gather(
+            *[
+                cls.find_changes(name=name, user=user, position=positions[name], limit=limit + 1)
+                for name in sync_sources
+            ]
+        )
+
+        oldest = datetime.min
+        changes = sorted(
+            [(name, x) for name, documents in zip(sync_sources, results) for x in documents],
+            key=lambda x: (x[1].get("updated_at") or oldest, x[1].get("_id")),
+        )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        profile = {"username": user.username, "name": user.name, "picture": user.picture}
+        sync = SyncOut(token="", has_more=has_more)
+        for name, document in changes:
+            positions[name] = (document.get("updated_at"), document.get("_id"))
+
+            if document.get("deleted_at") is not None:
+                deleted = SyncDeletedOut(slug=document.get("slug"), deleted_at=document.get("deleted_at"))
+                getattr(sync, f"deleted_{name}").append(deleted)
+            elif name == "articles":
+                sync.articles.append(Article.build_article_response({**document, "author": profile}))
+            elif name == "bookmarks":
+                sync.bookmarks.append(Bookmark.build_bookmark_response({**document, "owner": profile}))
+            else:
+                sync.collections.append(Collection.build_collection_response({**document, "owner": profile}))
+
+        if not has_more:
+            caught_up = (now - lag, None)
+            positions = {name: caught_up for name in sync_sources}
+
+        sync.token = cls.encode_token(issued_at=now, positions=positions)
+        return sync
@@ -0,0 +1,31 @@
+from datetime import datetime
+from typing import List
+
+from pydantic import Field
+
+from melly.libarticle.models import ArticleOut
+from melly.libcollection.models import BookmarkItemOut, CollectionOut
+from melly.libshared.models import BaseMellyAPIModel
+
+
+class SyncDeletedOut(BaseMellyAPIModel):
+    slug: str
+    deleted_at: datetime
+
+
+class SyncOut(BaseMellyAPIModel):
+    """
+    One page of changes. Documents may show up again on a later page when they changed in between, clients upsert them
+    by slug and keep syncing with `token` while `has_more` is set.
+    """
+
+    articles: List[ArticleOut] = Field(default_factory=list)
+    bookmarks: List[BookmarkItemOut] = Field(default_factory=list)
+    collections: List[CollectionOut] = Field(default_factory=list)
+
+    deleted_articles: List[SyncDeletedOut] = Field(default_factory=list)
+    deleted_bookmarks: List[SyncDeletedOut] = Field(default_factory=list)
+    deleted_collections: List[SyncDeletedOut] = Field(default_factory=list)
+
+    token: str
+    has_more: bool
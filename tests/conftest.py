@@ -2,7 +2,8 @@ import base64
 import uuid
 from os import environ
 from secrets import token_hex
-from typing import Tuple
+from typing import Awaitable, Callable, Tuple
+from urllib.parse import urlparse, parse_qs
 
 import pytest
 import pytest_asyncio
@@ -11,7 +12,7 @@ from httpx import AsyncClient, ASGITransport
 
 from melly.appmellyapi.db import api_models
 from melly.appmellyapi.web import app, lifespan
-from melly.libaccount.models import SocialAuthSession
+from melly.libaccount.models import AccessTokenResponse, MyProfile, SocialAuthSession
 
 fake = Faker()
 
@@ -43,10 +44,40 @@ async def google_auth():
             "email": fake.email(),
             "picture": fake.image_url(),
         }
-        await session.save()
 
         return session.profile.get("email"), session.profile.get("name"), session.profile.get("picture")
 
     from melly.libaccount.domain.account import Account
 
     Account.authorize_google = authorize_google
+
+
+@pytest.fixture(scope="function")
+def login(api_client: AsyncClient, google_auth) -> Callable[[], Awaitable[dict]]:
+    """
+    Logs a new user in through the Google flow, returns their auth `headers`, `username` and issued `tokens`.
+    """
+
+    async def login_user() -> dict:
+        response = await api_client.get("/v1/me/auth/google")
+
+        assert response.status_code == 200
+
+        query_strings = parse_qs(urlparse(response.json().get("url")).query)
+        params = {"state": query_strings.get("state"), "code": token_hex(23)}
+        response = await api_client.get("/v1/me/auth/google/callback", params=params)
+
+        assert response.status_code == 302
+
+        code = parse_qs(urlparse(response.headers.get("location")).query).get("code")
+        response = await api_client.get("/v1/me/access/token", params={"code": code})
+
+        assert response.status_code == 200
+
+        tokens = AccessTokenResponse(**response.json())
+        headers = {"authorization": f"Bearer {tokens.access_token}"}
+        response = await api_client.get("/v1/me", headers=headers)
+
+        return {"headers": headers, "username": MyProfile(**response.json()).username, "tokens": tokens}
+
+    return login_user
@@ -1,3 +1,4 @@
+import asyncio
 from secrets import token_hex
 from urllib.parse import urlparse, parse_qs
 
@@ -7,7 +8,8 @@ from faker import Faker
 from httpx import AsyncClient
 
 from melly.libaccount.models import AccessTokenResponse, MyProfile
-from melly.libarticle.models import ArticleOut
+from melly.libarticle.domain.article import article_views
+from melly.libarticle.models import Article, ArticleBatchItemOut, ArticleOut
 
 fake = Faker()
 
@@ -77,6 +79,9 @@ async def test_articles(api_client: AsyncClient, google_auth):
     assert article.description == payload.get("description")
     assert str(article.image) == str(payload.get("image"))
     assert article.content_in_markdown == payload.get("content_in_markdown")
+    assert article.content_in_html == "<h1>Hello</h1>\n<p>World.</p>\n"
+    assert article.excerpt == "Hello World."
+    assert article.content_hash
     assert article.author_name == my_profile.name
     assert str(article.author_picture) == str(my_profile.picture)
     assert article.slug
@@ -92,6 +97,12 @@ async def test_articles(api_client: AsyncClient, google_auth):
     assert len(articles) == 1
     assert articles[0].slug == article.slug
 
+    # My articles summary
+    response = await api_client.get("/v1/articles", headers=headers, params={"fields": "slug,excerpt,authorName"})
+
+    assert response.status_code == 200
+    assert response.json() == [{"slug": article.slug, "excerpt": "Hello World.", "authorName": my_profile.name}]
+
     # Article profile
     response = await api_client.get(f"/v1/articles/{article.slug}")
 
@@ -101,9 +112,28 @@ async def test_articles(api_client: AsyncClient, google_auth):
 
     assert article_profile.slug == article.slug
 
+    # Batch get, in request order with missing slugs marked
+    batch_payload = {"slugs": ["missing", article.slug, article.slug]}
+
+    response = await api_client.post("/v1/articles:batchGet", json=batch_payload)
+
+    assert response.status_code == 200
+
+    results = [ArticleBatchItemOut(**x) for x in response.json()]
+
+    assert [x.slug for x in results] == batch_payload.get("slugs")
+    assert [x.found for x in results] == [False, True, True]
+    assert results[0].article is None
+    assert results[1].article.slug == article.slug
+    assert results[1].article.author_name == my_profile.name
+
+    response = await api_client.post("/v1/articles:batchGet", json={"slugs": [token_hex(4) for _ in range(101)]})
+
+    assert response.status_code == 422
+
     # Update article
     update_payload = payload.copy()
-    update_payload.update({"title": fake.street_name()})
+    update_payload.update({"title": fake.street_name(), "content_in_markdown": "<script>alert(1)</script>"})
 
     response = await api_client.put(f"/v1/articles/{article.slug}", json=update_payload, headers=headers)
 
@@ -113,3 +143,74 @@ async def test_articles(api_client: AsyncClient, google_auth):
 
     assert updated_article.title == update_payload.get("title")
     assert updated_article.slug == article.slug
+    assert updated_article.content_in_html == "<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>\n"
+    assert updated_article.content_hash != article.content_hash
+
+    # Delete article
+    response = await api_client.delete(f"/v1/articles/{article.slug}", headers=headers)
+
+    assert response.status_code == 204
+
+    response = await api_client.get(f"/v1/articles/{article.slug}")
+
+    assert response.status_code == 404
+
+    response = await api_client.get("/v1/articles", headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.json()) == 0
+
+    response = await api_client.delete(f"/v1/articles/{article.slug}", headers=headers)
+
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_article_views(api_client: AsyncClient, login, monkeypatch):
+    headers = (await login()).get("headers")
+
+    payload = {"title": fake.sentence(), "description": fake.sentence(), "content_in_markdown": fake.text()}
+    response = await api_client.post("/v1/articles", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    slug = ArticleOut(**response.json()).slug
+
+    # Views are counted in memory, reading an article doesn't write
+    for views in range(1, 4):
+        response = await api_client.get(f"/v1/articles/{slug}")
+
+        assert response.status_code == 200
+        assert ArticleOut(**response.json()).view_count == views
+
+    assert (await Article.find_one({"slug": slug})).view_count == 0
+
+    await article_views.flush()
+
+    assert (await Article.find_one({"slug": slug})).view_count == 3
+    assert article_views.pending(slug) == 0
+
+    # Edits keep the views flushed in between
+    response = await api_client.get(f"/v1/articles/{slug}")
+    await article_views.flush()
+    response = await api_client.put(f"/v1/articles/{slug}", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    assert ArticleOut(**response.json()).view_count == 4
+
+    # Flushed early once enough articles have pending views
+    monkeypatch.setattr(article_views, "max_keys", 1)
+    response = await api_client.get(f"/v1/articles/{slug}")
+    for _ in range(100):
+        if (await Article.find_one({"slug": slug})).view_count == 5:
+            break
+        await asyncio.sleep(0.01)
+
+    assert (await Article.find_one({"slug": slug})).view_count == 5
+
+    # And on shutdown
+    monkeypatch.setattr(article_views, "max_keys", 1000)
+    response = await api_client.get(f"/v1/articles/{slug}")
+    await article_views.stop()
+
+    assert (await Article.find_one({"slug": slug})).view_count == 6
@@ -3,9 +3,13 @@ from urllib.parse import urlparse, parse_qs
 
 import pytest
 import ujson
+from fastapi.security import HTTPAuthorizationCredentials
 from httpx import AsyncClient
 
-from melly.libaccount.models import AccessTokenResponse, MyProfile
+from melly.appmellyapi.auth import jwt_auth, rate_limit_key
+from melly.libaccount.domain.account import Account
+from melly.libaccount.domain.tokens import RefreshTokens
+from melly.libaccount.models import AccessTokenResponse, MyProfile, User
 
 
 @pytest.mark.asyncio
@@ -66,3 +70,150 @@ async def test_auth_and_me(api_client: AsyncClient, google_auth):
     updated_profile = MyProfile(**response.json())
 
     assert updated_profile.username == payload.get("username")
+
+    # Delete account
+    response = await api_client.delete("/v1/me", headers=headers)
+
+    assert response.status_code == 204
+
+    response = await api_client.put("/v1/me/username", headers=headers, json={"username": token_hex(23)})
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_rotation(api_client: AsyncClient, login):
+    me = await login()
+    access_token_response = me.get("tokens")
+
+    # Refreshing rotates the refresh token
+    payload = {"refreshToken": access_token_response.refresh_token}
+    response = await api_client.post("/v1/me/access/token/refresh", json=payload)
+
+    assert response.status_code == 200
+
+    rotated = AccessTokenResponse(**response.json())
+
+    assert rotated.refresh_token != access_token_response.refresh_token
+
+    response = await api_client.get("/v1/me", headers={"authorization": f"Bearer {rotated.access_token}"})
+
+    assert response.status_code == 200
+
+    # Access tokens aren't refresh tokens
+    response = await api_client.post("/v1/me/access/token/refresh", json={"refreshToken": rotated.access_token})
+
+    assert response.status_code == 401
+
+    # Nor refresh tokens access tokens, public routes still answer
+    refresh_headers = {"authorization": f"Bearer {rotated.refresh_token}"}
+    response = await api_client.get("/v1/me", headers=refresh_headers)
+
+    assert response.status_code == 401
+
+    response = await api_client.get("/v1/collections/published", headers=refresh_headers)
+
+    assert response.status_code == 200
+
+    scope = {"type": "http", "headers": [(b"authorization", f"Bearer {rotated.refresh_token}".encode())]}
+
+    assert rate_limit_key({**scope, "client": ("127.0.0.1", 1)}) == "ip:127.0.0.1"
+
+    # Reusing a rotated out refresh token revokes the whole login
+    response = await api_client.post("/v1/me/access/token/refresh", json=payload)
+
+    assert response.status_code == 401
+
+    response = await api_client.post("/v1/me/access/token/refresh", json={"refreshToken": rotated.refresh_token})
+
+    assert response.status_code == 401
+
+    response = await api_client.get("/v1/me", headers={"authorization": f"Bearer {rotated.access_token}"})
+
+    assert response.status_code == 401
+
+    # Two more logins of the same user
+    user = await User.find_one({"username": me.get("username")})
+    logins = []
+    for _ in range(2):
+        family = await RefreshTokens.start_family(user_identifier=user.identifier)
+        access_token, refresh_token = Account.generate_access_and_refresh_token(user=user, family=family)
+        logins.append(({"authorization": f"Bearer {access_token}"}, {"refreshToken": refresh_token}))
+
+    # Logging out ends only that login
+    response = await api_client.post("/v1/me/logout", headers=logins[0][0])
+
+    assert response.status_code == 204
+
+    response = await api_client.get("/v1/me", headers=logins[0][0])
+
+    assert response.status_code == 401
+
+    response = await api_client.post("/v1/me/access/token/refresh", json=logins[0][1])
+
+    assert response.status_code == 401
+
+    response = await api_client.get("/v1/me", headers=logins[1][0])
+
+    assert response.status_code == 200
+
+    # Logging out everywhere ends the rest
+    response = await api_client.post("/v1/me/logout/everywhere", headers=logins[1][0])
+
+    assert response.status_code == 204
+
+    response = await api_client.get("/v1/me", headers=logins[1][0])
+
+    assert response.status_code == 401
+
+    response = await api_client.post("/v1/me/access/token/refresh", json=logins[1][1])
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_token_subject(api_client: AsyncClient, login):
+    access_token_response = (await login()).get("tokens")
+    headers = {"authorization": f"Bearer {access_token_response.access_token}"}
+    response = await api_client.get("/v1/me", headers=headers)
+
+    assert response.status_code == 200
+
+    my_profile = MyProfile(**response.json())
+    user = await Account.get_user_by_email(email=my_profile.email)
+    claims = jwt_auth.verify(
+        HTTPAuthorizationCredentials(scheme="Bearer", credentials=access_token_response.access_token)
+    )
+
+    assert claims.sub == user.identifier
+
+    # Tokens are resolved by their subject, not by the email they carry
+    new_email = f"new-{my_profile.email}"
+    await User.find_one({"_id": user.id}).update({"$set": {"email": new_email}})
+
+    response = await api_client.get("/v1/me", headers=headers)
+
+    assert response.status_code == 200
+    assert MyProfile(**response.json()).email == new_email
+
+    payload = {"refreshToken": access_token_response.refresh_token}
+    response = await api_client.post("/v1/me/access/token/refresh", json=payload)
+
+    assert response.status_code == 200
+
+    refreshed = AccessTokenResponse(**response.json())
+    headers = {"authorization": f"Bearer {refreshed.access_token}"}
+    response = await api_client.get("/v1/me", headers=headers)
+
+    assert response.status_code == 200
+    assert MyProfile(**response.json()).email == new_email
+
+    # Deleted users can't refresh
+    response = await api_client.delete("/v1/me", headers=headers)
+
+    assert response.status_code == 204
+
+    payload = {"refreshToken": refreshed.refresh_token}
+    response = await api_client.post("/v1/me/access/token/refresh", json=payload)
+
+    assert response.status_code == 401
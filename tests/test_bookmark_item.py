@@ -1,3 +1,4 @@
+import json
 from secrets import token_hex
 from urllib.parse import urlparse, parse_qs
 
@@ -6,8 +7,19 @@ import ujson
 from faker import Faker
 from httpx import AsyncClient
 
+from melly.libaccount.domain.account import Account
 from melly.libaccount.models import AccessTokenResponse, MyProfile
-from melly.libcollection.models import BookmarkItemOut
+from melly.libcollection.domain.bookmark import Bookmark
+from melly.libcollection.models import (
+    BookmarkBatchItemOut,
+    BookmarkItem,
+    BookmarkItemNote,
+    BookmarkItemOut,
+    BookmarkItemSummaryOut,
+    BookmarkNotePageOut,
+)
+from melly.libshared.settings import api_settings
+from melly.libshared.url import hash_url, normalize_url
 
 fake = Faker()
 
@@ -105,6 +117,19 @@ async def test_bookmark_item(api_client: AsyncClient, google_auth):
     assert bookmark_by_slug.owner_picture == bookmark.owner_picture
     assert bookmark_by_slug.slug == bookmark.slug
 
+    # Batch get, in request order with missing slugs marked
+    response = await api_client.post("/v1/bookmarks:batchGet", json={"slugs": [bookmark.slug, "missing"]})
+
+    assert response.status_code == 200
+
+    results = [BookmarkBatchItemOut(**x) for x in response.json()]
+
+    assert [x.found for x in results] == [True, False]
+    assert results[0].bookmark.slug == bookmark.slug
+    assert results[0].bookmark.owner_name == my_profile.name
+    assert results[1].slug == "missing"
+    assert results[1].bookmark is None
+
     # Update bookmark
     update_payload = payload.copy()
     update_payload.update({"url": fake.url()})
@@ -144,3 +169,283 @@ async def test_bookmark_item(api_client: AsyncClient, google_auth):
     assert bookmark.notes
     assert len(bookmark.notes) == 1
     assert bookmark.notes[0].content == payload.get("content")
+
+    # My bookmarks summary
+    response = await api_client.get("/v1/bookmarks", headers=headers, params={"fields": "summary"})
+
+    assert response.status_code == 200
+
+    summaries = [BookmarkItemSummaryOut(**x) for x in response.json()]
+
+    assert len(summaries) == 1
+    assert summaries[0].slug == bookmark.slug
+    assert summaries[0].note_count == 1
+    assert summaries[0].owner_name == my_profile.name
+    assert "notes" not in response.json()[0]
+
+    # Delete bookmark
+    response = await api_client.delete(f"/v1/bookmarks/{bookmark.slug}", headers=headers)
+
+    assert response.status_code == 204
+
+    response = await api_client.get(f"/v1/bookmarks/{bookmark.slug}")
+
+    assert response.status_code == 404
+
+    # Saving the same page again
+    payload = {"url": "http://example.com/some/page/?utm_source=newsletter#section", "tags": []}
+
+    response = await api_client.post("/v1/bookmarks", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    bookmark = BookmarkItemOut(**response.json())
+
+    assert str(bookmark.url) == "http://example.com/some/page"
+
+    payload = {"url": "https://EXAMPLE.com/some/page", "tags": []}
+
+    response = await api_client.post("/v1/bookmarks", json=payload, headers=headers)
+
+    assert response.status_code == 409
+
+    response = await api_client.post("/v1/bookmarks", json=payload, headers=headers, params={"on_duplicate": "return"})
+
+    assert response.status_code == 200
+    assert BookmarkItemOut(**response.json()).slug == bookmark.slug
+
+    response = await api_client.get("/v1/bookmarks/count", params={"url": "https://example.com/some/page/"})
+
+    assert response.status_code == 200
+    assert response.json().get("count") == 1
+
+    # IPv6 hosts keep their brackets, credentials aren't stored
+    payload = {"url": "http://user:secret@[::1]:8080/a/", "tags": []}
+
+    response = await api_client.post("/v1/bookmarks", json=payload, headers=headers)
+
+    assert response.status_code == 201
+    assert str(BookmarkItemOut(**response.json()).url) == "http://[::1]:8080/a"
+    assert normalize_url("https://[2001:DB8::1]/") == "https://[2001:db8::1]/"
+
+    # Parameters that may select content aren't dropped
+    for ref in ("a", "b"):
+        payload = {"url": f"https://example.com/repo?ref={ref}", "tags": []}
+        response = await api_client.post("/v1/bookmarks", json=payload, headers=headers)
+
+        assert response.status_code == 201
+        assert str(BookmarkItemOut(**response.json()).url) == f"https://example.com/repo?ref={ref}"
+
+    assert hash_url("https://example.com/repo?ref=a") != hash_url("https://example.com/repo?ref=b")
+
+
+@pytest.mark.asyncio
+async def test_bookmark_filters(api_client: AsyncClient, login):
+    headers = (await login()).get("headers")
+    response = await api_client.get("/v1/me", headers=headers)
+
+    assert response.status_code == 200
+
+    my_profile = MyProfile(**response.json())
+
+    # Update username
+    payload = {"username": token_hex(23)}
+
+    response = await api_client.put("/v1/me/username", headers=headers, json=payload)
+
+    assert response.status_code == 200
+
+    updated_profile = MyProfile(**response.json())
+
+    assert updated_profile.username == payload.get("username")
+
+    # Create bookmarks on two domains, the first one tagged
+    tag = token_hex(8)
+    urls = ["https://www.example.com/first", "https://example.org/second", "https://example.com/third"]
+    slugs = []
+    for index, url in enumerate(urls):
+        payload = {"url": url, "tags": [tag] if index == 0 else []}
+        response = await api_client.post("/v1/bookmarks", json=payload, headers=headers)
+
+        assert response.status_code == 201
+
+        slugs.append(response.json().get("slug"))
+
+    # Newest first by default
+    response = await api_client.get("/v1/bookmarks", headers=headers)
+
+    assert response.status_code == 200
+    assert [x.get("slug") for x in response.json()] == slugs[::-1]
+
+    response = await api_client.get("/v1/bookmarks", headers=headers, params={"sort": "asc"})
+
+    assert [x.get("slug") for x in response.json()] == slugs
+
+    # Updating moves a bookmark to the front when sorting by update
+    payload = {"url": urls[0], "tags": [tag], "content": fake.sentence()}
+    response = await api_client.put(f"/v1/bookmarks/{slugs[0]}", json=payload, headers=headers)
+
+    assert response.status_code == 200
+
+    response = await api_client.get("/v1/bookmarks", headers=headers, params={"sort_by": "updated_at"})
+
+    assert [x.get("slug") for x in response.json()][0] == slugs[0]
+
+    # Filters
+    response = await api_client.get("/v1/bookmarks", headers=headers, params={"tag": tag})
+
+    assert [x.get("slug") for x in response.json()] == [slugs[0]]
+
+    response = await api_client.get("/v1/bookmarks", headers=headers, params={"domain": "example.com"})
+
+    assert [x.get("slug") for x in response.json()] == [slugs[2], slugs[0]]
+
+    params = {"domain": "www.example.org", "fields": "slug"}
+    response = await api_client.get("/v1/bookmarks", headers=headers, params=params)
+
+    assert response.json() == [{"slug": slugs[1]}]
+
+    response = await api_client.get(f"/v1/bookmarks/{slugs[1]}")
+    created_at = BookmarkItemOut(**response.json()).created_at
+
+    params = {"after": created_at.isoformat(), "sort": "asc"}
+    response = await api_client.get("/v1/bookmarks", headers=headers, params=params)
+
+    assert [x.get("slug") for x in response.json()] == slugs[1:]
+
+    params = {"before": created_at.isoformat()}
+    response = await api_client.get("/v1/bookmarks", headers=headers, params=params)
+
+    assert [x.get("slug") for x in response.json()] == [slugs[0]]
+
+    # Every supported combination is served by an index
+    user = await Account.get_user_by_email(email=my_profile.email)
+    database = BookmarkItem.get_motor_collection().database
+    for sort_by in ["created_at", "updated_at"]:
+        for filters in [{}, {"tag": tag}, {"domain": "example.com"}, {"tag": tag, "after": created_at}]:
+            pipeline = Bookmark.my_bookmarks_pipeline(user=user, sort_by=sort_by, **filters)
+            command = {"aggregate": BookmarkItem.get_collection_name(), "pipeline": pipeline, "cursor": {}}
+            explain = await database.command({"explain": command, "verbosity": "queryPlanner"})
+
+            assert "IXSCAN" in json.dumps(explain, default=str)
+            assert "COLLSCAN" not in json.dumps(explain, default=str)
+
+
+@pytest.mark.asyncio
+async def test_bookmark_notes(api_client: AsyncClient, login, monkeypatch):
+    headers = (await login()).get("headers")
+
+    monkeypatch.setattr(api_settings, "bookmark_embedded_notes_limit", 5)
+    monkeypatch.setattr(api_settings, "bookmark_note_preview_size", 2)
+
+    response = await api_client.post("/v1/bookmarks", json={"url": fake.url()}, headers=headers)
+
+    assert response.status_code == 201
+
+    slug = BookmarkItemOut(**response.json()).slug
+
+    # Embedded notes, responses only carry the latest few
+    contents = [fake.sentence() for _ in range(4)]
+    for content in contents:
+        response = await api_client.post(f"/v1/bookmarks/{slug}/notes", json={"content": content}, headers=headers)
+
+        assert response.status_code == 201
+
+    bookmark = BookmarkItemOut(**response.json())
+
+    assert bookmark.note_count == 4
+    assert [x.content for x in bookmark.notes] == contents[-2:]
+
+    response = await api_client.get(f"/v1/bookmarks/{slug}/notes", params={"limit": 3})
+
+    assert response.status_code == 200
+
+    page = BookmarkNotePageOut(**response.json())
+
+    assert [x.content for x in page.notes] == contents[:3]
+    assert page.next_cursor
+
+    response = await api_client.get(f"/v1/bookmarks/{slug}/notes", params={"limit": 3, "cursor": page.next_cursor})
+    page = BookmarkNotePageOut(**response.json())
+
+    assert [x.content for x in page.notes] == contents[3:]
+    assert page.next_cursor is None
+
+    # Update and delete while embedded
+    note_slug = bookmark.notes[-1].slug
+    response = await api_client.put(
+        f"/v1/bookmarks/{slug}/notes/{note_slug}", json={"content": "Edited"}, headers=headers
+    )
+
+    assert response.status_code == 200
+    assert response.json().get("content") == "Edited"
+    assert response.json().get("updatedAt")
+
+    contents[-1] = "Edited"
+
+    response = await api_client.delete(f"/v1/bookmarks/{slug}/notes/{bookmark.notes[0].slug}", headers=headers)
+
+    assert response.status_code == 204
+
+    del contents[2]
+
+    response = await api_client.delete(f"/v1/bookmarks/{slug}/notes/{bookmark.notes[0].slug}", headers=headers)
+
+    assert response.status_code == 404
+
+    # Past the limit the notes move to their own collection
+    for _ in range(4):
+        content = fake.sentence()
+        contents.append(content)
+        response = await api_client.post(f"/v1/bookmarks/{slug}/notes", json={"content": content}, headers=headers)
+
+        assert response.status_code == 201
+
+    bookmark = BookmarkItemOut(**response.json())
+
+    assert bookmark.note_count == 7
+    assert [x.content for x in bookmark.notes] == contents[-2:]
+
+    item = await BookmarkItem.find_one({"slug": slug})
+
+    assert item.notes_moved_at is not None
+    assert len(item.notes) == 2
+    assert await BookmarkItemNote.find({"bookmark_slug": slug, "deleted_at": None}).count() == 7
+
+    response = await api_client.get(f"/v1/bookmarks/{slug}/notes", params={"limit": 10})
+    page = BookmarkNotePageOut(**response.json())
+
+    assert [x.content for x in page.notes] == contents
+    assert page.next_cursor is None
+
+    # Update and delete once moved, the kept notes follow
+    note_slug = bookmark.notes[-1].slug
+    response = await api_client.put(
+        f"/v1/bookmarks/{slug}/notes/{note_slug}", json={"content": "Edited again"}, headers=headers
+    )
+
+    assert response.status_code == 200
+
+    response = await api_client.delete(f"/v1/bookmarks/{slug}/notes/{note_slug}", headers=headers)
+
+    assert response.status_code == 204
+
+    response = await api_client.get(f"/v1/bookmarks/{slug}")
+    bookmark = BookmarkItemOut(**response.json())
+
+    assert bookmark.note_count == 6
+    assert [x.content for x in bookmark.notes] == contents[-3:-1]
+
+    response = await api_client.get(f"/v1/bookmarks/{slug}/notes", params={"limit": 10})
+
+    assert [x.content for x in BookmarkNotePageOut(**response.json()).notes] == contents[:-1]
+
+    # Without a token
+    response = await api_client.put(f"/v1/bookmarks/{slug}/notes/{note_slug}", json={"content": "x"})
+
+    assert response.status_code == 401
+
+    response = await api_client.delete(f"/v1/bookmarks/{slug}", headers=headers)
+
+    assert response.status_code == 204
+    assert await BookmarkItemNote.find({"bookmark_slug": slug, "deleted_at": None}).count() == 0
@@ -1,3 +1,4 @@
+import base64
 from secrets import token_hex
 from urllib.parse import urlparse, parse_qs
 
@@ -7,7 +8,14 @@ from faker import Faker
 from httpx import AsyncClient
 
 from melly.libaccount.models import AccessTokenResponse, MyProfile
-from melly.libcollection.models import BookmarkItemOut, CollectionOut
+from melly.libcollection.models import (
+    BookmarkItemOut,
+    Collection,
+    CollectionItem,
+    CollectionItemPageOut,
+    CollectionOut,
+)
+from melly.libshared.settings import api_settings
 
 fake = Faker()
 
@@ -137,3 +145,300 @@ async def test_collection(api_client: AsyncClient, google_auth):
     assert updated_collection.slug == collection.slug
     assert len(updated_collection.items) == 1
     assert updated_collection.items[0] == bookmark.slug
+
+    # My collections summary
+    response = await api_client.get("/v1/me/collections", headers=headers, params={"fields": "slug,item_count"})
+
+    assert response.status_code == 200
+    assert response.json() == [{"slug": collection.slug, "item_count": 1}]
+
+    response = await api_client.get("/v1/me/collections", headers=headers, params={"fields": "items"})
+
+    assert response.status_code == 400
+
+    # Delete bookmark removes it from the collection
+    response = await api_client.delete(f"/v1/bookmarks/{bookmark.slug}", headers=headers)
+
+    assert response.status_code == 204
+
+    response = await api_client.get(f"/v1/me/collections/{collection.slug}", headers=headers)
+
+    assert response.status_code == 200
+
+    collection_profile = CollectionOut(**response.json())
+
+    assert len(collection_profile.items) == 0
+
+    # Delete collection
+    response = await api_client.delete(f"/v1/me/collections/{collection.slug}", headers=headers)
+
+    assert response.status_code == 204
+
+    response = await api_client.get(f"/v1/me/collections/{collection.slug}", headers=headers)
+
+    assert response.status_code == 404
+
+    # Publish collection
+    payload = {"title": fake.street_name()}
+
+    response = await api_client.post("/v1/me/collections", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    collection = CollectionOut(**response.json())
+
+    response = await api_client.get("/v1/collections/published")
+
+    assert response.status_code == 200
+    assert len(response.json()) == 0
+
+    response = await api_client.post(f"/v1/me/collections/{collection.slug}/publish", headers=headers)
+
+    assert response.status_code == 200
+
+    published_collection = CollectionOut(**response.json())
+
+    assert published_collection.published_at
+
+    response = await api_client.get("/v1/collections/published")
+
+    assert response.status_code == 200
+
+    collections = [CollectionOut(**x) for x in response.json()]
+
+    assert len(collections) == 1
+    assert collections[0].slug == collection.slug
+
+    response = await api_client.get(f"/v1/users/{updated_profile.username}/collections")
+
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+    response = await api_client.get(f"/v1/users/{updated_profile.username}")
+
+    assert response.status_code == 200
+    assert response.json().get("publishedCollectionCount") == 1
+
+    # Unpublish collection
+    response = await api_client.delete(f"/v1/me/collections/{collection.slug}/publish", headers=headers)
+
+    assert response.status_code == 200
+
+    unpublished_collection = CollectionOut(**response.json())
+
+    assert unpublished_collection.published_at is None
+
+    response = await api_client.get("/v1/collections/published")
+
+    assert response.status_code == 200
+    assert len(response.json()) == 0
+
+    response = await api_client.get(f"/v1/users/{updated_profile.username}")
+
+    assert response.status_code == 200
+    assert response.json().get("publishedCollectionCount") == 0
+
+
+@pytest.mark.asyncio
+async def test_collection_items(api_client: AsyncClient, login, monkeypatch):
+    headers = (await login()).get("headers")
+
+    monkeypatch.setattr(api_settings, "collection_embedded_items_limit", 5)
+    monkeypatch.setattr(api_settings, "collection_item_preview_size", 3)
+
+    slugs = []
+    for _ in range(7):
+        payload = {"url": f"https://example.com/{token_hex(8)}"}
+        response = await api_client.post("/v1/bookmarks", json=payload, headers=headers)
+
+        assert response.status_code == 201
+
+        slugs.append(BookmarkItemOut(**response.json()).slug)
+
+    b0, b1, b2, b3, b4, b5, b6 = slugs
+
+    async def items(limit: int = 10) -> list:
+        response = await api_client.get(f"/v1/me/collections/{slug}/items", headers=headers, params={"limit": limit})
+
+        assert response.status_code == 200
+
+        return CollectionItemPageOut(**response.json()).items
+
+    payload = {"title": fake.sentence(), "items": [b0, b1, b2]}
+    response = await api_client.post("/v1/me/collections", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    slug = CollectionOut(**response.json()).slug
+
+    # Embedded items, responses only carry the first few
+    response = await api_client.post(f"/v1/me/collections/{slug}/items", json={"slug": b3}, headers=headers)
+
+    assert response.status_code == 201
+
+    collection = CollectionOut(**response.json())
+
+    assert collection.item_count == 4
+    assert collection.items == [b0, b1, b2]
+
+    response = await api_client.post(f"/v1/me/collections/{slug}/items", json={"slug": b3}, headers=headers)
+
+    assert response.status_code == 400
+
+    response = await api_client.put(
+        f"/v1/me/collections/{slug}/items/{b3}/position", json={"after": b0}, headers=headers
+    )
+
+    assert response.status_code == 200
+    assert await items() == [b0, b3, b1, b2]
+
+    response = await api_client.put(f"/v1/me/collections/{slug}/items/{b2}/position", json={}, headers=headers)
+
+    assert response.status_code == 200
+    assert await items() == [b2, b0, b3, b1]
+
+    response = await api_client.put(
+        f"/v1/me/collections/{slug}/items/{b2}/position", json={"after": b6}, headers=headers
+    )
+
+    assert response.status_code == 404
+
+    response = await api_client.put(f"/v1/me/collections/{slug}/items", json={"items": [b0, b1, b2]}, headers=headers)
+
+    assert response.status_code == 400
+
+    response = await api_client.put(
+        f"/v1/me/collections/{slug}/items", json={"items": [b0, b1, b2, b3]}, headers=headers
+    )
+
+    assert response.status_code == 200
+    assert await items() == [b0, b1, b2, b3]
+
+    response = await api_client.delete(f"/v1/me/collections/{slug}/items/{b1}", headers=headers)
+
+    assert response.status_code == 200
+    assert CollectionOut(**response.json()).item_count == 3
+
+    response = await api_client.delete(f"/v1/me/collections/{slug}/items/{b1}", headers=headers)
+
+    assert response.status_code == 404
+
+    # Paging
+    response = await api_client.get(f"/v1/me/collections/{slug}/items", headers=headers, params={"limit": 2})
+    page = CollectionItemPageOut(**response.json())
+
+    assert page.items == [b0, b2]
+
+    params = {"limit": 2, "cursor": page.next_cursor}
+    response = await api_client.get(f"/v1/me/collections/{slug}/items", headers=headers, params=params)
+    page = CollectionItemPageOut(**response.json())
+
+    assert page.items == [b3]
+    assert page.next_cursor is None
+
+    # Past the limit the items move to their own collection
+    for bookmark_slug in (b1, b4, b5):
+        response = await api_client.post(
+            f"/v1/me/collections/{slug}/items", json={"slug": bookmark_slug}, headers=headers
+        )
+
+        assert response.status_code == 201
+
+    collection = CollectionOut(**response.json())
+
+    assert collection.item_count == 6
+    assert collection.items == [b0, b2, b3]
+
+    stored = await Collection.find_one({"slug": slug})
+
+    assert stored.items_moved_at is not None
+    assert stored.items == [b0, b2, b3]
+    assert await CollectionItem.find({"collection_slug": slug, "deleted_at": None}).count() == 6
+    assert await items() == [b0, b2, b3, b1, b4, b5]
+
+    response = await api_client.get(f"/v1/me/collections/{slug}/items", headers=headers, params={"limit": 4})
+    page = CollectionItemPageOut(**response.json())
+    params = {"limit": 4, "cursor": page.next_cursor}
+    response = await api_client.get(f"/v1/me/collections/{slug}/items", headers=headers, params=params)
+
+    assert page.items + CollectionItemPageOut(**response.json()).items == [b0, b2, b3, b1, b4, b5]
+
+    for position in ("nan", "inf"):
+        params = {"cursor": base64.urlsafe_b64encode(f"{position}|{b0}".encode()).decode()}
+        response = await api_client.get(f"/v1/me/collections/{slug}/items", headers=headers, params=params)
+
+        assert response.status_code == 400
+
+    response = await api_client.post(f"/v1/me/collections/{slug}/items", json={"slug": b6}, headers=headers)
+
+    assert response.status_code == 201
+
+    response = await api_client.post(f"/v1/me/collections/{slug}/items", json={"slug": b6}, headers=headers)
+
+    assert response.status_code == 400
+
+    # Moving one only rewrites that one
+    before = {x.bookmark_slug: x.position for x in await CollectionItem.find({"collection_slug": slug}).to_list()}
+    response = await api_client.put(f"/v1/me/collections/{slug}/items/{b6}/position", json={}, headers=headers)
+
+    assert response.status_code == 200
+    assert CollectionOut(**response.json()).items == [b6, b0, b2]
+
+    after = {x.bookmark_slug: x.position for x in await CollectionItem.find({"collection_slug": slug}).to_list()}
+
+    assert [x for x in after if after[x] != before[x]] == [b6]
+
+    for _ in range(60):
+        response = await api_client.put(
+            f"/v1/me/collections/{slug}/items/{b5}/position", json={"after": b6}, headers=headers
+        )
+
+        assert response.status_code == 200
+
+        response = await api_client.put(
+            f"/v1/me/collections/{slug}/items/{b4}/position", json={"after": b6}, headers=headers
+        )
+
+        assert response.status_code == 200
+
+    assert await items() == [b6, b4, b5, b0, b2, b3, b1]
+
+    order = [b1, b2, b3, b4, b5, b6, b0]
+    response = await api_client.put(f"/v1/me/collections/{slug}/items", json={"items": order}, headers=headers)
+
+    assert response.status_code == 200
+    assert await items() == order
+
+    response = await api_client.delete(f"/v1/me/collections/{slug}/items/{b1}", headers=headers)
+
+    assert response.status_code == 200
+
+    collection = CollectionOut(**response.json())
+
+    assert collection.item_count == 6
+    assert collection.items == [b2, b3, b4]
+
+    # Deleting a bookmark removes it from moved out items too
+    response = await api_client.delete(f"/v1/bookmarks/{b2}", headers=headers)
+
+    assert response.status_code == 204
+
+    response = await api_client.get(f"/v1/me/collections/{slug}", headers=headers)
+    collection = CollectionOut(**response.json())
+
+    assert collection.item_count == 5
+    assert collection.items == [b3, b4, b5]
+
+    # Items of others' collections only once published
+    response = await api_client.get(f"/v1/collections/{slug}/items")
+
+    assert response.status_code == 404
+
+    response = await api_client.post(f"/v1/me/collections/{slug}/publish", headers=headers)
+
+    assert response.status_code == 200
+
+    response = await api_client.get(f"/v1/collections/{slug}/items")
+
+    assert response.status_code == 200
+    assert CollectionItemPageOut(**response.json()).items == [b3, b4, b5, b6, b0]
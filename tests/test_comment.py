@@ -0,0 +1,147 @@
+from secrets import token_hex
+
+import pytest
+from faker import Faker
+from httpx import AsyncClient
+
+from melly.libaccount.models import MyProfile
+from melly.libcollection.models import (
+    CollectionOut,
+    CollectionCommentOut,
+    CollectionCommentPageOut,
+    CollectionCommentThreadOut,
+)
+
+fake = Faker()
+
+
+@pytest.mark.asyncio
+async def test_comment(api_client: AsyncClient, login):
+    headers = (await login()).get("headers")
+    response = await api_client.get("/v1/me", headers=headers)
+
+    assert response.status_code == 200
+
+    my_profile = MyProfile(**response.json())
+
+    # Update username
+    payload = {"username": token_hex(23)}
+
+    response = await api_client.put("/v1/me/username", headers=headers, json=payload)
+
+    assert response.status_code == 200
+
+    updated_profile = MyProfile(**response.json())
+
+    assert updated_profile.username == payload.get("username")
+
+    # Comments need a published collection
+    response = await api_client.post("/v1/me/collections", json={"title": fake.street_name()}, headers=headers)
+
+    assert response.status_code == 201
+
+    collection = CollectionOut(**response.json())
+
+    response = await api_client.post(
+        f"/v1/collections/{collection.slug}/comments", json={"content": fake.sentence()}, headers=headers
+    )
+
+    assert response.status_code == 404
+
+    response = await api_client.post(f"/v1/me/collections/{collection.slug}/publish", headers=headers)
+
+    assert response.status_code == 200
+
+    # Top level comments
+    comments = []
+    for _ in range(3):
+        payload = {"content": fake.sentence()}
+        response = await api_client.post(f"/v1/collections/{collection.slug}/comments", json=payload, headers=headers)
+
+        assert response.status_code == 201
+
+        comment = CollectionCommentOut(**response.json())
+
+        assert comment.content == payload.get("content")
+        assert comment.author_name == my_profile.name
+        assert comment.parent_comment_slug is None
+
+        comments.append(comment)
+
+    # Replies
+    payload = {"content": fake.sentence(), "parent_comment_slug": comments[0].slug}
+    response = await api_client.post(f"/v1/collections/{collection.slug}/comments", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    reply = CollectionCommentOut(**response.json())
+
+    assert reply.parent_comment_slug == comments[0].slug
+
+    payload = {"content": fake.sentence(), "parent_comment_slug": reply.slug}
+    response = await api_client.post(f"/v1/collections/{collection.slug}/comments", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    nested_reply = CollectionCommentOut(**response.json())
+
+    payload = {"content": fake.sentence(), "parent_comment_slug": token_hex(5)}
+    response = await api_client.post(f"/v1/collections/{collection.slug}/comments", json=payload, headers=headers)
+
+    assert response.status_code == 404
+
+    # Keyset pagination over top level comments
+    response = await api_client.get(f"/v1/collections/{collection.slug}/comments", params={"limit": 2})
+
+    assert response.status_code == 200
+
+    page = CollectionCommentPageOut(**response.json())
+
+    assert [x.slug for x in page.comments] == [x.slug for x in comments[:2]]
+    assert page.comments[0].reply_count == 1
+    assert page.next_cursor
+
+    params = {"limit": 2, "cursor": page.next_cursor}
+    response = await api_client.get(f"/v1/collections/{collection.slug}/comments", params=params)
+
+    assert response.status_code == 200
+
+    page = CollectionCommentPageOut(**response.json())
+
+    assert [x.slug for x in page.comments] == [comments[2].slug]
+    assert page.next_cursor is None
+
+    # Thread
+    response = await api_client.get(f"/v1/collections/{collection.slug}/comments/thread")
+
+    assert response.status_code == 200
+
+    thread = [CollectionCommentThreadOut(**x) for x in response.json()]
+
+    assert [x.slug for x in thread] == [x.slug for x in comments]
+    assert thread[0].replies[0].slug == reply.slug
+    assert thread[0].replies[0].replies[0].slug == nested_reply.slug
+
+    # Update comment
+    payload = {"content": fake.sentence()}
+    response = await api_client.put(
+        f"/v1/collections/{collection.slug}/comments/{reply.slug}", json=payload, headers=headers
+    )
+
+    assert response.status_code == 200
+    assert CollectionCommentOut(**response.json()).content == payload.get("content")
+
+    # Delete comment
+    response = await api_client.delete(f"/v1/collections/{collection.slug}/comments/{reply.slug}", headers=headers)
+
+    assert response.status_code == 204
+
+    response = await api_client.get(f"/v1/collections/{collection.slug}/comments", params={"limit": 1})
+    page = CollectionCommentPageOut(**response.json())
+
+    assert page.comments[0].reply_count == 0
+
+    response = await api_client.get(f"/v1/collections/{collection.slug}/comments/thread")
+    thread = [CollectionCommentThreadOut(**x) for x in response.json()]
+
+    assert len(thread[0].replies) == 0
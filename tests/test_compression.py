@@ -0,0 +1,97 @@
+import gzip
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from melly.libshared.compression import CompressionCache, CompressionMiddleware, negotiate_encoding
+
+LARGE = {"items": [{"title": f"Bookmark {x}", "content": "Lorem ipsum dolor sit amet"} for x in range(500)]}
+
+
+def build_app(cache: CompressionCache) -> Starlette:
+    async def large(request):
+        return JSONResponse(LARGE, headers={"etag": '"large"'})
+
+    async def small(request):
+        return JSONResponse({"ok": True})
+
+    async def encoded(request):
+        return PlainTextResponse("x" * 5000, headers={"content-encoding": "identity"})
+
+    app = Starlette(routes=[Route("/large", large), Route("/small", small), Route("/encoded", encoded)])
+    app.add_middleware(CompressionMiddleware, minimum_size=1024, offload_size=16 * 1024, cache=cache)
+    return app
+
+
+def test_negotiate_encoding():
+    available = {"br": None, "gzip": None}
+
+    assert negotiate_encoding("gzip, deflate, br", available) == "br"
+    assert negotiate_encoding("br;q=0.5, gzip", available) == "gzip"
+    assert negotiate_encoding("br;q=0, gzip;q=0", available) is None
+    assert negotiate_encoding("*", available) == "br"
+    assert negotiate_encoding("identity", available) is None
+    assert negotiate_encoding("", available) is None
+
+
+@pytest.mark.asyncio
+async def test_compression_middleware():
+    cache = CompressionCache()
+    transport = ASGITransport(app=build_app(cache))
+
+    async with AsyncClient(transport=transport, base_url="http://testapp") as client:
+        headers = {"accept-encoding": "gzip"}
+
+        response = await client.get("/large", headers=headers)
+
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") == "gzip"
+        assert response.headers.get("vary") == "Accept-Encoding"
+        assert response.headers.get("etag") == 'W/"large"'
+        assert int(response.headers.get("content-length")) < len(response.content)
+        assert response.json() == LARGE
+
+        # Compressed once, later requests are served from the cache
+        assert len(cache._entries) == 1
+
+        response = await client.get("/large", headers=headers)
+
+        assert response.json() == LARGE
+        assert len(cache._entries) == 1
+
+        # Requests with credentials skip the cache
+        response = await client.get("/large", headers={**headers, "authorization": "Bearer token"})
+
+        assert response.headers.get("content-encoding") == "gzip"
+        assert len(cache._entries) == 1
+
+        # Below the threshold
+        response = await client.get("/small", headers=headers)
+
+        assert response.headers.get("content-encoding") is None
+        assert response.json() == {"ok": True}
+
+        # Not accepted
+        response = await client.get("/large", headers={"accept-encoding": "identity"})
+
+        assert response.headers.get("content-encoding") is None
+        assert response.json() == LARGE
+
+        # Already encoded
+        response = await client.get("/encoded", headers=headers)
+
+        assert response.headers.get("content-encoding") == "identity"
+        assert len(response.content) == 5000
+
+
+@pytest.mark.asyncio
+async def test_api_compression(api_client: AsyncClient):
+    async with api_client.stream("GET", "/openapi.json", headers={"accept-encoding": "gzip"}) as response:
+        raw = b"".join([x async for x in response.aiter_raw()])
+
+    assert response.status_code == 200
+    assert response.headers.get("content-encoding") == "gzip"
+    assert gzip.decompress(raw).startswith(b"{")
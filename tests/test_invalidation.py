@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+import pytz
+from faker import Faker
+from httpx import AsyncClient
+
+from melly.appmellyapi.db import api_mongo_client
+from melly.libaccount.models import User
+from melly.libcollection.domain.collection import Collection, published_feed
+from melly.libcollection.models import Collection as CollectionModel
+from melly.libshared.invalidation import ChangeStreamSubscriber, InvalidationBus, InvalidationEvent
+from melly.libshared.settings import api_settings
+
+fake = Faker()
+
+
+@pytest.mark.asyncio
+async def test_invalidation_bus():
+    bus = InvalidationBus()
+    events = []
+
+    def failing(event: InvalidationEvent):
+        raise RuntimeError("boom")
+
+    async def collect(event: InvalidationEvent):
+        events.append(event)
+
+    bus.subscribe(collections=["collections"], callback=failing)
+    bus.subscribe(collections=["collections", "users"], callback=collect)
+
+    change = {
+        "operationType": "update",
+        "ns": {"db": "bookmarks-test", "coll": "collections"},
+        "documentKey": {"_id": 1},
+        "updated_fields": ["title", "stats.articles"],
+    }
+    await bus.publish(InvalidationEvent.from_change(change))
+
+    assert len(events) == 1
+    assert events[0].updated_fields == {"title", "stats"}
+    assert events[0].touches("title")
+    assert not events[0].touches("items")
+
+    await bus.publish(InvalidationEvent(collection="articles", operation="delete"))
+
+    assert len(events) == 1
+
+    await bus.invalidate_all()
+
+    assert len(events) == 3
+    assert all(x.touches("anything") for x in events[1:])
+
+
+@pytest.mark.asyncio
+async def test_published_feed_on_change(api_client: AsyncClient):
+    owner = User(email=fake.email(), name=fake.name(), username=fake.user_name(), auth_provider="google")
+    other = User(email=fake.email(), name=fake.name(), username=fake.user_name(), auth_provider="google")
+    await User.insert_many([owner, other])
+    published = CollectionModel(
+        title=fake.sentence(), slug=fake.uuid4(), owner_id=owner.username, published_at=datetime.now(tz=pytz.UTC)
+    )
+    draft = CollectionModel(title=fake.sentence(), slug=fake.uuid4(), owner_id=owner.username)
+    await published.insert()
+    await draft.insert()
+
+    published_feed.invalidate()
+    await published_feed.load()
+
+    def update(collection: str, document_id, *fields: str) -> InvalidationEvent:
+        return InvalidationEvent(
+            collection=collection, operation="update", document_id=document_id, updated_fields=set(fields)
+        )
+
+    await Collection.on_change(update("collections", published.id, "updated_at"))
+    await Collection.on_change(update("users", owner.id, "stats"))
+
+    assert not published_feed.is_stale
+
+    # Collections and users outside the window leave it alone
+    await Collection.on_change(update("collections", draft.id, "items", "item_count"))
+    await Collection.on_change(update("users", other.id, "name"))
+
+    assert not published_feed.is_stale
+
+    await Collection.on_change(update("collections", published.id, "title"))
+
+    assert published_feed.is_stale
+
+    await published_feed.load()
+    await Collection.on_change(update("users", owner.id, "picture"))
+
+    assert published_feed.is_stale
+
+    await published_feed.load()
+    await Collection.on_change(update("collections", draft.id, "published_at"))
+
+    assert published_feed.is_stale
+
+    await published_feed.load()
+    await Collection.on_change(InvalidationEvent(collection="users", operation="update", updated_fields={"name"}))
+
+    assert published_feed.is_stale
+
+
+@pytest.mark.asyncio
+async def test_change_stream_subscriber(api_client: AsyncClient):
+    hello = await api_mongo_client.admin.command("hello")
+    if "setName" not in hello:
+        pytest.skip("Change streams need a replica set")
+
+    database = api_mongo_client[api_settings.db_name]
+    await database["change-stream-tokens"].delete_many({})
+
+    bus = InvalidationBus()
+    events = asyncio.Queue()
+    bus.subscribe(collections=["collections"], callback=events.put)
+
+    subscriber = ChangeStreamSubscriber(database=database, collections=["collections"], bus=bus, name="test")
+    subscriber.start()
+    try:
+        # Give the stream a moment to open before writing
+        await asyncio.sleep(1)
+
+        collection = CollectionModel(title=fake.sentence(), slug=fake.uuid4(), owner_id=fake.user_name())
+        await collection.insert()
+        await CollectionModel.find_one({"slug": collection.slug}).update({"$set": {"title": fake.sentence()}})
+
+        inserted = await asyncio.wait_for(events.get(), timeout=10)
+        updated = await asyncio.wait_for(events.get(), timeout=10)
+    finally:
+        await subscriber.stop()
+
+    assert inserted.operation == "insert"
+    assert inserted.document_id == collection.id
+    assert updated.operation == "update"
+    assert "title" in updated.updated_fields
+
+    state = await database["change-stream-tokens"].find_one({"_id": "test"})
+
+    assert state.get("token") == subscriber.token
@@ -0,0 +1,205 @@
+import asyncio
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from secrets import token_hex
+from threading import Thread
+
+import pytest
+import pytest_asyncio
+from faker import Faker
+from httpx import AsyncClient
+
+from melly.libcollection.domain.metadata import BookmarkMetadata, metadata_fetcher
+from melly.libcollection.models import BookmarkItem, BookmarkItemOut, LinkMetadataCache
+from melly.libshared.linkmetadata import GuardedNetworkBackend, LinkMetadataFetcher, parse_metadata
+from melly.libshared.settings import api_settings
+from melly.libshared.url import hash_url
+
+fake = Faker()
+
+ARTICLE = """
+<html>
+<head>
+    <title>Fallback title</title>
+    <meta property="og:title" content="A page worth saving">
+    <meta property="og:description" content="Everything about it">
+    <meta property="og:image" content="/cover.png">
+    <meta property="og:site_name" content="Local">
+</head>
+<body><p>Hello</p></body>
+</html>
+"""
+
+PAGES = {
+    "/article": ("text/html; charset=utf-8", ARTICLE),
+    "/plain": ("text/plain", "og:title"),
+    "/large": ("text/html", "<html><head>" + " " * 100_000 + '<meta property="og:title" content="Too far"></head>'),
+}
+
+
+@pytest.fixture
+def link_server():
+    hits = Counter()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits[self.path] += 1
+            hits[f"host:{self.headers.get('host')}"] += 1
+            content_type, body = PAGES.get(self.path, ("text/html", ""))
+            body = body.encode("utf-8")
+
+            self.send_response(200 if self.path in PAGES else 404)
+            self.send_header("content-type", content_type)
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    yield f"http://127.0.0.1:{server.server_port}", hits
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest_asyncio.fixture
+async def fetcher(api_client: AsyncClient, monkeypatch):
+    # Disabled for the rest of the suite so bookmarks of fake URLs don't reach out to the internet
+    monkeypatch.setattr(api_settings, "link_metadata_enabled", True)
+    metadata_fetcher.start()
+
+    yield metadata_fetcher
+
+    await metadata_fetcher.stop()
+
+
+def test_parse_metadata():
+    metadata = parse_metadata(html=ARTICLE, url="https://example.com/posts/1")
+
+    assert metadata.get("title") == "A page worth saving"
+    assert metadata.get("description") == "Everything about it"
+    assert metadata.get("image") == "https://example.com/cover.png"
+    assert metadata.get("site_name") == "Local"
+
+    metadata = parse_metadata(html="<title>Only a title</title><body>", url="https://example.com")
+
+    assert metadata.get("title") == "Only a title"
+    assert metadata.get("description") is None
+    assert metadata.get("image") is None
+
+
+@pytest.mark.asyncio
+async def test_fetcher_limits(api_client: AsyncClient, link_server):
+    base_url, hits = link_server
+
+    async def on_fetched(*args):
+        pass
+
+    standalone = LinkMetadataFetcher(on_fetched=on_fetched, max_bytes=10_000, allow_private_hosts=True)
+    standalone.start()
+    try:
+        assert (await standalone.fetch(f"{base_url}/article")).get("title") == "A page worth saving"
+        assert await standalone.fetch(f"{base_url}/plain") is None
+        assert await standalone.fetch(f"{base_url}/missing") is None
+        assert (await standalone.fetch(f"{base_url}/large")).get("title") is None
+    finally:
+        await standalone.stop()
+
+    guarded = LinkMetadataFetcher(on_fetched=on_fetched)
+    guarded.start()
+    try:
+        # Loopback is off limits unless private hosts are allowed
+        assert await guarded.fetch(f"{base_url}/article") is None
+        assert hits["/article"] == 1
+    finally:
+        await guarded.stop()
+
+
+@pytest.mark.asyncio
+async def test_fetcher_connects_to_checked_address(api_client: AsyncClient, link_server, monkeypatch):
+    base_url, hits = link_server
+    port = base_url.rsplit(":", 1)[1]
+
+    async def on_fetched(*args):
+        pass
+
+    # A name nothing else can resolve, so a response means the checked address was used for the connection
+    async def resolve(self, host: str, port: int):
+        return ["127.0.0.1"] if host == "rebind.test" else []
+
+    monkeypatch.setattr(GuardedNetworkBackend, "resolve", resolve)
+
+    standalone = LinkMetadataFetcher(on_fetched=on_fetched, allow_private_hosts=True)
+    standalone.start()
+    try:
+        assert (await standalone.fetch(f"http://rebind.test:{port}/article")).get("title") == "A page worth saving"
+        assert hits[f"host:rebind.test:{port}"] == 1
+    finally:
+        await standalone.stop()
+
+    guarded = LinkMetadataFetcher(on_fetched=on_fetched)
+    guarded.start()
+    try:
+        assert await guarded.fetch(f"http://rebind.test:{port}/article") is None
+        assert hits["/article"] == 1
+    finally:
+        await guarded.stop()
+
+
+@pytest.mark.asyncio
+async def test_bookmark_metadata(api_client: AsyncClient, login, link_server, fetcher):
+    base_url, hits = link_server
+
+    headers = (await login()).get("headers")
+
+    # Create bookmark, metadata is fetched in the background
+    url = f"{base_url}/article"
+    payload = {"url": url, "tags": [fake.word()]}
+
+    response = await api_client.post("/v1/bookmarks", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    bookmark = BookmarkItemOut(**response.json())
+
+    await asyncio.wait_for(fetcher.join(), timeout=10)
+
+    response = await api_client.get(f"/v1/bookmarks/{bookmark.slug}")
+
+    assert response.status_code == 200
+
+    bookmark = BookmarkItemOut(**response.json())
+
+    assert bookmark.metadata.title == "A page worth saving"
+    assert bookmark.metadata.description == "Everything about it"
+    assert bookmark.metadata.image == f"{base_url}/cover.png"
+    assert bookmark.metadata.site_name == "Local"
+    assert await LinkMetadataCache.find({"url_hash": hash_url(url)}).count() == 1
+
+    # Another save of the same page is served from the shared cache
+    item = BookmarkItem(url=url, url_hash=hash_url(url), slug=token_hex(9), owner_id=fake.user_name())
+    await item.insert()
+    await BookmarkMetadata.enrich(item)
+    await asyncio.wait_for(fetcher.join(), timeout=10)
+
+    item = await BookmarkItem.find_one({"slug": item.slug})
+
+    assert item.metadata.title == "A page worth saving"
+    assert hits["/article"] == 1
+
+    # Changing the URL drops the old metadata and fetches the new page
+    payload = {"url": f"{base_url}/plain", "tags": []}
+
+    response = await api_client.put(f"/v1/bookmarks/{bookmark.slug}", json=payload, headers=headers)
+
+    assert response.status_code == 200
+    assert BookmarkItemOut(**response.json()).metadata is None
+
+    await asyncio.wait_for(fetcher.join(), timeout=10)
+
+    assert hits["/plain"] == 1
+    assert await LinkMetadataCache.find({"url_hash": hash_url(payload.get("url")), "metadata": None}).count() == 1
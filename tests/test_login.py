@@ -0,0 +1,101 @@
+import asyncio
+import time
+from collections import Counter
+from secrets import token_hex
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from beanie import init_beanie
+from httpx import AsyncClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from melly.appmellyapi.db import api_models, api_mongo_client
+from melly.libshared.logger import logger
+from melly.libshared.settings import api_settings
+
+write_commands = {"insert", "update", "delete", "findAndModify"}
+
+
+class WriteCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.writes = Counter()
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in write_commands:
+            self.writes[event.command.get(event.command_name)] += 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        pass
+
+    def total(self) -> int:
+        return sum(self.writes.values())
+
+
+async def login(api_client: AsyncClient, counter: WriteCounter) -> dict:
+    response = await api_client.get("/v1/me/auth/google")
+
+    assert response.status_code == 200
+
+    query_strings = parse_qs(urlparse(response.json().get("url")).query)
+    callback_params = {"state": query_strings.get("state"), "code": token_hex(23)}
+
+    counter.writes.clear()
+    response = await api_client.get("/v1/me/auth/google/callback", params=callback_params)
+
+    assert response.status_code == 302
+
+    callback_writes = counter.total()
+    code = parse_qs(urlparse(response.headers.get("location")).query).get("code")
+
+    counter.writes.clear()
+    response = await api_client.get("/v1/me/access/token", params={"code": code})
+
+    assert response.status_code == 200
+
+    return {
+        "callback_params": callback_params,
+        "code": code,
+        "callback_writes": callback_writes,
+        "exchange_writes": counter.total(),
+    }
+
+
+@pytest.mark.asyncio
+async def test_login_writes(api_client: AsyncClient, google_auth):
+    counter = WriteCounter()
+    client = AsyncIOMotorClient(api_settings.mongo_url, event_listeners=[counter])
+    client.get_io_loop = asyncio.get_running_loop
+    await init_beanie(database=client[api_settings.db_name], document_models=api_models)
+
+    try:
+        # The session holds the exchange code and the user is upserted, one write each
+        result = await login(api_client, counter)
+
+        assert result.get("callback_writes") <= 2
+        assert result.get("exchange_writes") <= 2
+
+        # The exchange code and the callback only work once
+        response = await api_client.get("/v1/me/access/token", params={"code": result.get("code")})
+
+        assert response.status_code == 409
+
+        response = await api_client.get("/v1/me/auth/google/callback", params=result.get("callback_params"))
+
+        assert response.status_code == 409
+
+        logins = 20
+        started_at = time.perf_counter()
+        for _ in range(logins):
+            result = await login(api_client, counter)
+
+            assert result.get("callback_writes") <= 2
+
+        elapsed = time.perf_counter() - started_at
+        logger.info(f"{logins} logins in {elapsed:.3f}s, {elapsed / logins * 1000:.1f}ms per login")
+    finally:
+        await init_beanie(database=api_mongo_client[api_settings.db_name], document_models=api_models)
+        client.close()
@@ -0,0 +1,38 @@
+from melly.libshared.markdown import RenderCache, render_markdown, make_excerpt
+
+
+def test_render_markdown():
+    rendered = render_markdown(
+        "# Title\n\nSome *text* with [a link](https://melly.com) and `code`.\n\n```\nskipped\n```"
+    )
+
+    assert "<h1>Title</h1>" in rendered.html
+    assert '<a href="https://melly.com" rel="nofollow noopener noreferrer">a link</a>' in rendered.html
+    assert rendered.excerpt == "Title Some text with a link and code."
+
+    rendered = render_markdown('<img src=x onerror="alert(1)"> [click](javascript:alert(1))')
+
+    assert "<img" not in rendered.html
+    assert 'href="javascript' not in rendered.html
+
+
+def test_make_excerpt():
+    text = " ".join(["word"] * 100)
+    excerpt = make_excerpt(text, length=50)
+
+    assert len(excerpt) <= 51
+    assert excerpt.endswith("word…")
+    assert make_excerpt("short\n\n  text") == "short text"
+
+
+def test_render_cache():
+    cache = RenderCache(max_entries=2)
+
+    first = cache.render("# One")
+
+    assert cache.render("# One") is first
+    assert cache.render("# Two").content_hash != first.content_hash
+
+    cache.render("# Three")
+
+    assert cache.render("# One") is not first
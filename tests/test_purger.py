@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from faker import Faker
+from httpx import AsyncClient
+
+from melly.libarticle.models import Article
+from melly.libshared.purger import Purger
+
+fake = Faker()
+
+
+def build_article(deleted_at: datetime | None = None) -> Article:
+    return Article(
+        title=fake.street_name(),
+        description=fake.sentence(),
+        slug=fake.slug(),
+        content_in_markdown="# Hello\nWorld.",
+        author_id=fake.user_name(),
+        deleted_at=deleted_at,
+    )
+
+
+@pytest.mark.asyncio
+async def test_purger(api_client: AsyncClient):
+    now = datetime.now(tz=pytz.UTC)
+
+    live = build_article()
+    recently_deleted = build_article(deleted_at=now - timedelta(minutes=5))
+    await live.save()
+    await recently_deleted.save()
+    for _ in range(5):
+        await build_article(deleted_at=now - timedelta(days=60)).save()
+
+    purger = Purger(models=[Article], retention_in_seconds=60 * 60 * 24 * 30, interval_in_seconds=60, batch_size=2)
+    purged = await purger.purge()
+
+    assert purged == 5
+    assert await Article.count() == 2
+    assert await Article.get(live.id)
+    assert await Article.get(recently_deleted.id)
@@ -0,0 +1,26 @@
+import pytest
+from httpx import AsyncClient
+
+from melly.libshared.ratelimit import RateLimitRule
+from melly.libshared.settings import api_settings
+
+
+@pytest.mark.asyncio
+async def test_login_url_rate_limit(api_client: AsyncClient):
+    route = "GET /v1/me/auth/google"
+    rule = RateLimitRule.parse(route=route, limit=api_settings.rate_limits.get(route))
+
+    for _ in range(rule.capacity):
+        response = await api_client.get("/v1/me/auth/google")
+
+        assert response.status_code == 200
+
+    response = await api_client.get("/v1/me/auth/google")
+
+    assert response.status_code == 429
+    assert int(response.headers.get("retry-after")) > 0
+
+    # Other routes have their own buckets
+    response = await api_client.get("/v1/collections/published")
+
+    assert response.status_code == 200
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+from beanie.odm.utils.parsing import parse_obj
+from faker import Faker
+from httpx import AsyncClient
+
+from melly.libaccount.models import User, UserStats, UserView
+from melly.libshared.logger import logger
+
+fake = Faker()
+
+
+@pytest.mark.asyncio
+async def test_user_view(api_client: AsyncClient):
+    user = User(
+        email=fake.email(),
+        name=fake.name(),
+        picture=fake.image_url(),
+        username=fake.user_name(),
+        auth_provider="google",
+        stats=UserStats(articles=3),
+    )
+    await user.insert()
+
+    view = await User.find_view({"identifier": user.identifier, "deleted_at": None})
+
+    assert view.id == user.id
+    assert view.email == user.email
+    assert view.username == user.username
+    assert view.picture == str(user.picture)
+    assert view.stats.articles == 3
+    assert not view.is_deleted
+
+    # Only the projected fields are read
+    raw = await User.get_motor_collection().find_one({"_id": user.id}, projection=UserView.projection)
+
+    assert "auth_provider_user_id" not in raw
+
+    # Per request CPU of building the user, Beanie document from the stored user vs read model from the projection
+    stored = await User.get_motor_collection().find_one({"_id": user.id})
+    iterations = 2000
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        parse_obj(User, stored)
+    beanie_elapsed = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        UserView.from_document(raw)
+    view_elapsed = time.perf_counter() - started_at
+
+    logger.info(
+        f"User built {iterations} times, Beanie {beanie_elapsed / iterations * 1e6:.1f}us, "
+        f"view {view_elapsed / iterations * 1e6:.1f}us"
+    )
+
+    await user.set({"deleted_at": user.created_at})
+
+    assert await User.find_view({"identifier": user.identifier, "deleted_at": None}) is None
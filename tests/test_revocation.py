@@ -0,0 +1,53 @@
+import pytest
+
+from melly.libshared.revocation import BloomFilter, RevocationFilter
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(size_in_bits=1 << 16, hashes=7)
+    for x in range(5000):
+        bloom.add(f"revoked-{x}")
+
+    assert all(f"revoked-{x}" in bloom for x in range(5000))
+
+    # ~1% false positives at 10 bits per key
+    false_positives = sum(f"valid-{x}" in bloom for x in range(10_000))
+
+    assert false_positives < 300
+
+    bloom.clear()
+
+    assert "revoked-0" not in bloom
+
+
+@pytest.mark.asyncio
+async def test_revocation_filter():
+    lookups = []
+    revoked = {"a"}
+
+    async def lookup(key: str) -> bool:
+        lookups.append(key)
+        return key in revoked
+
+    revocations = RevocationFilter(lookup=lookup, size_in_bits=1 << 16, cache_size=2)
+
+    # Never revoked keys are answered by the bloom filter alone
+    assert not await revocations.is_revoked("a")
+    assert lookups == []
+
+    revocations.revoke("b")
+
+    assert await revocations.is_revoked("b")
+    assert lookups == []
+
+    # Revoked elsewhere, confirmed once and then cached
+    revocations.suspect("a")
+
+    assert await revocations.is_revoked("a")
+    assert await revocations.is_revoked("a")
+    assert lookups == ["a"]
+
+    revocations.suspect("c")
+
+    assert not await revocations.is_revoked("c")
+    assert lookups == ["a", "c"]
@@ -0,0 +1,31 @@
+import pytest
+from faker import Faker
+from httpx import AsyncClient
+
+from melly.libcollection.models import BookmarkItem
+from melly.libshared.slug import generate_id, insert_with_unique_slug
+
+fake = Faker()
+
+
+def test_generate_id_is_unique_and_ordered():
+    ids = [generate_id() for _ in range(10_000)]
+
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert all(len(x) == 18 for x in ids)
+
+
+@pytest.mark.asyncio
+async def test_insert_with_unique_slug_retries_on_duplicate(api_client: AsyncClient):
+    slug = generate_id()
+
+    first = BookmarkItem(url=fake.url(), slug=slug, owner_id=fake.user_name())
+    await insert_with_unique_slug(first)
+
+    second = BookmarkItem(url=fake.url(), slug=slug, owner_id=fake.user_name())
+    await insert_with_unique_slug(second)
+
+    assert first.slug == slug
+    assert second.slug != slug
+    assert await BookmarkItem.find({"slug": second.slug}).count() == 1
@@ -0,0 +1,121 @@
+from secrets import token_hex
+
+import pytest
+from faker import Faker
+from httpx import AsyncClient
+
+from melly.libaccount.models import MyProfile
+from melly.libsync.models import SyncOut
+
+fake = Faker()
+
+
+@pytest.mark.asyncio
+async def test_sync(api_client: AsyncClient, login):
+    headers = (await login()).get("headers")
+
+    # Update username
+    payload = {"username": token_hex(23)}
+
+    response = await api_client.put("/v1/me/username", headers=headers, json=payload)
+
+    assert response.status_code == 200
+
+    updated_profile = MyProfile(**response.json())
+
+    assert updated_profile.username == payload.get("username")
+
+    # Nothing to sync yet
+    response = await api_client.get("/v1/sync", headers=headers)
+
+    assert response.status_code == 200
+
+    sync = SyncOut(**response.json())
+
+    assert not sync.articles and not sync.bookmarks and not sync.collections
+    assert not sync.has_more
+    assert sync.token
+
+    # Create an article, a bookmark and a collection
+    payload = {
+        "title": fake.street_name(),
+        "description": fake.sentence(),
+        "content_in_markdown": "# Hello\nWorld.",
+    }
+    response = await api_client.post("/v1/articles", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    article_slug = response.json().get("slug")
+
+    payload = {"url": fake.url(), "tags": [fake.word()]}
+    response = await api_client.post("/v1/bookmarks", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    bookmark_slug = response.json().get("slug")
+
+    payload = {"title": fake.sentence(), "items": [bookmark_slug]}
+    response = await api_client.post("/v1/me/collections", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    collection_slug = response.json().get("slug")
+
+    # Full sync in pages of two
+    synced = {"articles": set(), "bookmarks": set(), "collections": set()}
+    params = {"limit": 2}
+    pages = 0
+    while True:
+        response = await api_client.get("/v1/sync", params=params, headers=headers)
+
+        assert response.status_code == 200
+
+        sync = SyncOut(**response.json())
+        pages += 1
+
+        assert len(sync.articles) + len(sync.bookmarks) + len(sync.collections) <= 2
+
+        synced["articles"].update(x.slug for x in sync.articles)
+        synced["bookmarks"].update(x.slug for x in sync.bookmarks)
+        synced["collections"].update(x.slug for x in sync.collections)
+        params["since"] = sync.token
+        if not sync.has_more:
+            break
+
+    assert pages >= 2
+    assert synced == {"articles": {article_slug}, "bookmarks": {bookmark_slug}, "collections": {collection_slug}}
+
+    token = sync.token
+
+    # Incremental sync picks up updates and deletions
+    payload = {"url": fake.url(), "tags": ["synced"]}
+    response = await api_client.put(f"/v1/bookmarks/{bookmark_slug}", json=payload, headers=headers)
+
+    assert response.status_code == 200
+
+    response = await api_client.delete(f"/v1/articles/{article_slug}", headers=headers)
+
+    assert response.status_code == 204
+
+    response = await api_client.get("/v1/sync", params={"since": token}, headers=headers)
+
+    assert response.status_code == 200
+
+    sync = SyncOut(**response.json())
+
+    bookmarks = {x.slug: x for x in sync.bookmarks}
+
+    assert bookmarks[bookmark_slug].tags == ["synced"]
+    assert [x.slug for x in sync.deleted_articles] == [article_slug]
+    assert not sync.articles
+    assert not sync.has_more
+
+    # Invalid tokens and page sizes
+    response = await api_client.get("/v1/sync", params={"since": "nope"}, headers=headers)
+
+    assert response.status_code == 400
+
+    response = await api_client.get("/v1/sync", params={"limit": 10_000}, headers=headers)
+
+    assert response.status_code == 422
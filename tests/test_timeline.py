@@ -0,0 +1,283 @@
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from secrets import token_hex
+
+import pytest
+import pytz
+from beanie import init_beanie
+from faker import Faker
+from httpx import AsyncClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from melly.appmellyapi.db import api_models, api_mongo_client
+from melly.libaccount.domain.account import Account
+from melly.libaccount.models import PublicProfile, User, UserStats
+from melly.libcollection.models import BookmarkItem, BookmarkItemOut, CollectionOut
+from melly.libshared.logger import logger
+from melly.libshared.settings import api_settings
+from melly.libsocial.domain.home import HomeTimeline
+from melly.libsocial.domain.timeline import Timeline, high_follower_accounts
+from melly.libsocial.models import FollowOut, TimelineItemOut, UserFollow, UserTimeline
+
+fake = Faker()
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        self.commands[(event.command_name, event.command.get(event.command_name))] += 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        pass
+
+    def on(self, collection: str) -> int:
+        return sum(count for (_, name), count in self.commands.items() if name == collection)
+
+
+async def post_bookmark(api_client: AsyncClient, headers: dict) -> str:
+    response = await api_client.post(
+        "/v1/bookmarks", json={"url": f"https://example.com/{token_hex(8)}"}, headers=headers
+    )
+
+    assert response.status_code == 201
+
+    return BookmarkItemOut(**response.json()).slug
+
+
+async def timeline(api_client: AsyncClient, headers: dict) -> list:
+    response = await api_client.get("/v1/me/timeline", headers=headers)
+
+    assert response.status_code == 200
+
+    return [TimelineItemOut(**x) for x in response.json()]
+
+
+@pytest.mark.asyncio
+async def test_follow_and_timeline(api_client: AsyncClient, login, monkeypatch):
+    high_follower_accounts.invalidate()
+    alice, bob, carol = [await login() for _ in range(3)]
+
+    # Following backfills the latest posts
+    bookmark_slug = await post_bookmark(api_client, headers=bob.get("headers"))
+
+    response = await api_client.post(f"/v1/users/{bob.get('username')}/follow", headers=alice.get("headers"))
+
+    assert response.status_code == 204
+
+    response = await api_client.post(f"/v1/users/{bob.get('username')}/follow", headers=alice.get("headers"))
+
+    assert response.status_code == 204
+
+    response = await api_client.post(f"/v1/users/{alice.get('username')}/follow", headers=alice.get("headers"))
+
+    assert response.status_code == 400
+
+    response = await api_client.post(f"/v1/users/{token_hex(8)}/follow", headers=alice.get("headers"))
+
+    assert response.status_code == 404
+
+    items = await timeline(api_client, headers=alice.get("headers"))
+
+    assert [(x.kind, x.slug) for x in items] == [("bookmark", bookmark_slug)]
+    assert items[0].bookmark.owner_id == bob.get("username")
+
+    response = await api_client.get(f"/v1/users/{bob.get('username')}")
+
+    assert PublicProfile(**response.json()).follower_count == 1
+
+    response = await api_client.get(f"/v1/users/{bob.get('username')}/followers")
+
+    assert [FollowOut(**x).username for x in response.json()] == [alice.get("username")]
+
+    response = await api_client.get(f"/v1/users/{alice.get('username')}/following")
+
+    assert [FollowOut(**x).username for x in response.json()] == [bob.get("username")]
+
+    # New posts are fanned out
+    payload = {"title": fake.sentence(), "description": fake.sentence(), "content_in_markdown": fake.text()}
+    response = await api_client.post("/v1/articles", json=payload, headers=bob.get("headers"))
+
+    assert response.status_code == 201
+
+    article_slug = response.json().get("slug")
+
+    response = await api_client.post("/v1/me/collections", json={"title": fake.sentence()}, headers=bob.get("headers"))
+    collection_slug = CollectionOut(**response.json()).slug
+
+    response = await api_client.post(f"/v1/me/collections/{collection_slug}/publish", headers=bob.get("headers"))
+
+    assert response.status_code == 200
+
+    stored = await UserTimeline.find_one({"owner_id": alice.get("username")})
+
+    assert [x.slug for x in stored.entries] == [collection_slug, article_slug, bookmark_slug]
+
+    items = await timeline(api_client, headers=alice.get("headers"))
+
+    assert [x.kind for x in items] == ["collection", "article", "bookmark"]
+    assert items[1].article.title == payload.get("title")
+
+    # Deleted posts drop out
+    response = await api_client.delete(f"/v1/bookmarks/{bookmark_slug}", headers=bob.get("headers"))
+
+    assert response.status_code == 204
+    assert [x.slug for x in await timeline(api_client, headers=alice.get("headers"))] == [collection_slug, article_slug]
+
+    # Accounts with too many followers are read along with the timeline instead
+    monkeypatch.setattr(high_follower_accounts, "max_followers", 1)
+    high_follower_accounts.invalidate()
+    for follower in (alice, bob):
+        response = await api_client.post(f"/v1/users/{carol.get('username')}/follow", headers=follower.get("headers"))
+
+        assert response.status_code == 204
+
+    high_follower_accounts.invalidate()
+    carol_slug = await post_bookmark(api_client, headers=carol.get("headers"))
+    stored = await UserTimeline.find_one({"owner_id": alice.get("username")})
+
+    assert carol_slug not in [x.slug for x in stored.entries]
+
+    items = await timeline(api_client, headers=alice.get("headers"))
+
+    assert [x.slug for x in items] == [carol_slug, collection_slug, article_slug]
+
+    # Unfollowing clears the timeline of their posts
+    response = await api_client.delete(f"/v1/users/{bob.get('username')}/follow", headers=alice.get("headers"))
+
+    assert response.status_code == 204
+
+    response = await api_client.delete(f"/v1/users/{bob.get('username')}/follow", headers=alice.get("headers"))
+
+    assert response.status_code == 404
+    assert [x.slug for x in await timeline(api_client, headers=alice.get("headers"))] == [carol_slug]
+
+    response = await api_client.get(f"/v1/users/{bob.get('username')}")
+
+    assert PublicProfile(**response.json()).follower_count == 0
+
+
+@pytest.mark.asyncio
+async def test_deleted_account_follows(api_client: AsyncClient, login):
+    high_follower_accounts.invalidate()
+    alice, bob, carol = [await login() for _ in range(3)]
+
+    for follower, followee in ((alice, bob), (bob, carol)):
+        response = await api_client.post(
+            f"/v1/users/{followee.get('username')}/follow", headers=follower.get("headers")
+        )
+
+        assert response.status_code == 204
+
+    response = await api_client.delete("/v1/me", headers=bob.get("headers"))
+
+    assert response.status_code == 204
+
+    # Deleted accounts neither count as followers nor get posts fanned out
+    response = await api_client.get(f"/v1/users/{carol.get('username')}")
+
+    assert PublicProfile(**response.json()).follower_count == 0
+
+    response = await api_client.get(f"/v1/users/{alice.get('username')}")
+
+    assert PublicProfile(**response.json()).following_count == 0
+
+    carol_slug = await post_bookmark(api_client, headers=carol.get("headers"))
+    stored = await UserTimeline.find_one({"owner_id": bob.get("username")})
+
+    assert stored is None or carol_slug not in [x.slug for x in stored.entries]
+
+    # Coming back brings the follows back
+    user = await User.find_one({"username": bob.get("username")})
+    await Account.restore_account_content(user=user)
+    await user.reactivate()
+
+    response = await api_client.get(f"/v1/users/{carol.get('username')}")
+
+    assert PublicProfile(**response.json()).follower_count == 1
+
+    response = await api_client.get(f"/v1/users/{bob.get('username')}")
+
+    assert PublicProfile(**response.json()).follower_count == 1
+    assert PublicProfile(**response.json()).following_count == 1
+
+
+@pytest.mark.asyncio
+async def test_timeline_reads_stay_flat(api_client: AsyncClient):
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(api_settings.mongo_url, event_listeners=[counter])
+    client.get_io_loop = asyncio.get_running_loop
+    await init_beanie(database=client[api_settings.db_name], document_models=api_models)
+
+    try:
+        high_follower_accounts.invalidate()
+        reader = User(
+            email=fake.email(), name=fake.name(), username=token_hex(8), auth_provider="google", stats=UserStats()
+        )
+        await reader.insert()
+
+        reads = 20
+        started = datetime.now(tz=pytz.UTC)
+        followed = []
+        for size in (10, 100, 1000):
+            users = [
+                User(email=fake.email(), name=fake.name(), username=token_hex(8), auth_provider="google")
+                for _ in range(size - len(followed))
+            ]
+            await User.insert_many(users)
+            await UserFollow.insert_many(
+                [UserFollow(follower_id=reader.username, followee_id=x.username) for x in users]
+            )
+
+            bookmarks = [
+                BookmarkItem(
+                    url=fake.url(),
+                    slug=token_hex(8),
+                    owner_id=x.username,
+                    created_at=started + timedelta(seconds=len(followed) + i),
+                )
+                for i, x in enumerate(users)
+            ]
+            await BookmarkItem.insert_many(bookmarks)
+            for bookmark in bookmarks:
+                await Timeline.fan_out(
+                    kind="bookmark", slug=bookmark.slug, actor_id=bookmark.owner_id, created_at=bookmark.created_at
+                )
+            followed += [x.username for x in users]
+
+            counter.commands.clear()
+            started_at = time.perf_counter()
+            for _ in range(reads):
+                items = await HomeTimeline.get_timeline(user=reader, limit=20)
+            timeline_elapsed = (time.perf_counter() - started_at) / reads
+
+            assert len(items) == 20
+            assert items[0].slug == bookmarks[-1].slug
+
+            # Whatever the number of follows, a timeline read is a single document read and the follows aren't looked at
+            assert counter.commands[("find", UserTimeline.get_collection_name())] == reads
+            assert counter.on(UserTimeline.get_collection_name()) == reads
+            assert counter.on(UserFollow.get_collection_name()) == 0
+
+            timeline_commands = sum(counter.commands.values()) / reads
+
+            # The same page read from the followed accounts' bookmarks
+            started_at = time.perf_counter()
+            for _ in range(reads):
+                await Timeline.recent_entries(actor_ids=followed, limit=20)
+            pull_elapsed = (time.perf_counter() - started_at) / reads
+
+            logger.info(
+                f"Following {size}, timeline read {timeline_elapsed * 1000:.2f}ms in {timeline_commands:.1f} commands, "
+                f"reading from followed accounts {pull_elapsed * 1000:.2f}ms"
+            )
+    finally:
+        await init_beanie(database=api_mongo_client[api_settings.db_name], document_models=api_models)
+        client.close()
@@ -0,0 +1,59 @@
+from secrets import token_hex
+
+import pytest
+from httpx import AsyncClient
+
+from melly.libcollection.domain.trending import trending_top_k
+from melly.libcollection.models import BookmarkItemOut, TrendingOut
+from melly.libshared.constants import MAX_TRENDING_PAGE_SIZE
+
+
+async def trending(api_client: AsyncClient, window: str) -> TrendingOut:
+    params = {"window": window, "limit": MAX_TRENDING_PAGE_SIZE}
+    response = await api_client.get("/v1/bookmarks/trending", params=params)
+
+    assert response.status_code == 200
+
+    return TrendingOut(**response.json())
+
+
+@pytest.mark.asyncio
+async def test_trending(api_client: AsyncClient, login):
+    url = f"https://example.com/{token_hex(8)}"
+    tag, new_tag = token_hex(8), token_hex(8)
+
+    headers = [(await login()).get("headers") for _ in range(3)]
+    for header in headers:
+        response = await api_client.post("/v1/bookmarks", json={"url": url, "tags": [tag]}, headers=header)
+
+        assert response.status_code == 201
+
+    trending_top_k.invalidate()
+    for window in ("1h", "24h", "7d"):
+        result = await trending(api_client, window=window)
+
+        assert result.window == window
+        assert {str(x.url): x.count for x in result.urls}.get(url) == 3
+        assert {x.tag: x.count for x in result.tags}.get(tag) == 3
+
+    # Updates count the tags and pages they add
+    bookmark = BookmarkItemOut(**response.json())
+    payload = {"url": url, "tags": [tag, new_tag]}
+    response = await api_client.put(f"/v1/bookmarks/{bookmark.slug}", json=payload, headers=headers[-1])
+
+    assert response.status_code == 200
+
+    # Served from the cached top until it is refreshed
+    result = await trending(api_client, window="1h")
+
+    assert new_tag not in {x.tag for x in result.tags}
+
+    trending_top_k.invalidate()
+    result = await trending(api_client, window="1h")
+
+    assert {x.tag: x.count for x in result.tags}.get(tag) == 3
+    assert {x.tag: x.count for x in result.tags}.get(new_tag) == 1
+
+    response = await api_client.get("/v1/bookmarks/trending", params={"window": "30d"})
+
+    assert response.status_code == 422
@@ -0,0 +1,98 @@
+from secrets import token_hex
+
+import pytest
+from faker import Faker
+from httpx import AsyncClient
+
+from melly.libaccount.models import MyProfile, PublicProfile
+from melly.libcollection.models import BookmarkItemOut
+
+fake = Faker()
+
+
+@pytest.mark.asyncio
+async def test_users(api_client: AsyncClient, login):
+    headers = (await login()).get("headers")
+    response = await api_client.get("/v1/me", headers=headers)
+
+    assert response.status_code == 200
+
+    my_profile = MyProfile(**response.json())
+
+    # Update username
+    payload = {"username": token_hex(23)}
+
+    response = await api_client.put("/v1/me/username", headers=headers, json=payload)
+
+    assert response.status_code == 200
+
+    updated_profile = MyProfile(**response.json())
+
+    assert updated_profile.username == payload.get("username")
+
+    # Public profile starts out empty
+    response = await api_client.get(f"/v1/users/{updated_profile.username}")
+
+    assert response.status_code == 200
+
+    profile = PublicProfile(**response.json())
+
+    assert profile.username == updated_profile.username
+    assert profile.name == my_profile.name
+    assert profile.article_count == 0
+    assert profile.bookmark_count == 0
+    assert profile.published_collection_count == 0
+
+    # Counters follow creates and deletes
+    payload = {
+        "url": fake.url(),
+        "tags": [fake.word() for _ in range(5)],
+        "content": "\n\n".join(fake.sentences(nb=10)),
+    }
+
+    response = await api_client.post("/v1/bookmarks", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    bookmark = BookmarkItemOut(**response.json())
+
+    payload = {
+        "title": fake.street_name(),
+        "description": fake.sentence(),
+        "image": fake.image_url(),
+        "content_in_markdown": "# Hello\nWorld.",
+    }
+    response = await api_client.post("/v1/articles", json=payload, headers=headers)
+
+    assert response.status_code == 201
+
+    response = await api_client.get(f"/v1/users/{updated_profile.username}")
+    profile = PublicProfile(**response.json())
+
+    assert profile.article_count == 1
+    assert profile.bookmark_count == 1
+
+    response = await api_client.delete(f"/v1/bookmarks/{bookmark.slug}", headers=headers)
+
+    assert response.status_code == 204
+
+    response = await api_client.get(f"/v1/users/{updated_profile.username}")
+    profile = PublicProfile(**response.json())
+
+    assert profile.article_count == 1
+    assert profile.bookmark_count == 0
+
+    # Unpublished collections are not listed
+    response = await api_client.post("/v1/me/collections", json={"title": fake.street_name()}, headers=headers)
+
+    assert response.status_code == 201
+
+    response = await api_client.get(f"/v1/users/{updated_profile.username}/collections")
+
+    assert response.status_code == 200
+    assert len(response.json()) == 0
+
+    # Unknown user
+    response = await api_client.get(f"/v1/users/{token_hex(23)}")
+
+    assert response.status_code == 404